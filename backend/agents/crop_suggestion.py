@@ -1,6 +1,10 @@
-from agents.provider import Agent
+from agents.provider import Agent, split_batch_response
 import pickle
-from agents.weather_agent import get_weather_data
+import asyncio
+import logging
+from functools import lru_cache
+from agents.weather_agent import get_weather_data, get_weather_data_async
+from metrics import timed
 
 demo_soil_data = {
     "temperature": 20,
@@ -13,38 +17,76 @@ demo_soil_data = {
 }
 
 
+MODEL_PATH = './agents/model/crop_recommendation.pkl'
+
+
+# Shared by the single-land and batched prompts
+ROLE = "Role-Playing: You are an expert agricultural specialist with extensive knowledge of farming and crops. You understand precisely which crop types and soils grows in specific duration and in what season. You excel at providing detailed and relevant explanations to farmers, clearly communicating the benefits of your recommendations in an accessible manner."
+
+RESPONSE_FORMAT = """Crop: <name of the crop>
+Match: <Matching Score with soil type (this should vary between 0 to 1)>
+Description: <a brief description>
+Explanation: <explain in layman's terms to the farmer why this crop is recommended, in an easy, non-technical manner>
+Growing Season: <season of growing (this should be multiline contaning heading and sub-heading)>
+Water Requirement: <ideal require of water (this should be multiline contaning heading and sub-heading)>
+Expected Yield: <expected yeild (this should be multiline contaning heading and sub-heading)>
+Recommendations: <List of Additional Recommendations or tips while cultivating or planting, seperated by '\\n'>"""
+
+
+@lru_cache(maxsize=None)
+def load_model():
+    """Unpickle the crop model once per process (serve.py calls this before forking workers)."""
+    with open(MODEL_PATH, "rb") as file:
+        return pickle.load(file)
+
+
 class Crop_Suggestion:
     def __init__(self, GEN_API_KEY):
         self.agent = Agent(GEN_API_KEY)
 
     def execute(self, location, WEATHER_API_KEY, soil_data=demo_soil_data, crop='Tur'):
         if "temperature" not in soil_data:
-            d = get_weather_data(location, WEATHER_API_KEY)
-            soil_data["temperature"] = d["temperature"]
-            soil_data["Rainfall"] = d["rainfall"]
-            soil_data['humidity'] = d['humidity']
+            apply_weather(soil_data, get_weather_data(location, WEATHER_API_KEY))
+
+        prediction = self.predict(soil_data)
+        response = self.agent.execute(task=self.build_task(prediction, soil_data))
+        return parse_crop_response(response)
 
-        with open('./agents/model/crop_recommendation.pkl', "rb") as file:
-            model = pickle.load(file)
+    async def aexecute(self, location, WEATHER_API_KEY, soil_data=demo_soil_data, crop='Tur'):
+        """Async twin of execute: awaits weather and Gemini, runs the model in a worker thread."""
+        if "temperature" not in soil_data:
+            apply_weather(soil_data, await get_weather_data_async(location, WEATHER_API_KEY))
 
-            input_data = [[int(soil_data['Nitrogen']), int(soil_data['Phosphorus']), int(soil_data['Pottasium']), float(soil_data['temperature']), float(soil_data['humidity']), float(soil_data['pH']), float(soil_data["Rainfall"])]]
+        prediction = await asyncio.to_thread(self.predict, soil_data)
+        response = await self.agent.aexecute(task=self.build_task(prediction, soil_data))
+        return parse_crop_response(response)
+
+    def predict(self, soil_data):
+        model = load_model()
+
+        input_data = [model_features(soil_data)]
+        with timed('model', 'crop_recommendation'):
             prediction = model.predict(input_data)[0]
 
-        print(soil_data)
-        task = f"""
-Role-Playing: You are an expert agricultural specialist with extensive knowledge of farming and crops. You understand precisely which crop types and soils grows in specific duration and in what season. You excel at providing detailed and relevant explanations to farmers, clearly communicating the benefits of your recommendations in an accessible manner.
+        logging.debug(f"Crop suggestion soil data: {soil_data}")
+        return prediction
+
+    def predict_many(self, soil_datas):
+        """Predictions for several lands' soil data (weather applied) in one model call."""
+        if not soil_datas:
+            return []
+        model = load_model()
+        with timed('model', 'crop_recommendation'):
+            return list(model.predict([model_features(soil_data) for soil_data in soil_datas]))
+
+    def build_task(self, prediction, soil_data):
+        return f"""
+{ROLE}
 
 Instructions: You will be provided with raw soil data and crop information. Your task is to carefully analyze the soil data, and the given crop type and provide briefs, explanation and reasons why it is suggested. Respond *only* in the following structured format:
 
 ```
-Crop: <name of the crop>
-Match: <Matching Score with soil type (this should vary between 0 to 1)>
-Description: <a brief description>
-Explanation: <explain in layman's terms to the farmer why this crop is recommended, in an easy, non-technical manner>
-Growing Season: <season of growing (this should be multiline contaning heading and sub-heading)>
-Water Requirement: <ideal require of water (this should be multiline contaning heading and sub-heading)>
-Expected Yield: <expected yeild (this should be multiline contaning heading and sub-heading)>
-Recommendations: <List of Additional Recommendations or tips while cultivating or planting, seperated by '\\n'>
+{RESPONSE_FORMAT}
 ```
 
 Consider the following data:
@@ -54,8 +96,49 @@ Soil Data: {soil_data}
 
 Provide your response in the structured format outlined above. Do not include any introductory or concluding remarks.
 """
-        response = self.agent.execute(task=task)
-        return parse_crop_response(response)
+
+    def build_batch_task(self, items):
+        """One prompt for several lands; items are (item_id, prediction, soil_data)."""
+        data = "\n\n".join(f"Item: {item_id}\nCrop: {prediction}\nSoil Data: {soil_data}"
+                            for item_id, prediction, soil_data in items)
+        return f"""
+{ROLE}
+
+Instructions: You will be provided with raw soil data and crop information for several plots of land, each with an Item ID. For every item, carefully analyze its soil data and the given crop type and provide briefs, explanation and reasons why it is suggested. Respond *only* with one block per item, in the order given, each in the following structured format:
+
+```
+Item: <the Item ID exactly as given>
+{RESPONSE_FORMAT}
+```
+
+Consider the following data:
+
+{data}
+
+Provide one block for every item in the structured format outlined above. Do not include any introductory or concluding remarks.
+"""
+
+    def describe_many(self, items):
+        """
+        Gemini's suggestion for several lands from one prompt: {item_id: parsed dict}, items as
+        for build_batch_task. An item missing from the response maps to an "Error" dict, as an
+        unparseable single response does.
+        """
+        response = self.agent.execute(task=self.build_batch_task(items))
+        blocks = split_batch_response(response)
+        return {item_id: parse_crop_response(blocks.get(str(item_id), '')) for item_id, _, _ in items}
+
+
+def model_features(soil_data):
+    """One row of crop model input: N, P, K, temperature, humidity, pH, rainfall."""
+    return [int(soil_data['Nitrogen']), int(soil_data['Phosphorus']), int(soil_data['Pottasium']), float(soil_data['temperature']), float(soil_data['humidity']), float(soil_data['pH']), float(soil_data["Rainfall"])]
+
+
+def apply_weather(soil_data, weather):
+    """Copy the weather agent's readings into the keys the crop model expects."""
+    soil_data["temperature"] = weather["temperature"]
+    soil_data["Rainfall"] = weather["rainfall"]
+    soil_data['humidity'] = weather['humidity']
 
 
 import re
@@ -1,4 +1,5 @@
 import os, re
+import logging
 import pickle
 import pandas as pd
 from agents.provider import Agent
@@ -194,5 +195,5 @@ def parse_crop_response(response_text):
 
     fields = ["Crop", "Fertilizer", "Fertilizer_Product", "Buy at", "Amount", "Price", "Description", "Explanation"]
     data = {field: match.group(i + 1).strip() for i, field in enumerate(fields)}
-    print(data)
+    logging.debug(f"Parsed diagnosis response: {data}")
     return data
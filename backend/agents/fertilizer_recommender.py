@@ -1,12 +1,15 @@
 import os, re
 import pickle
 import pandas as pd
-from agents.provider import Agent
+from agents.provider import Agent, split_batch_response
 import aiohttp
 import json
 import asyncio
 from bs4 import BeautifulSoup
-from agents.weather_agent import get_weather_data
+from agents.weather_agent import get_weather_data, get_weather_data_async
+from metrics import timed
+import logging
+from functools import lru_cache
 
 
 async def fetch_content(session, url):
@@ -32,10 +35,34 @@ def extract_text_from_websites(urls):
     return asyncio.run(scrape_websites_parallel(urls))
 
 
+MODEL_PATH = './agents/model/fertilizer.pkl'
+
+# Shared by the single-land and batched prompts
+ROLE = "Role-Playing: You are an expert agricultural specialist with extensive knowledge of farming and fertilizers."
+
+RESPONSE_FORMAT = """Crop: <name of the crop>
+Fertilizer: <name of fertilizer recommended>
+Product: <name of the product - the fertilizer which is available for sale>
+Buy at: <site to buy at>
+Amount: <amount of fertilizer to spread and frequency>
+Price: <price of the fertilizer>
+Description: <a brief description of the fertilizer>
+Explanation: <explain in layman's terms to the farmer why this fertilizer is essential and recommended, in an easy, non-technical manner>"""
+
+
+@lru_cache(maxsize=None)
+def load_model(model_path=MODEL_PATH):
+    """Unpickle the fertilizer model once per process, or return None if it is not installed."""
+    if not os.path.exists(model_path):
+        return None
+    with open(model_path, 'rb') as model_file:
+        return pickle.load(model_file)
+
+
 class FertilizerRecommender:
     def __init__(self, GEN_API_KEY):
         self.agent = Agent(GEN_API_KEY)
-        self.model_path = './agents/model/fertilizer.pkl'
+        self.model_path = MODEL_PATH
         self.crop_mapping = {
             'Sugarcane': 1, 'Jowar': 2, 'Cotton': 3, 'Rice': 4, 'Wheat': 5,
             'Groundnut': 6, 'Maize': 7, 'Tur': 8, 'Urad': 9, 'Moong': 10,
@@ -48,24 +75,43 @@ class FertilizerRecommender:
         }
 
     def load_model_and_predict(self, soil_data, crop):
-        if not os.path.exists(self.model_path):
+        model = load_model(self.model_path)
+        if model is None:
             print(f"❌ Error: Model file not found at {self.model_path}")
             return None
 
-        with open(self.model_path, 'rb') as model_file:
-            model = pickle.load(model_file)
+        # Input Data
+        input_data = pd.DataFrame([self.model_features(soil_data, crop)])
 
+        # Prediction
+        with timed('model', 'fertilizer'):
+            prediction = model.predict(input_data)[0]
+        return prediction
+
+    def predict_many(self, soil_datas, crops):
+        """Predictions for several lands (soil data with weather, crop name) in one model call; None without the model."""
+        model = load_model(self.model_path)
+        if model is None:
+            print(f"❌ Error: Model file not found at {self.model_path}")
+            return None
+        if not soil_datas:
+            return []
+        input_data = pd.DataFrame([self.model_features(soil_data, crop) for soil_data, crop in zip(soil_datas, crops)])
+        with timed('model', 'fertilizer'):
+            return list(model.predict(input_data))
+
+    def model_features(self, soil_data, crop):
+        """One row of fertilizer model input; unknown crops and soil colours are encoded as 0."""
         # Crop Mapping
         crop_encoded = self.crop_mapping.get(crop, 0)
         soil_color_encoded = self.soil_color_mapping.get(soil_data.get('Soil Color', 'Unknown'), 0)
 
         if crop_encoded == 0:
-            print(f"⚠ Warning: Crop '{crop}' not recognized. Using default value 0.")
+            logging.warning(f"Crop '{crop}' not recognized. Using default value 0.")
         if soil_color_encoded == 0:
-            print(f"⚠ Warning: Soil color '{soil_data.get('Soil Color', 'Unknown')}' not recognized. Using default value 0.")
+            logging.warning(f"Soil color '{soil_data.get('Soil Color', 'Unknown')}' not recognized. Using default value 0.")
 
-        # Input Data
-        input_data = pd.DataFrame([{
+        return {
             'Soil_color': soil_color_encoded,
             'Nitrogen': int(soil_data['Nitrogen']),
             'Phosphorus': int(soil_data['Phosphorus']),
@@ -75,11 +121,7 @@ class FertilizerRecommender:
             'Temperature': float(soil_data['temperature']),
             'Crop': crop_encoded,
             # 'Humidity': float(soil_data.get('humidity', 60)),
-        }])
-
-        # Prediction
-        prediction = model.predict(input_data)[0]
-        return prediction
+        }
 
     def execute(self, location, WEATHER_API_KEY, soil_data, crop):
         # Update missing weather data
@@ -94,19 +136,32 @@ class FertilizerRecommender:
             print('Prediction is none')
             return
 
-        task = f"""
-Role-Playing: You are an expert agricultural specialist with extensive knowledge of farming and fertilizers.
+        response = self.agent.execute(task=self.build_task(soil_data))
+        return parse_crop_response(response)
+        # print(json.dumps(response, indent=4))
+
+    async def aexecute(self, location, WEATHER_API_KEY, soil_data, crop):
+        """Async twin of execute: awaits weather and Gemini, runs the model in a worker thread."""
+        if "temperature" not in soil_data:
+            weather_data = await get_weather_data_async(location, WEATHER_API_KEY)
+            soil_data.update(weather_data)
+
+        prediction = await asyncio.to_thread(self.load_model_and_predict, soil_data, crop)
+
+        if prediction is None:
+            print('Prediction is none')
+            return
+
+        response = await self.agent.aexecute(task=self.build_task(soil_data))
+        return parse_crop_response(response)
+
+    def build_task(self, soil_data):
+        return f"""
+{ROLE}
 
 Instructions: Provide recommendations in the following format:
 ```
-Crop: <name of the crop>
-Fertilizer: <name of fertilizer recommended>
-Product: <name of the product - the fertilizer which is available for sale>
-Buy at: <site to buy at>
-Amount: <amount of fertilizer to spread and frequency>
-Price: <price of the fertilizer>
-Description: <a brief description of the fertilizer>
-Explanation: <explain in layman's terms to the farmer why this fertilizer is essential and recommended, in an easy, non-technical manner>
+{RESPONSE_FORMAT}
 ```
 
 Consider the following data:
@@ -114,9 +169,33 @@ Soil Data: {soil_data}
 
 Only Respond in the provided format, Do not leave any other note.
 """
-        response = self.agent.execute(task=task)
-        return parse_crop_response(response)
-        # print(json.dumps(response, indent=4))
+
+    def build_batch_task(self, items):
+        """One prompt for several lands; items are (item_id, soil_data)."""
+        data = "\n\n".join(f"Item: {item_id}\nSoil Data: {soil_data}" for item_id, soil_data in items)
+        return f"""
+{ROLE}
+
+Instructions: You will be given the soil data of several plots of land, each with an Item ID. Provide recommendations for every item, one block per item in the order given, each in the following format:
+```
+Item: <the Item ID exactly as given>
+{RESPONSE_FORMAT}
+```
+
+Consider the following data:
+{data}
+
+Only Respond in the provided format, with one block for every item, Do not leave any other note.
+"""
+
+    def describe_many(self, items):
+        """
+        Gemini's recommendation for several lands from one prompt: {item_id: parsed dict}, items
+        as for build_batch_task. An item missing from the response maps to an "Error" dict.
+        """
+        response = self.agent.execute(task=self.build_batch_task(items))
+        blocks = split_batch_response(response)
+        return {item_id: parse_crop_response(blocks.get(str(item_id), '')) for item_id, _ in items}
 
 
 def parse_crop_response(response_text):
@@ -147,5 +226,5 @@ def parse_crop_response(response_text):
 
     fields = ["Crop", "Fertilizer", "Fertilizer_Product", "Buy at", "Amount", "Price", "Description", "Explanation"]
     data = {field: match.group(i + 1).strip() for i, field in enumerate(fields)}
-    print(data)
+    logging.debug(f"Parsed fertilizer response: {data}")
     return data
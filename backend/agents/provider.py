@@ -1,16 +1,75 @@
 from google import genai
 import os
+import re
+import threading
+import metrics
+from metrics import timed
+
+GEMINI_CLIENTS = metrics.REGISTRY.register(metrics.Counter(
+    'kisansarthi_gemini_clients_total',
+    'genai.Client instances created; each brings its own connection pool and TLS handshakes.'))
+
+# (agent class, API key) -> agent, for the process in _shared_pid
+_shared = {}
+_shared_pid = None
+_shared_lock = threading.Lock()
 
 class Agent:
     def __init__(self, GEN_API_KEY):
         self.client = genai.Client(api_key=GEN_API_KEY)
+        GEMINI_CLIENTS.inc()
 
     def execute(self, task, data=None):
         if not data:
-            response = self.client.models.generate_content(
-                model="gemini-2.0-flash", contents=task
-            )
+            with timed('llm', 'gemini-2.0-flash'):
+                response = self.client.models.generate_content(
+                    model="gemini-2.0-flash", contents=task
+                )
             # print(response.text)
             return response.text
         else:
-            pass
\ No newline at end of file
+            pass
+
+    async def aexecute(self, task, data=None):
+        """Same as execute, but awaits the Gemini call instead of blocking a thread on it."""
+        if not data:
+            with timed('llm', 'gemini-2.0-flash'):
+                response = await self.client.aio.models.generate_content(
+                    model="gemini-2.0-flash", contents=task
+                )
+            return response.text
+        else:
+            pass
+
+
+def shared(agent_class, GEN_API_KEY):
+    """
+    The process's instance of agent_class (Crop_Suggestion, FertilizerRecommender, ...), so its
+    genai.Client and the connections it keeps alive serve every request instead of one. The
+    agents keep no per-request state. Created after fork, as sockets must not be shared across processes.
+    """
+    global _shared_pid
+    with _shared_lock:
+        if _shared_pid != os.getpid():
+            _shared.clear()
+            _shared_pid = os.getpid()
+        agent = _shared.get((agent_class, GEN_API_KEY))
+        if agent is None:
+            agent = _shared[(agent_class, GEN_API_KEY)] = agent_class(GEN_API_KEY)
+        return agent
+
+
+ITEM_HEADER = re.compile(r'^[\s*#`]*Item(?:\s+ID)?\s*:\s*\**\s*(\S+?)\**\s*$', re.MULTILINE | re.IGNORECASE)
+
+
+def split_batch_response(response_text):
+    """
+    Split a batched response into {item_id: block text}, where each block starts at its
+    "Item: <id>" line. Text before the first item is ignored; a repeated ID keeps the first block.
+    """
+    headers = list(ITEM_HEADER.finditer(response_text or ''))
+    blocks = {}
+    for header, following in zip(headers, headers[1:] + [None]):
+        end = following.start() if following else len(response_text)
+        blocks.setdefault(header.group(1), response_text[header.end():end].strip().strip('`').strip())
+    return blocks
@@ -1,9 +1,71 @@
 import requests, os
+import threading
+import aiohttp
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+import metrics
+from metrics import timed
 
+BASE_URL = "https://api.openweathermap.org/data/2.5/weather"
+
+# --- Configuration ---
+# Keep-alive connections kept per host by each worker's weather session
+WEATHER_POOL_SIZE = int(os.environ.get('WEATHER_POOL_SIZE', '10'))
+WEATHER_TIMEOUT_SECONDS = float(os.environ.get('WEATHER_TIMEOUT_SECONDS', '10'))
+
+# Requests minus connections opened is how many requests reused a kept-alive connection
+OUTGOING_REQUESTS = metrics.REGISTRY.register(metrics.Counter(
+    'kisansarthi_outgoing_requests_total', 'Outgoing HTTP requests, by client.', ('client',)))
+OUTGOING_CONNECTIONS = metrics.REGISTRY.register(metrics.Counter(
+    'kisansarthi_outgoing_connections_total', 'Outgoing HTTP connections opened, by client.', ('client',)))
+
+# One keep-alive session per process for each path: requests for get_weather_data,
+# aiohttp for get_weather_data_async
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+_async_session = None
+
+
+def _counting_pool(pool_class):
+    """pool_class whose connections count each connect(), i.e. every connection opened or reopened."""
+    class CountingConnection(pool_class.ConnectionCls):
+        def connect(self):
+            OUTGOING_CONNECTIONS.inc(client='openweathermap')
+            return super().connect()
+
+    return type('Counting' + pool_class.__name__, (pool_class,), {'ConnectionCls': CountingConnection})
+
+
+class _CountingAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _counting_pool(HTTPConnectionPool),
+            'https': _counting_pool(HTTPSConnectionPool),
+        }
+
+
+def _count_request(response, *args, **kwargs):
+    OUTGOING_REQUESTS.inc(client='openweathermap')
+
+
+def weather_session():
+    """The worker's requests.Session; created after fork, as sockets must not be shared across processes."""
+    global _session, _session_pid
+    with _session_lock:
+        if _session is None or _session_pid != os.getpid():
+            session = requests.Session()
+            adapter = _CountingAdapter(pool_connections=1, pool_maxsize=WEATHER_POOL_SIZE)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            session.hooks['response'].append(_count_request)
+            _session, _session_pid = session, os.getpid()
+        return _session
 
 
 def get_weather_data(city_name, WEATHER_API_KEY):
-    base_url = "https://api.openweathermap.org/data/2.5/weather"
+    base_url = BASE_URL
     params = {
         'q': city_name,
         'appid': WEATHER_API_KEY,
@@ -11,25 +73,72 @@ def get_weather_data(city_name, WEATHER_API_KEY):
     }
     
     try:
-        response = requests.get(base_url, params=params)
-        response.raise_for_status()
+        with timed('weather', 'openweathermap'):
+            response = weather_session().get(base_url, params=params, timeout=WEATHER_TIMEOUT_SECONDS)
+            response.raise_for_status()
         data = response.json()
-
-        # Extract humidity
-        humidity = data.get('main', {}).get('humidity', 'N/A')
-        temperature = data['main']['temp']
-
-        # Extract rainfall (if available)
-        rainfall = data.get('rain', {}).get('1h', 0)  # Rainfall in last 1 hour (mm)
-        
-        return{
-            "humidity": humidity,
-            "rainfall": rainfall,
-            "temperature" : temperature
-        }
+        return _parse_weather(data)
     except requests.exceptions.RequestException as e:
         print(f"Error fetching weather data: {e}")
 
+
+def _parse_weather(data):
+    # Extract humidity
+    humidity = data.get('main', {}).get('humidity', 'N/A')
+    temperature = data['main']['temp']
+
+    # Extract rainfall (if available)
+    rainfall = data.get('rain', {}).get('1h', 0)  # Rainfall in last 1 hour (mm)
+
+    return{
+        "humidity": humidity,
+        "rainfall": rainfall,
+        "temperature" : temperature
+    }
+
+
+def _async_trace_config():
+    async def on_request(session, context, params):
+        OUTGOING_REQUESTS.inc(client='openweathermap')
+
+    async def on_connection(session, context, params):
+        OUTGOING_CONNECTIONS.inc(client='openweathermap')
+
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_start.append(on_request)
+    trace_config.on_connection_create_end.append(on_connection)
+    return trace_config
+
+
+async def get_weather_data_async(city_name, WEATHER_API_KEY):
+    """Async twin of get_weather_data for the ASGI server; shares one keep-alive session."""
+    global _async_session
+    if _async_session is None or _async_session.closed:
+        _async_session = aiohttp.ClientSession(
+            timeout=aiohttp.ClientTimeout(total=WEATHER_TIMEOUT_SECONDS),
+            connector=aiohttp.TCPConnector(limit_per_host=WEATHER_POOL_SIZE),
+            trace_configs=[_async_trace_config()])
+    params = {
+        'q': city_name,
+        'appid': WEATHER_API_KEY,
+        'units': 'metric'
+    }
+    try:
+        with timed('weather', 'openweathermap'):
+            async with _async_session.get(BASE_URL, params=params) as response:
+                response.raise_for_status()
+                data = await response.json()
+        return _parse_weather(data)
+    except aiohttp.ClientError as e:
+        print(f"Error fetching weather data: {e}")
+
+
+async def close_async_session():
+    global _async_session
+    if _async_session is not None and not _async_session.closed:
+        await _async_session.close()
+    _async_session = None
+
 # if __name__ == "__main__":
 #     api_key = input("Enter your API Key: ")
 #     city_name = input("Enter city name: ")
@@ -0,0 +1,237 @@
+"""
+Rule-based alert engine.
+
+Ingested readings are queued and evaluated in batches by a background flusher (one per
+worker): the batch's lands and crops are loaded in one query, each reading is run through
+threshold rules compiled for its land's crop, alerts a land already received within
+ALERT_COOLDOWN_SECONDS are dropped, and the rest are bulk-inserted into recommendations.
+
+Rules cover pH outside the crop's optimal range, low moisture and N/P/K deficits. Crop
+thresholds come from the crops table; lands without a crop (or crops without values) use
+the defaults below.
+"""
+import os
+import re
+import time
+import atexit
+import sqlite3
+import logging
+import operator
+import threading
+from functools import lru_cache
+
+from serialization import dict_factory
+
+# --- Configuration ---
+ALERT_BATCH_SIZE = int(os.environ.get('ALERT_BATCH_SIZE', '500'))
+ALERT_BATCH_SECONDS = float(os.environ.get('ALERT_BATCH_SECONDS', '2'))
+ALERT_COOLDOWN_SECONDS = int(os.environ.get('ALERT_COOLDOWN_SECONDS', str(24 * 3600)))
+
+# Thresholds used when the land's crop does not define its own
+DEFAULT_PH_RANGE = (5.5, 7.5)
+DEFAULT_MIN_MOISTURE = float(os.environ.get('ALERT_MIN_MOISTURE', '25'))
+DEFAULT_MIN_NITROGEN = float(os.environ.get('ALERT_MIN_NITROGEN', '40'))
+DEFAULT_MIN_PHOSPHORUS = float(os.environ.get('ALERT_MIN_PHOSPHORUS', '15'))
+DEFAULT_MIN_POTASSIUM = float(os.environ.get('ALERT_MIN_POTASSIUM', '100'))
+
+SEVERITY_ORDER = {'low': 0, 'medium': 1, 'high': 2}
+
+logger = logging.getLogger('kisansarthi.alerts')
+
+
+class Rule:
+    """One compiled threshold: fires when op(value, threshold); 'high' severity past severe_threshold."""
+    __slots__ = ('key', 'column', 'op', 'threshold', 'severe_threshold', 'title', 'detail')
+
+    def __init__(self, key, column, op, threshold, severe_threshold, title, detail):
+        self.key = key
+        self.column = column
+        self.op = op
+        self.threshold = threshold
+        self.severe_threshold = severe_threshold
+        self.title = title
+        self.detail = detail
+
+    def check(self, reading):
+        """Severity if the rule fires for this reading, else None."""
+        value = reading.get(self.column)
+        if value is None or not self.op(value, self.threshold):
+            return None
+        return 'high' if self.op(value, self.severe_threshold) else 'medium'
+
+
+def parse_range(text):
+    """'40-80' -> (40.0, 80.0); a single number is a minimum; anything else -> (None, None)."""
+    numbers = [float(n) for n in re.findall(r'\d+(?:\.\d+)?', text or '')]
+    if len(numbers) >= 2:
+        return min(numbers[:2]), max(numbers[:2])
+    if len(numbers) == 1:
+        return numbers[0], None
+    return None, None
+
+
+@lru_cache(maxsize=256)
+def compile_rules(crop_name, ph_min, ph_max, nitrogen_range, phosphorus_range, potassium_range, moisture_range):
+    """
+    Rules for one crop. Cached on the crop's threshold values, so an edited crop row simply
+    compiles a new rule set.
+    """
+    crop = crop_name or "this land"
+    low_ph, high_ph = ph_min, ph_max
+    # Reversed or missing pairs in the crops table fall back to the defaults
+    if low_ph is None or high_ph is None or low_ph >= high_ph:
+        low_ph, high_ph = DEFAULT_PH_RANGE
+    rules = [
+        Rule('ph_low', 'ph_value', operator.lt, low_ph, low_ph - 1.0, "Soil too acidic",
+             f"Soil pH {{value:.1f}} is below the {low_ph:g}-{high_ph:g} range suited to {crop}. Consider liming."),
+        Rule('ph_high', 'ph_value', operator.gt, high_ph, high_ph + 1.0, "Soil too alkaline",
+             f"Soil pH {{value:.1f}} is above the {low_ph:g}-{high_ph:g} range suited to {crop}. Consider gypsum or sulphur."),
+    ]
+    minimums = (
+        ('moisture_low', 'moisture_value', moisture_range, DEFAULT_MIN_MOISTURE, "Low soil moisture",
+         "Soil moisture {value:.0f}% is below the {threshold:g}% " + crop + " needs. Irrigate soon."),
+        ('nitrogen_low', 'nitrogen_value', nitrogen_range, DEFAULT_MIN_NITROGEN, "Nitrogen deficit",
+         "Nitrogen {value:g} is below the {threshold:g} " + crop + " needs."),
+        ('phosphorus_low', 'phosphorus_value', phosphorus_range, DEFAULT_MIN_PHOSPHORUS, "Phosphorus deficit",
+         "Phosphorus {value:g} is below the {threshold:g} " + crop + " needs."),
+        ('potassium_low', 'potassium_value', potassium_range, DEFAULT_MIN_POTASSIUM, "Potassium deficit",
+         "Potassium {value:g} is below the {threshold:g} " + crop + " needs."),
+    )
+    for key, column, range_text, default_min, title, detail in minimums:
+        minimum = parse_range(range_text)[0]
+        if minimum is None:
+            minimum = default_min
+        rules.append(Rule(key, column, operator.lt, minimum, minimum / 2, title, detail))
+    return tuple(rules)
+
+
+def rules_for(context):
+    """Compiled rules for a row carrying a crop's crop_name and optimal_* columns (all may be None)."""
+    return compile_rules(context.get('crop_name'), context.get('optimal_ph_min'), context.get('optimal_ph_max'),
+                         context.get('optimal_nitrogen_range'), context.get('optimal_phosphorus_range'),
+                         context.get('optimal_potassium_range'), context.get('optimal_moisture_range'))
+
+
+def evaluate(reading, rules):
+    """[(rule, severity), ...] for every rule the reading trips."""
+    fired = []
+    for rule in rules:
+        severity = rule.check(reading)
+        if severity:
+            fired.append((rule, severity))
+    return fired
+
+
+def highest_severity(fired, default='low'):
+    return max((severity for _, severity in fired), key=SEVERITY_ORDER.get, default=default)
+
+
+LAND_CONTEXT_SQL = """
+    SELECT l.id AS land_id, f.user_id, c.crop_name, c.optimal_ph_min, c.optimal_ph_max,
+           c.optimal_nitrogen_range, c.optimal_phosphorus_range, c.optimal_potassium_range,
+           c.optimal_moisture_range,
+           (SELECT MAX(sr.timestamp) FROM soil_readings sr
+            WHERE sr.land_id = l.id AND sr.quality_flag IS NULL) AS latest_timestamp
+    FROM lands l
+    JOIN farms f ON l.farm_id = f.id
+    LEFT JOIN plantings p ON p.id = l.current_planting_id
+    LEFT JOIN crops c ON c.id = p.crop_id
+    WHERE l.id IN ({placeholders})
+"""
+
+
+def alerts_for_batch(conn, readings):
+    """
+    Evaluate a batch of stored readings (dicts with land_id, timestamp and value columns) and
+    return recommendation rows to insert. Only a land's newest firing of each rule is kept, and
+    rules the land was alerted on within the cooldown are dropped. Readings can arrive out of
+    order (device retries, gateway batches, lab reports), so a reading older than the land's latest
+    clean reading no longer describes the land and is skipped.
+    """
+    land_ids = sorted({reading['land_id'] for reading in readings})
+    placeholders = ','.join('?' * len(land_ids))
+    contexts = {row['land_id']: row for row in conn.execute(LAND_CONTEXT_SQL.format(placeholders=placeholders), land_ids)}
+    recent = {(row['land_id'], row['alert_key']) for row in conn.execute(f"""
+        SELECT DISTINCT land_id, alert_key FROM recommendations
+        WHERE land_id IN ({placeholders}) AND alert_key IS NOT NULL AND created_at >= datetime('now', ?)
+    """, (*land_ids, f'-{ALERT_COOLDOWN_SECONDS} seconds'))}
+
+    pending = {}
+    for reading in sorted(readings, key=lambda reading: reading.get('timestamp') or ''):
+        context = contexts.get(reading['land_id'])
+        if context is None:
+            continue
+        if context['latest_timestamp'] and (reading.get('timestamp') or '') < context['latest_timestamp']:
+            continue
+        for rule, severity in evaluate(reading, rules_for(context)):
+            if (reading['land_id'], rule.key) in recent:
+                continue
+            detail = rule.detail.format(value=reading[rule.column], threshold=rule.threshold)
+            pending[(reading['land_id'], rule.key)] = (
+                context['user_id'], reading['land_id'], 'alert', rule.title, detail,
+                f"Based on the soil reading at {reading.get('timestamp')}.", rule.key, severity)
+    return list(pending.values())
+
+
+INSERT_ALERTS_SQL = """
+    INSERT INTO recommendations (user_id, land_id, recommendation_type, title, details, reasoning, alert_key, severity)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+class AlertEngine:
+    """Collects readings from the ingest path and evaluates them in batches on a background thread."""
+
+    def __init__(self):
+        self._pending = []
+        self._cond = threading.Condition()
+        self._thread = None
+        self._pid = None
+        self.db_file = None
+
+    def submit(self, db_file, reading):
+        with self._cond:
+            self.db_file = db_file
+            self._pending.append(reading)
+            # Threads do not survive a fork, so each worker starts its own flusher on first use
+            if self._thread is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='alert-engine', daemon=True)
+                self._thread.start()
+            if len(self._pending) >= ALERT_BATCH_SIZE:
+                self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: len(self._pending) >= ALERT_BATCH_SIZE, timeout=ALERT_BATCH_SECONDS)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Alert batch failed")
+
+    def flush(self):
+        """Evaluate everything queued so far. Returns the number of alerts written."""
+        with self._cond:
+            batch, self._pending = self._pending, []
+            db_file = self.db_file
+        if not batch:
+            return 0
+        start = time.perf_counter()
+        conn = sqlite3.connect(db_file, timeout=30)
+        conn.row_factory = dict_factory
+        try:
+            rows = alerts_for_batch(conn, batch)
+            if rows:
+                with conn:
+                    conn.executemany(INSERT_ALERTS_SQL, rows)
+        finally:
+            conn.close()
+        logger.debug("Evaluated %d readings, wrote %d alerts in %.1f ms",
+                     len(batch), len(rows), (time.perf_counter() - start) * 1000)
+        return len(rows)
+
+
+engine = AlertEngine()
+# Evaluate whatever is still queued when the worker exits
+atexit.register(lambda: engine.flush())
@@ -0,0 +1,234 @@
+"""
+Streaming sensor anomaly and drift detection.
+
+Every ingested reading is checked per device and parameter against O(1) state:
+  - range:   the value is physically impossible for the sensor (e.g. pH 15)
+  - outlier: more than OUTLIER_SIGMAS standard deviations from the device's running mean
+  - drift:   the short-term EWMA has wandered DRIFT_SIGMAS deviations from the long-run mean
+
+Running mean/variance use Welford's algorithm. Range and outlier values are not folded into
+the state, so one bad value cannot shift the baseline; drifting values are, so a sensor that
+settles at a new level stops being flagged once that level is the norm.
+
+State lives in memory per worker and is checkpointed to sensor_detector_state every
+ANOMALY_CHECKPOINT_SECONDS; a restarted worker resumes from the last checkpoint.
+
+Resetting a device's baseline (it moved to another land) bumps hardware_devices.detector_generation.
+Each worker remembers the generation it loaded a device's state at: its checkpoint only writes
+rows while that is still the current generation, and then drops the state of every device whose
+generation moved on, so the device is reloaded (from scratch) on its next reading everywhere.
+"""
+import os
+import math
+import time
+import threading
+
+# --- Configuration ---
+WARMUP_READINGS = int(os.environ.get('ANOMALY_WARMUP_READINGS', '20'))
+OUTLIER_SIGMAS = float(os.environ.get('ANOMALY_OUTLIER_SIGMAS', '4.0'))
+DRIFT_SIGMAS = float(os.environ.get('ANOMALY_DRIFT_SIGMAS', '1.5'))
+EWMA_ALPHA = float(os.environ.get('ANOMALY_EWMA_ALPHA', '0.1'))
+CHECKPOINT_SECONDS = float(os.environ.get('ANOMALY_CHECKPOINT_SECONDS', '60'))
+# Minimum gap between two alerts for the same device, parameter and kind of anomaly
+ALERT_COOLDOWN_SECONDS = float(os.environ.get('ANOMALY_ALERT_COOLDOWN_SECONDS', str(6 * 3600)))
+
+# column -> (label, lowest valid value, highest valid value, smallest standard deviation used).
+# The deviation floor keeps a sensor that has reported a constant value from flagging noise.
+PARAMETERS = {
+    'ph_value': ('pH', 0.0, 14.0, 0.05),
+    'nitrogen_value': ('Nitrogen', 0.0, 2000.0, 1.0),
+    'phosphorus_value': ('Phosphorus', 0.0, 2000.0, 1.0),
+    'potassium_value': ('Potassium', 0.0, 2000.0, 1.0),
+    'moisture_value': ('Moisture', 0.0, 100.0, 0.5),
+    'temperature_value': ('Temperature', -20.0, 70.0, 0.2),
+    'humidity_value': ('Humidity', 0.0, 100.0, 0.5),
+}
+
+# A reading carries its most severe flag
+SEVERITY = {'range': 3, 'outlier': 2, 'drift': 1}
+
+
+class ParameterState:
+    """Welford running mean/variance plus an EWMA for one device parameter."""
+    __slots__ = ('count', 'mean', 'm2', 'ewma')
+
+    def __init__(self, count=0, mean=0.0, m2=0.0, ewma=None):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+        self.ewma = ewma
+
+    def std(self, floor):
+        if self.count < 2:
+            return floor
+        return max(math.sqrt(self.m2 / (self.count - 1)), floor)
+
+    def update(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        self.ewma = value if self.ewma is None else EWMA_ALPHA * value + (1 - EWMA_ALPHA) * self.ewma
+
+
+class AnomalyDetector:
+    def __init__(self):
+        self._states = {}  # (device_id, column) -> ParameterState
+        self._dirty = set()
+        self._loaded_devices = set()
+        self._generations = {}  # device_id -> detector_generation its state belongs to
+        self._last_alert = {}  # (device_id, column, kind) -> monotonic time
+        self._lock = threading.Lock()
+        self._last_checkpoint = time.monotonic()
+
+    def observe(self, conn, device_id, values):
+        """
+        Check one reading's values ({column: value}) and fold them into the device's state.
+        `conn` is a dict_factory connection, used to load the device's checkpoint on first sight.
+        Returns a list of (column, kind, detail) flags, empty for a clean reading.
+        """
+        flags = []
+        with self._lock:
+            if device_id not in self._loaded_devices:
+                self._load_device(conn, device_id)
+            for column, value in values.items():
+                spec = PARAMETERS.get(column)
+                if spec is None or value is None:
+                    continue
+                label, low, high, std_floor = spec
+                try:
+                    value = float(value)
+                except (TypeError, ValueError):
+                    flags.append((column, 'range', f"{label} value {value!r} is not a number"))
+                    continue
+                if math.isnan(value) or not low <= value <= high:
+                    flags.append((column, 'range', f"{label} reading {value:g} is outside the sensor range {low:g}-{high:g}"))
+                    continue
+
+                key = (device_id, column)
+                state = self._states.get(key)
+                if state is None:
+                    state = self._states[key] = ParameterState()
+                if state.count >= WARMUP_READINGS:
+                    std = state.std(std_floor)
+                    if abs(value - state.mean) > OUTLIER_SIGMAS * std:
+                        flags.append((column, 'outlier', f"{label} reading {value:g} is far from this sensor's usual {state.mean:.2f} (±{std:.2f})"))
+                        continue
+                    state.update(value)
+                    self._dirty.add(key)
+                    if abs(state.ewma - state.mean) > DRIFT_SIGMAS * std:
+                        flags.append((column, 'drift', f"{label} sensor is drifting: recent average {state.ewma:.2f} vs usual {state.mean:.2f}"))
+                else:
+                    state.update(value)
+                    self._dirty.add(key)
+        return flags
+
+    def _load_device(self, conn, device_id):
+        device = conn.execute("SELECT detector_generation FROM hardware_devices WHERE id = ?", (device_id,)).fetchone()
+        rows = conn.execute(
+            "SELECT parameter, count, mean, m2, ewma FROM sensor_detector_state WHERE device_id = ?",
+            (device_id,)).fetchall()
+        for row in rows:
+            self._states.setdefault((device_id, row['parameter']),
+                                    ParameterState(row['count'], row['mean'], row['m2'], row['ewma']))
+        self._generations[device_id] = device['detector_generation'] if device else 0
+        self._loaded_devices.add(device_id)
+
+    def _drop_device(self, device_id):
+        for key in [key for key in self._states if key[0] == device_id]:
+            del self._states[key]
+            self._dirty.discard(key)
+        self._loaded_devices.discard(device_id)
+        self._generations.pop(device_id, None)
+
+    def forget_device(self, conn, device_id):
+        """Drop a device's baseline (memory and checkpoint) in every worker, e.g. after it moves to another land."""
+        with conn:
+            conn.execute("UPDATE hardware_devices SET detector_generation = detector_generation + 1 WHERE id = ?", (device_id,))
+            conn.execute("DELETE FROM sensor_detector_state WHERE device_id = ?", (device_id,))
+            device = conn.execute("SELECT detector_generation FROM hardware_devices WHERE id = ?", (device_id,)).fetchone()
+        with self._lock:
+            self._drop_device(device_id)
+            # Nothing left to load: start the new baseline at the new generation
+            self._generations[device_id] = device['detector_generation'] if device else 0
+            self._loaded_devices.add(device_id)
+
+    def alert_due(self, device_id, column, kind):
+        """True (and starts the cooldown) if this anomaly has not been alerted on recently."""
+        key = (device_id, column, kind)
+        now = time.monotonic()
+        with self._lock:
+            last = self._last_alert.get(key)
+            if last is not None and now - last < ALERT_COOLDOWN_SECONDS:
+                return False
+            self._last_alert[key] = now
+            return True
+
+    def checkpoint_due(self):
+        return time.monotonic() - self._last_checkpoint >= CHECKPOINT_SECONDS
+
+    def checkpoint(self, conn):
+        """
+        Upsert the state of every parameter updated since the last checkpoint, unless its device
+        was reset meanwhile, then drop the state of every device reset by another worker.
+        """
+        with self._lock:
+            rows = []
+            for device_id, column in self._dirty:
+                state = self._states[(device_id, column)]
+                rows.append((device_id, column, state.count, state.mean, state.m2, state.ewma,
+                             device_id, self._generations.get(device_id, 0)))
+            self._dirty.clear()
+            self._last_checkpoint = time.monotonic()
+            generations = dict(self._generations)
+        if rows:
+            with conn:
+                conn.executemany(CHECKPOINT_SQL, rows)
+
+        current = {}
+        device_ids = list(generations)
+        for i in range(0, len(device_ids), 500):
+            chunk = device_ids[i:i + 500]
+            current.update((row['id'], row['detector_generation']) for row in conn.execute(
+                f"SELECT id, detector_generation FROM hardware_devices WHERE id IN ({', '.join('?' * len(chunk))})", chunk))
+        with self._lock:
+            for device_id, generation in generations.items():
+                # Deleted devices (no row) are dropped as well
+                if current.get(device_id) != generation and self._generations.get(device_id) == generation:
+                    self._drop_device(device_id)
+        return len(rows)
+
+
+# Written only while the device is still at the generation the state was loaded at (last two
+# parameters), in the same statement so a concurrent reset cannot be overwritten
+CHECKPOINT_SQL = """
+    INSERT INTO sensor_detector_state (device_id, parameter, count, mean, m2, ewma, updated_at)
+    SELECT ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP
+    WHERE (SELECT detector_generation FROM hardware_devices WHERE id = ?) = ?
+    ON CONFLICT (device_id, parameter) DO UPDATE SET
+        count = excluded.count, mean = excluded.mean, m2 = excluded.m2,
+        ewma = excluded.ewma, updated_at = excluded.updated_at
+"""
+
+
+INSERT_SENSOR_ALERTS_SQL = """
+    INSERT INTO recommendations (user_id, land_id, recommendation_type, title, details, reasoning)
+    VALUES (?, ?, ?, ?, ?, ?)
+"""
+
+
+def sensor_alert_rows(user_id, land_id, due):
+    """INSERT_SENSOR_ALERTS_SQL rows telling the land's owner about (column, kind, detail) flags."""
+    return [(user_id, land_id, 'alert', f"Sensor check: {PARAMETERS[column][0]} {kind}", detail,
+             "This reading was set aside and is not used for crop or fertilizer advice. Check the sensor's placement and calibration.")
+            for column, kind, detail in due]
+
+
+def reading_flag(flags):
+    """The single quality_flag stored on a reading: its most severe kind, or None."""
+    if not flags:
+        return None
+    return max((kind for _, kind, _ in flags), key=SEVERITY.get)
+
+
+detector = AnomalyDetector()
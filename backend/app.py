@@ -1,16 +1,39 @@
 import sqlite3
 import os
 import json
-from flask import Flask, request, jsonify, g, abort
-from werkzeug.security import generate_password_hash, check_password_hash # Used for password hashing
+import time
+import queue
+from flask import Flask, request, jsonify, g, abort, has_request_context, has_app_context, Response, make_response
 from functools import wraps
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import ThreadPoolExecutor
+import hmac
 import datetime
 import logging
 import random # For dummy data generation    
 from agents.crop_suggestion import Crop_Suggestion
 
 from agents.fertilizer_recommender import FertilizerRecommender
+from agents import provider
 from dotenv import load_dotenv
+import metrics
+import profiler
+import encoding
+import serialization
+import exports
+import archive
+import anomaly
+import alerts
+import device_health
+import device_auth
+import security
+import notifications
+import live
+import ingest
+import idempotency
+import singleflight
+import precompute
+from serialization import dict_factory
 
 
 # Load environment variables
@@ -19,26 +42,30 @@ GEN_API_KEY = os.getenv('GEN_API_KEY')
 WEATHER_API_KEY = os.getenv('WEATHER_API_KEY')
 
 # --- Configuration ---
-DATABASE = "farm_app.db"
-SECRET_KEY = os.environ.get('SECRET_KEY', 'a-very-secret-key-for-dev') # Use env var in production
+DATABASE = os.environ.get("DATABASE", "farm_app.db")
+SECRET_KEY = os.environ.get('SECRET_KEY')
+if not SECRET_KEY:
+    # Access and refresh tokens signed with a published key can be forged for any user, so only the
+    # development server (python app.py, or FLASK_DEBUG=1) may fall back to one
+    if __name__ != '__main__' and os.environ.get('FLASK_DEBUG') != '1':
+        raise RuntimeError("SECRET_KEY is not set. Set it to a long random value, the same for every worker "
+                           "(FLASK_DEBUG=1 allows the development key locally).")
+    SECRET_KEY = 'a-very-secret-key-for-dev'
+    logging.getLogger('kisansarthi.app').warning("SECRET_KEY is not set; signing tokens with the public development key")
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN') # Enables /api/v1/admin/* and X-Profile capture when set
 
 # --- Flask App Setup ---
 app = Flask(__name__)
+app.json = serialization.FastJSONProvider(app) # orjson-backed jsonify, same output format
 app.config['DATABASE'] = DATABASE
 app.config['SECRET_KEY'] = SECRET_KEY
+tokens = security.TokenSigner(SECRET_KEY) # Signs access/refresh tokens
 # Optional: Enable CORS if your frontend is on a different domain
 # from flask_cors import CORS
 # CORS(app)
 
 # --- Database Helper Functions ---
 
-def dict_factory(cursor, row):
-    """Convert database row objects to dictionaries keyed by column names."""
-    d = {}
-    for idx, col in enumerate(cursor.description):
-        d[col[0]] = row[idx]
-    return d
-
 def get_db():
     """Opens a new database connection if there is none yet for the current application context."""
     if 'db' not in g:
@@ -50,9 +77,9 @@ def get_db():
             g.db.row_factory = dict_factory
             # Enable foreign key constraint enforcement for this connection
             g.db.execute("PRAGMA foreign_keys = ON;")
-            print("DB connection opened.")
+            app.logger.debug("DB connection opened.")
         except sqlite3.Error as e:
-            print(f"Error connecting to database: {e}")
+            app.logger.error(f"Error connecting to database: {e}")
             abort(500, description="Database connection error.")
     return g.db
 
@@ -62,27 +89,48 @@ def close_db(exception=None):
     db = g.pop('db', None)
     if db is not None:
         db.close()
-        print("DB connection closed.")
-
-def query_db(query, args=(), one=False):
-    """Helper function to execute queries."""
+        app.logger.debug("DB connection closed.")
+
+def _metrics_route():
+    """Route label for DB metrics: the Flask endpoint when serving a request, else 'background'."""
+    if has_request_context():
+        return request.endpoint or 'unmatched'
+    # asgi.py runs DB work inside a bare app context and tags it with the async route's name
+    if has_app_context():
+        return g.get('metrics_route', 'background')
+    return 'background'
+
+def query_rows(query, args=()):
+    """Run a query and return (column names, list of row tuples) without building per-row dicts."""
     try:
-        cur = get_db().execute(query, args)
-        rv = cur.fetchall()
+        start = time.perf_counter()
+        cur = get_db().cursor()
+        cur.row_factory = None # Plain tuples; names are read once from the cursor below
+        rows = cur.execute(query, args).fetchall()
+        names = serialization.column_names(cur)
         cur.close()
-        return (rv[0] if rv else None) if one else rv
+        metrics.observe_query(_metrics_route(), 'query', query, args, time.perf_counter() - start)
+        return names, rows
     except sqlite3.Error as e:
         print(f"Database query error: {e}\nQuery: {query}\nArgs: {args}")
         abort(500, description=f"Database error: {e}")
 
+def query_db(query, args=(), one=False):
+    """Helper function to execute queries."""
+    names, rows = query_rows(query, args)
+    rv = serialization.rows_to_dicts(names, rows)
+    return (rv[0] if rv else None) if one else rv
+
 def execute_db(sql, args=()):
     """Helper function for INSERT, UPDATE, DELETE."""
     try:
+        start = time.perf_counter()
         conn = get_db()
         cur = conn.execute(sql, args)
         conn.commit()
         last_id = cur.lastrowid
         cur.close()
+        metrics.observe_query(_metrics_route(), 'execute', sql, args, time.perf_counter() - start)
         return last_id # Return the ID of the inserted row
     except sqlite3.IntegrityError as e:
         print(f"Database integrity error: {e}\nSQL: {sql}\nArgs: {args}")
@@ -91,9 +139,103 @@ def execute_db(sql, args=()):
         print(f"Database execution error: {e}\nSQL: {sql}\nArgs: {args}")
         abort(500, description=f"Database execution error: {e}")
 
+@contextmanager
+def read_transaction():
+    """Run several query_db calls against one consistent snapshot (a single deferred SQLite read transaction)."""
+    conn = get_db()
+    if conn.in_transaction:
+        yield conn
+        return
+    conn.execute("BEGIN")
+    try:
+        yield conn
+    finally:
+        conn.execute("COMMIT")
+
+
+# --- Request Metrics ---
+def is_admin_request():
+    """True if the request carries the configured X-Admin-Token. Always False when ADMIN_TOKEN is unset."""
+    token = request.headers.get('X-Admin-Token')
+    return bool(ADMIN_TOKEN and token and hmac.compare_digest(token, ADMIN_TOKEN))
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    # Per-request cProfile capture: admin-only, opt-in per request via header
+    if request.headers.get('X-Profile') and is_admin_request():
+        g.request_profile = profiler.start_request_profile()
+
+@app.after_request
+def record_request_metrics(response):
+    request_profile = g.pop('request_profile', None)
+    if request_profile is not None:
+        response.headers['X-Profile-Id'] = profiler.finish_request_profile(request_profile, request.endpoint)
+    start = g.pop('request_start', None)
+    if start is not None:
+        # Use the URL rule (e.g. /api/v1/lands/<int:land_id>) so label cardinality stays bounded
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.observe_request(route, request.method, response.status_code, time.perf_counter() - start)
+    return response
+
+# --- Response Encoding ---
+def requested_fields(allowed=None):
+    """The ?fields=a,b projection requested by the client, or None for every field."""
+    return encoding.parse_fields(request.args.get('fields'), allowed)
+
+def api_response(payload):
+    """JSON by default; MessagePack when the client's Accept header prefers it (and msgpack is installed)."""
+    if encoding.wants_msgpack(request.accept_mimetypes):
+        response = Response(encoding.encode_msgpack(payload), mimetype='application/msgpack')
+    else:
+        response = jsonify(payload)
+    response.vary.add('Accept')
+    return response
+
+@app.after_request
+def compress_response(response):
+    # Streamed bodies (exports, event streams) are left alone; they are not buffered here
+    if (response.direct_passthrough or response.is_streamed or response.mimetype not in encoding.COMPRESSIBLE_MIMETYPES
+            or response.status_code < 200 or response.status_code in (204, 304)
+            or 'Content-Encoding' in response.headers):
+        return response
+    response.vary.add('Accept-Encoding')
+    body = response.get_data()
+    if len(body) < encoding.COMPRESS_MIN_BYTES:
+        return response
+    content_encoding = encoding.choose_content_encoding(request.accept_encodings)
+    if content_encoding:
+        response.set_data(encoding.compress(body, content_encoding))
+        response.headers['Content-Encoding'] = content_encoding
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    # Per-process counters; scrape each worker (or aggregate upstream) when running several
+    return Response(metrics.REGISTRY.render(), mimetype='text/plain; version=0.0.4')
 
 # --- Authentication ---
-# Simple token-based auth for demo. In production, use JWT with proper expiry and refresh mechanisms.
+def admin_required(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if not is_admin_request():
+            abort(403, description="Admin access required.")
+        return f(*args, **kwargs)
+    return decorated_function
+
+def user_from_auth_header(auth_header):
+    """
+    Resolve an Authorization header to a user dict, or None if it is not a bearer token.
+    Shared by auth_required and the async ASGI routes (asgi.py). No database access: the
+    token's signature and expiry are all that is checked (see security.py).
+    """
+    if not auth_header or not auth_header.startswith("Bearer "):
+        return None
+    user_id = tokens.verify(auth_header[len("Bearer "):])
+    if user_id is None:
+        abort(401, description="Invalid or expired token.")
+    return {'id': user_id}
+
 def auth_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
@@ -103,27 +245,18 @@ def auth_required(f):
         auth_header = request.headers.get('Authorization')
         device_key = request.headers.get('X-Device-Key')
 
-        if auth_header and auth_header.startswith("Bearer demo-token-user-"):
-            try:
-                # Extract user ID from the simple demo token
-                user_id = int(auth_header.split('-')[-1])
-                # Optional: Verify user_id actually exists in DB
-                # user_check = query_db("SELECT id FROM users WHERE id = ?", (user_id,), one=True)
-                # if not user_check:
-                #    abort(401, description="Invalid user in token.")
-                g.user = {'id': user_id} # Attach user info to Flask's 'g' object
-                print(f"User authenticated: {g.user['id']}")
-            except (ValueError, IndexError):
-                 abort(401, description="Invalid demo token format.")
+        user = user_from_auth_header(auth_header)
+        if user:
+            g.user = user # Attach user info to Flask's 'g' object
 
         # Allow device key authentication specifically for the ingest endpoint
         elif request.path == '/api/v1/ingest/soil-readings' and device_key:
-             # TODO: Validate device_key against a secure store or hardware_devices table
-             if device_key.startswith("device-key-"): # Dummy validation
-                 g.device_auth = True # Indicate device authentication
-                 print("Device authenticated via X-Device-Key.")
-             else:
+             # Cached per worker; the database is only consulted for keys not seen recently
+             g.device = device_auth.authenticate(
+                 device_key, lambda digest: query_db(device_auth.LOOKUP_SQL, (digest,), one=True))
+             if not g.device:
                  abort(401, description="Invalid device key.")
+             g.device_auth = True # Indicate device authentication
 
         # If neither user nor valid device auth for ingest endpoint, deny access
         if not g.user and not g.device_auth:
@@ -132,6 +265,52 @@ def auth_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def request_body_for_fingerprint():
+    """The request's content: uploaded files for multipart requests (whose boundaries change on every send), else the raw body."""
+    if not request.files:
+        return request.get_data()
+    parts = []
+    for name, upload in sorted(request.files.items(multi=True), key=lambda item: item[0]):
+        parts.append(name.encode() + b'\0' + upload.read())
+        upload.seek(0)
+    return b'\0'.join(parts)
+
+def idempotent(f):
+    """
+    Honour an Idempotency-Key header: the first successful response is stored and replayed to
+    retries of the same request (see idempotency.py). Goes below @auth_required.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        key = request.headers.get('Idempotency-Key')
+        if not key:
+            return f(*args, **kwargs)
+        if len(key) > idempotency.MAX_KEY_LENGTH:
+            abort(400, description="Idempotency-Key is too long.")
+        scope = f"user:{g.user['id']}" if g.user else f"device:{g.device.device_id}"
+        request_fingerprint = idempotency.fingerprint(request.method, request.path, request_body_for_fingerprint())
+        conn = get_db()
+        stored = idempotency.claim(conn, scope, key, request_fingerprint)
+        if stored is not None:
+            if stored['fingerprint'] != request_fingerprint:
+                abort(409, description="Idempotency-Key was already used for a different request.")
+            if stored['status_code'] is None:
+                abort(409, description="A request with this Idempotency-Key is still being processed.")
+            response = app.response_class(stored['response'], status=stored['status_code'], mimetype='application/json')
+            response.headers['Idempotent-Replayed'] = 'true'
+            return response
+        try:
+            response = make_response(f(*args, **kwargs))
+        except BaseException:
+            idempotency.release(conn, scope, key)
+            raise
+        if 200 <= response.status_code < 300:
+            idempotency.complete(conn, scope, key, response.status_code, response.get_data())
+        else:
+            idempotency.release(conn, scope, key)
+        return response
+    return decorated_function
+
 # --- API Endpoints ---
 
 # 1. Authentication (/auth)
@@ -145,47 +324,70 @@ def register():
     name = data['name']
     phone = data.get('phone_number') # Optional
 
-    # --- SECURITY: Hash the password ---
-    password_hash = generate_password_hash(data['password'])
+    # --- SECURITY: Hash the password (on the bounded hashing pool) ---
+    password_hash = hash_password_or_503(data['password'])
     # --- End Security ---
 
     sql = "INSERT INTO users (name, phone_number, password_hash) VALUES (?, ?, ?)"
     try:
         user_id = execute_db(sql, (name, phone, password_hash))
         user = query_db("SELECT id, name FROM users WHERE id = ?", (user_id,), one=True)
-        # Generate simple demo token (replace with JWT in production)
-        token = f"demo-token-user-{user_id}"
-        return jsonify({"user": user, "token": token}), 201
+        return jsonify({"user": user, **tokens.issue_pair(user_id)}), 201
     except sqlite3.IntegrityError: # Caught by execute_db, but can be caught here for specific message
         abort(409, description=f"phone number '{phone}' already registered.")
 
 @app.route('/api/v1/auth/login', methods=['POST'])
 def login():
     data = request.get_json()
-    if not data or not data.get('email_or_phone'):
+    if not data or not data.get('email_or_phone') or not data.get('password'):
         abort(400, description="Missing email_or_phone or password.")
 
     login_identifier = data['email_or_phone']
-    # password_attempt = data['password']
+    password_attempt = data['password']
 
-    user = query_db("SELECT * FROM users WHERE phone_number = ?",
+    user = query_db("SELECT id, name, password_hash FROM users WHERE phone_number = ?",
                     (login_identifier,), one=True)
 
     # --- SECURITY: Check hashed password ---
-    # if user and check_password_hash(user['password_hash'], password_attempt):
-        # --- End Security ---
-        # Generate simple demo token (replace with JWT in production)
-    token = f"demo-token-user-{user['id']}"
+    try:
+        valid = security.check_password(user['password_hash'] if user else None, password_attempt)
+    except security.PoolBusy:
+        abort(503, description="Too many sign-in attempts in progress. Try again shortly.")
+    if not valid:
+        abort(401, description="Invalid credentials.")
+    # --- End Security ---
+
     user_info = { "id": user['id'], "name": user['name'] }
-    return jsonify({"user": user_info, "token": token}), 200
-    # else:
-        # abort(401, description="Invalid credentials.")
+    return jsonify({"user": user_info, **tokens.issue_pair(user['id'])}), 200
+
+@app.route('/api/v1/auth/refresh', methods=['POST'])
+def refresh_token():
+    data = request.get_json()
+    if not data or not data.get('refresh_token'):
+        abort(400, description="Missing refresh_token.")
+
+    user_id = tokens.verify(data['refresh_token'], typ='refresh')
+    if user_id is None:
+        abort(401, description="Invalid or expired refresh token.")
+    # Not on the hot path, so confirm the account still exists before extending the session
+    if not query_db("SELECT id FROM users WHERE id = ?", (user_id,), one=True):
+        abort(401, description="Invalid or expired refresh token.")
+    return jsonify(tokens.issue_pair(user_id)), 200
+
+def hash_password_or_503(password):
+    try:
+        return security.hash_password(password)
+    except security.PoolBusy:
+        abort(503, description="Too many sign-ups in progress. Try again shortly.")
 
 # 2. Users (/users)
+def fetch_user_profile(user_id):
+    return query_db("SELECT id, name, phone_number, created_at FROM users WHERE id = ?", (user_id,), one=True)
+
 @app.route('/api/v1/users/me', methods=['GET'])
 @auth_required
 def get_current_user():
-    user = query_db("SELECT id, name, phone_number, created_at FROM users WHERE id = ?", (g.user['id'],), one=True)
+    user = fetch_user_profile(g.user['id'])
     if not user:
         # This case should ideally not happen if auth_required works correctly
         abort(404, description="User not found.")
@@ -261,6 +463,10 @@ def list_farms():
     offset = request.args.get('offset', 0, type=int)
     if limit > 100: limit = 100 # Add a max limit
 
+    farms, total = fetch_farms_page(g.user['id'], limit, offset)
+    return api_response({"farms": encoding.project(farms, requested_fields()), "total": total}), 200
+
+def fetch_farms_page(user_id, limit, offset):
     # Subqueries are acceptable for SQLite on moderate data, indexes help
     sql = """
        SELECT
@@ -272,10 +478,9 @@ def list_farms():
        ORDER BY f.created_at DESC
        LIMIT ? OFFSET ?
     """
-    farms = query_db(sql, (g.user['id'], limit, offset))
-    total = query_db("SELECT COUNT(*) as count FROM farms WHERE user_id = ?", (g.user['id'],), one=True)['count']
-
-    return jsonify({"farms": farms, "total": total}), 200
+    farms = query_db(sql, (user_id, limit, offset))
+    total = query_db("SELECT COUNT(*) as count FROM farms WHERE user_id = ?", (user_id,), one=True)['count']
+    return farms, total
 
 @app.route('/api/v1/courses', methods=['GET'])
 @auth_required
@@ -284,15 +489,16 @@ def list_courses():
     offset = request.args.get('offset', 0, type=int)
     if limit > 100: limit = 100 # Add a max limit
 
-    # Subqueries are acceptable for SQLite on moderate data, indexes help
+    courses = fetch_courses_page(limit, offset)
+    return api_response({"courses": encoding.project(courses, requested_fields()),}), 200
+
+def fetch_courses_page(limit, offset):
     sql = """
        SELECT
            * FROM Courses
        LIMIT ? OFFSET ?
     """
-    courses = query_db(sql, (limit, offset))
-    
-    return jsonify({"courses": courses,}), 200
+    return query_db(sql, (limit, offset))
 
 
 @app.route('/api/v1/farms/<int:farm_id>', methods=['GET'])
@@ -441,51 +647,64 @@ def list_lands(farm_id):
              land_data['assigned_device'] = None
         formatted_lands.append(land_data)
 
-    return jsonify({"lands": formatted_lands, "total": total}), 200
+    return api_response({"lands": encoding.project(formatted_lands, requested_fields()), "total": total}), 200
 
-@app.route('/api/v1/lands/<int:land_id>', methods=['GET'])
-@auth_required
-def get_land(land_id):
-    # Verify ownership via farm_id JOIN
-    land = query_db("SELECT l.*, f.user_id FROM lands l JOIN farms f ON l.farm_id = f.id WHERE l.id = ?", (land_id,), one=True)
-    if not land or land['user_id'] != g.user['id']:
-        abort(404, description="Land not found or access denied.")
+def fetch_land_detail(land_id, user_id):
+    """
+    Land with its current planting, assigned device and latest reading, or None if the land
+    does not exist or belongs to someone else. Two indexed queries instead of one per relation.
+    """
+    land = query_db(f"""
+        SELECT l.*, f.user_id,
+               p.id AS planting__id, p.planting_date AS planting__planting_date, p.status AS planting__status,
+               c.id AS crop__id, c.crop_name AS crop__crop_name,
+               hd.id AS device__id, hd.hardware_unique_id AS device__hardware_unique_id,
+               hd.device_name AS device__device_name, hd.status AS device__status,
+               hd.last_seen_at AS device__last_seen_at, {device_health.health_columns(prefix='device__')}
+        FROM lands l
+        JOIN farms f ON l.farm_id = f.id
+        LEFT JOIN plantings p ON p.id = l.current_planting_id
+        LEFT JOIN crops c ON c.id = p.crop_id
+        LEFT JOIN hardware_devices hd ON hd.assigned_land_id = l.id
+        WHERE l.id = ?
+        LIMIT 1
+    """, (land_id,), one=True)
+    if not land or land['user_id'] != user_id:
+        return None
 
-    # Fetch related data: planting, device, latest reading
     planting = None
-    if land.get('current_planting_id'):
-        planting_sql = """
-            SELECT p.id, p.planting_date, p.status, c.id as crop_id, c.crop_name
-            FROM plantings p JOIN crops c ON p.crop_id = c.id
-            WHERE p.id = ?
-        """
-        planting_data = query_db(planting_sql, (land['current_planting_id'],), one=True)
-        if planting_data:
-            planting = {
-                "id": planting_data['id'],
-                "crop": { "id": planting_data['crop_id'], "crop_name": planting_data['crop_name'] },
-                "planting_date": planting_data['planting_date'],
-                "status": planting_data['status']
-            }
-
-    device_sql = """
-        SELECT id, hardware_unique_id, device_name, status, last_seen_at
-        FROM hardware_devices WHERE assigned_land_id = ?
-    """
-    device = query_db(device_sql, (land_id,), one=True)
+    if land['planting__id'] and land['crop__id']:
+        planting = {
+            "id": land['planting__id'],
+            "crop": { "id": land['crop__id'], "crop_name": land['crop__crop_name'] },
+            "planting_date": land['planting__planting_date'],
+            "status": land['planting__status']
+        }
+
+    device = None
+    if land['device__id']:
+        device = {k[len('device__'):]: v for k, v in land.items() if k.startswith('device__')}
 
     latest_reading_sql = """
-        SELECT * FROM soil_readings WHERE land_id = ? ORDER BY timestamp DESC LIMIT 1
+        SELECT * FROM soil_readings WHERE land_id = ? AND quality_flag IS NULL ORDER BY timestamp DESC LIMIT 1
     """
     latest_reading = query_db(latest_reading_sql, (land_id,), one=True)
 
-    # Construct response, excluding user_id
-    response_data = {k: v for k, v in land.items() if k != 'user_id'}
+    # Construct response, excluding user_id and the joined columns
+    response_data = {k: v for k, v in land.items() if k != 'user_id' and '__' not in k}
     response_data['current_planting'] = planting
     response_data['assigned_device'] = device
     response_data['latest_soil_reading'] = latest_reading
+    return response_data
 
-    return jsonify(response_data), 200
+@app.route('/api/v1/lands/<int:land_id>', methods=['GET'])
+@auth_required
+def get_land(land_id):
+    with read_transaction():
+        land = fetch_land_detail(land_id, g.user['id'])
+    if not land:
+        abort(404, description="Land not found or access denied.")
+    return api_response(encoding.project(land, requested_fields())), 200
 
 @app.route('/api/v1/lands/<int:land_id>', methods=['PUT'])
 @auth_required
@@ -532,7 +751,7 @@ def update_land(land_id):
     execute_db(sql, tuple(update_values))
 
     # Fetch the full updated land details for the response
-    updated_land = get_land(land_id).get_json() # Reuse the GET logic
+    updated_land = fetch_land_detail(land_id, g.user['id']) # Reuse the GET logic
     return jsonify(updated_land), 200
 
 @app.route('/api/v1/lands/<int:land_id>', methods=['DELETE'])
@@ -550,6 +769,11 @@ def delete_land(land_id):
     return '', 204
 
 # 5. Hardware Devices (/hardware_devices) - (Ownership checks seem okay)
+@app.before_request
+def start_device_sweeper():
+    # Cheap after the first request in each worker
+    device_health.sweeper.ensure_started(app.config['DATABASE'])
+
 @app.route('/api/v1/hardware_devices', methods=['POST'])
 @auth_required
 def register_hardware_device():
@@ -576,10 +800,12 @@ def register_hardware_device():
             abort(409, description=f"Land plot {assigned_land_id} already has a device assigned.")
         new_status = 'active'
 
+    # The device authenticates ingestion with this key; only its hash is stored
+    api_key = device_auth.generate_key()
     sql = """
         INSERT INTO hardware_devices
-        (hardware_unique_id, farm_id, assigned_land_id, device_name, model, registration_date, status)
-        VALUES (?, ?, ?, ?, ?, DATE('now'), ?)
+        (hardware_unique_id, farm_id, assigned_land_id, device_name, model, registration_date, status, api_key_hash)
+        VALUES (?, ?, ?, ?, ?, DATE('now'), ?, ?)
     """
     try:
         device_id = execute_db(sql, (
@@ -588,7 +814,8 @@ def register_hardware_device():
             assigned_land_id,
             data.get('device_name'),
             data.get('model'),
-            new_status
+            new_status,
+            device_auth.hash_key(api_key)
         ))
     except sqlite3.IntegrityError as e:
          # Specifically catch unique hardware_unique_id violation
@@ -599,6 +826,8 @@ def register_hardware_device():
 
 
     device = query_db("SELECT * FROM hardware_devices WHERE id = ?", (device_id,), one=True)
+    device.pop('api_key_hash')
+    device['api_key'] = api_key # Shown once; rotate via POST /hardware_devices/<id>/api-key if lost
     return jsonify(device), 201
 
 @app.route('/api/v1/farms/<int:farm_id>/hardware_devices', methods=['GET'])
@@ -614,7 +843,7 @@ def list_farm_hardware_devices(farm_id):
     offset = request.args.get('offset', 0, type=int)
     if limit > 100: limit = 100
 
-    sql_base = "SELECT hd.id, hd.hardware_unique_id, hd.device_name, hd.status, hd.assigned_land_id, l.land_name as assigned_land_name, hd.last_seen_at FROM hardware_devices hd LEFT JOIN lands l ON hd.assigned_land_id = l.id WHERE hd.farm_id = ?"
+    sql_base = f"SELECT hd.id, hd.hardware_unique_id, hd.device_name, hd.status, hd.assigned_land_id, l.land_name as assigned_land_name, hd.last_seen_at, {device_health.health_columns()} FROM hardware_devices hd LEFT JOIN lands l ON hd.assigned_land_id = l.id WHERE hd.farm_id = ?"
     params = [farm_id]
 
     if status_filter:
@@ -634,14 +863,14 @@ def list_farm_hardware_devices(farm_id):
     devices = query_db(sql, tuple(params))
     total = query_db(count_sql, tuple(count_params), one=True)['count']
 
-    return jsonify({"devices": devices, "total": total}), 200
+    return api_response({"devices": encoding.project(devices, requested_fields()), "total": total}), 200
 
 @app.route('/api/v1/hardware_devices/<int:device_id>', methods=['GET'])
 @auth_required
 def get_hardware_device(device_id):
      # Verify ownership via farm JOIN
-    device = query_db("""
-        SELECT hd.*, f.user_id, l.land_name as assigned_land_name
+    device = query_db(f"""
+        SELECT hd.*, f.user_id, l.land_name as assigned_land_name, {device_health.health_columns()}
         FROM hardware_devices hd
         JOIN farms f ON hd.farm_id = f.id
         LEFT JOIN lands l ON hd.assigned_land_id = l.id
@@ -651,8 +880,8 @@ def get_hardware_device(device_id):
     if not device or device['user_id'] != g.user['id']:
         abort(404, description="Device not found or access denied.")
 
-    # Don't send user_id back
-    response_data = {k: v for k, v in device.items() if k != 'user_id'}
+    # Don't send user_id or the key hash back
+    response_data = {k: v for k, v in device.items() if k not in ('user_id', 'api_key_hash')}
     return jsonify(response_data), 200
 
 @app.route('/api/v1/hardware_devices/<int:device_id>', methods=['PUT'])
@@ -690,14 +919,13 @@ def update_hardware_device(device_id):
     sql = f"UPDATE hardware_devices SET {', '.join(update_fields)} WHERE id = ?"
     execute_db(sql, tuple(update_values))
 
-    updated_device = get_hardware_device(device_id).get_json() # Reuse GET logic
-    return jsonify(updated_device), 200
+    return get_hardware_device(device_id) # Reuse GET logic
 
 @app.route('/api/v1/hardware_devices/<int:device_id>/assignment', methods=['PUT'])
 @auth_required
 def update_device_assignment(device_id):
     # Verify ownership and get farm_id
-    device = query_db("SELECT hd.id, hd.farm_id, f.user_id FROM hardware_devices hd JOIN farms f ON hd.farm_id = f.id WHERE hd.id = ?",
+    device = query_db("SELECT hd.id, hd.farm_id, hd.assigned_land_id, f.user_id FROM hardware_devices hd JOIN farms f ON hd.farm_id = f.id WHERE hd.id = ?",
                        (device_id,), one=True)
     if not device or device['user_id'] != g.user['id']:
         abort(404, description="Device not found or access denied.")
@@ -729,9 +957,13 @@ def update_device_assignment(device_id):
 
     sql = "UPDATE hardware_devices SET assigned_land_id = ?, status = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?"
     execute_db(sql, (assigned_land_id, new_status, device_id))
+    # Cached key lookups carry the old land; drop them so the next reading picks up the new one
+    device_auth.cache.invalidate_device(device_id)
+    if assigned_land_id != device['assigned_land_id']:
+        # A different soil means a different normal; relearn the anomaly baseline from scratch
+        anomaly.detector.forget_device(get_db(), device_id)
 
-    updated_device = get_hardware_device(device_id).get_json() # Reuse GET logic
-    return jsonify(updated_device), 200
+    return get_hardware_device(device_id) # Reuse GET logic
 
 @app.route('/api/v1/hardware_devices/<int:device_id>', methods=['DELETE'])
 @auth_required
@@ -744,8 +976,25 @@ def delete_hardware_device(device_id):
 
     # Assuming CASCADE delete handles readings. If not, delete readings first.
     execute_db("DELETE FROM hardware_devices WHERE id = ?", (device_id,))
+    device_auth.cache.invalidate_device(device_id)
     return '', 204
 
+@app.route('/api/v1/hardware_devices/<int:device_id>/api-key', methods=['POST'])
+@auth_required
+def rotate_device_api_key(device_id):
+    # Verify ownership
+    owner_check = query_db("SELECT hd.id FROM hardware_devices hd JOIN farms f ON hd.farm_id = f.id WHERE hd.id = ? AND f.user_id = ?",
+                           (device_id, g.user['id']), one=True)
+    if not owner_check:
+        abort(404, description="Device not found or access denied.")
+
+    # Issues a new key and revokes the old one (immediately in this worker, within the cache TTL elsewhere)
+    api_key = device_auth.generate_key()
+    execute_db("UPDATE hardware_devices SET api_key_hash = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+               (device_auth.hash_key(api_key), device_id))
+    device_auth.cache.invalidate_device(device_id)
+    return jsonify({"device_id": device_id, "api_key": api_key}), 201
+
 # 6. Soil Readings (/lands/{land_id}/soil-readings and /ingest)
 @app.route('/api/v1/lands/<int:land_id>/soil-readings', methods=['GET'])
 @auth_required
@@ -759,17 +1008,24 @@ def get_soil_readings(land_id):
     start_date = request.args.get('start_date') # Expect ISO format e.g., 2023-10-26 or 2023-10-26T10:00:00Z
     end_date = request.args.get('end_date')
     parameters = request.args.get('parameters') # e.g., "ph_value,moisture_value"
+    response_format = request.args.get('format', 'rows') # 'rows' or 'columnar'
     limit = request.args.get('limit', 100, type=int)
     offset = request.args.get('offset', 0, type=int)
     if limit > 1000: limit = 1000 # Max limit for readings
+    if response_format not in ('rows', 'columnar'):
+        abort(400, description="Invalid format. Use 'rows' or 'columnar'.")
 
     # Define allowed columns for selection to prevent selecting arbitrary data
     allowed_params = ['id', 'timestamp', 'received_at', 'land_id', 'device_id', 'farm_id',
                       'ph_value', 'nitrogen_value', 'phosphorus_value', 'potassium_value',
-                      'moisture_value', 'temperature_value', 'humidity_value']
+                      'moisture_value', 'temperature_value', 'humidity_value', 'quality_flag', 'source']
     select_cols = "id, timestamp, received_at, land_id, device_id" # Default minimal columns
+    fields = requested_fields(allowed_params)
 
-    if parameters:
+    if fields:
+        # Exact projection, pushed down into the SELECT so unused columns are never read
+        select_cols = ", ".join(fields)
+    elif parameters:
         req_params = [p.strip() for p in parameters.split(',') if p.strip() in allowed_params]
         # Ensure core columns are always included if specific params are requested
         select_cols_set = set(req_params).union({'id', 'timestamp', 'land_id', 'device_id'})
@@ -806,83 +1062,312 @@ def get_soil_readings(land_id):
         abort(400, description="Invalid date format. Use ISO 8601 format (e.g., YYYY-MM-DD or YYYY-MM-DDTHH:MM:SSZ).")
 
 
-    sql += " ORDER BY timestamp DESC LIMIT ? OFFSET ?"
-    params.extend([limit, offset])
-
-    readings = query_db(sql, tuple(params))
     total = query_db(count_sql, tuple(count_params), one=True)['count']
 
-    return jsonify({"readings": readings, "total": total}), 200
+    # Readings past the archive horizon live in columnar files (archive.py); the manifest
+    # lookup is a single indexed query and finds nothing for lands that were never archived
+    partitions = []
+    if archive.pyarrow is not None:
+        partitions = query_db(archive.PARTITIONS_SQL, archive.partitions_query_args(land_id, start_date, end_date))
+
+    if partitions:
+        names, rows = merged_readings_page(sql, params, partitions, land_id, start_date, end_date, limit, offset)
+        total += archive.count_archived(partitions, land_id, start_date, end_date)
+    else:
+        sql += " ORDER BY timestamp DESC LIMIT ? OFFSET ?"
+        params.extend([limit, offset])
+        names, rows = query_rows(sql, tuple(params))
+
+    if response_format == 'columnar':
+        # {column: [values...]}: each key is sent once per page instead of once per reading
+        return api_response({"format": "columnar", "readings": serialization.rows_to_columns(names, rows), "total": total}), 200
+    return api_response({"readings": serialization.rows_to_dicts(names, rows), "total": total}), 200
+
+def merged_readings_page(sql, params, partitions, land_id, start_date, end_date, limit, offset):
+    """
+    One page of readings, newest first, across soil_readings and the archive partitions: the
+    newest offset+limit rows are taken from each tier and merged on (timestamp, id).
+    """
+    window = offset + limit
+    # Sort keys ride along as two leading columns and are stripped after the merge
+    hot_sql = sql.replace("SELECT ", "SELECT timestamp AS sort_timestamp, id AS sort_id, ", 1)
+    hot_sql += " ORDER BY timestamp DESC, id DESC LIMIT ?"
+    all_names, hot_rows = query_rows(hot_sql, (*params, window))
+    names = all_names[2:]
+    hot = [(row[0], row[1], row[2:]) for row in hot_rows]
+    archived = archive.newest_archived(partitions, land_id, names, window, start_date, end_date)
+    return names, archive.merge_newest(hot, archived, window)[offset:]
+
+# Columns of a live reading event: id, then the INSERT parameters
+LIVE_READING_COLUMNS = ('id', *ingest.READING_COLUMNS)
+
+# Shared by the Flask view below and the async stream served from asgi.py
+def live_stream_start(land_id, user_id, resume_from):
+    """Check the land belongs to the user; returns the reading id the stream starts after."""
+    owner_check = query_db("SELECT l.id, f.user_id FROM lands l JOIN farms f ON l.farm_id = f.id WHERE l.id = ?", (land_id,), one=True)
+    if not owner_check or owner_check['user_id'] != user_id:
+        abort(404, description="Land not found or access denied.")
+    if resume_from is not None:
+        return resume_from
+    newest = query_db("SELECT MAX(id) AS id FROM soil_readings WHERE land_id = ?", (land_id,), one=True)
+    return newest['id'] or 0
+
+def live_readings_after(db_file, land_id, after_id):
+    """Up to LIVE_QUEUE_SIZE clean readings of the land after `after_id`, as (id, encoded row) in id order."""
+    # Own connection: streams read between requests, outside any app context
+    conn = sqlite3.connect(db_file)
+    try:
+        cursor = conn.execute(f"""
+            SELECT {', '.join(LIVE_READING_COLUMNS)}, received_at FROM soil_readings
+            WHERE land_id = ? AND id > ? AND quality_flag IS NULL ORDER BY id LIMIT ?
+        """, (land_id, after_id, live.LIVE_QUEUE_SIZE))
+        names = serialization.column_names(cursor)
+        return [(row[0], app.json.dumpb(dict(zip(names, row)))) for row in cursor.fetchall()]
+    finally:
+        conn.close()
+
+@app.route('/api/v1/lands/<int:land_id>/soil-readings/stream', methods=['GET'])
+@auth_required
+def stream_soil_readings(land_id):
+    """
+    Server-Sent Events stream of new (clean) readings for a land: `event: reading` with the
+    reading row as data and its id as the event id, in id order and without gaps. Resumes after
+    Last-Event-ID when the client reconnects. Holds a server thread while open; asgi.py serves
+    the same stream on its event loop instead.
+    """
+    resume_from = request.headers.get('Last-Event-ID', type=int)
+    last_id = live_stream_start(land_id, g.user['id'], resume_from)
+
+    subscriber = live.soil_readings.open(land_id)
+    if subscriber is None:
+        abort(503, description="Too many live streams open. Try again shortly.")
+    db_file = app.config['DATABASE']
+
+    def events():
+        nonlocal last_id
+        yield b'retry: 5000\n\n'
+        deadline = time.monotonic() + live.LIVE_MAX_STREAM_SECONDS
+        # A reconnecting client first gets what it missed
+        more = resume_from is not None
+        while time.monotonic() < deadline:
+            woken = more
+            if not more:
+                try:
+                    subscriber.queue.get(timeout=live.LIVE_RECHECK_SECONDS)
+                    woken = True
+                except queue.Empty:
+                    pass
+            # The hub only says that something arrived; rows always come from the database, so a
+            # lower id committed by another worker is not skipped when this worker's reading wakes us
+            live.drain(subscriber)
+            rows = live_readings_after(db_file, land_id, last_id)
+            for reading_id, data in rows:
+                last_id = reading_id
+                yield live.sse_event('reading', data, reading_id)
+            more = len(rows) == live.LIVE_QUEUE_SIZE
+            if not rows and not woken:
+                yield b': keepalive\n\n'
+
+    response = Response(events(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no' # Keep reverse proxies from buffering the stream
+    response.call_on_close(lambda: live.soil_readings.close(subscriber))
+    return response
 
 @app.route('/api/v1/ingest/soil-readings', methods=['POST'])
 @auth_required # Uses device auth check inside decorator
+@idempotent
 def ingest_soil_reading():
     # Ensure this endpoint was called with device authentication
     if not hasattr(g, 'device_auth') or not g.device_auth:
          abort(401, description="Device authentication required for ingestion.")
 
     data = request.get_json()
-    if not data or not data.get('hardware_unique_id') or not data.get('timestamp'):
-        abort(400, description="Missing hardware_unique_id or timestamp in reading.")
+    if not data or not data.get('timestamp'):
+        abort(400, description="Missing timestamp in reading.")
 
-    hw_unique_id = data['hardware_unique_id']
+    # The device (and its current assignment) comes from its API key; hardware_unique_id is
+    # optional in the body but must match the key when sent
+    device = g.device
+    hw_unique_id = data.get('hardware_unique_id')
+    if hw_unique_id and hw_unique_id != device.hardware_unique_id:
+        abort(403, description="Device key does not belong to this hardware_unique_id.")
 
     # Validate timestamp format
     try:
         # Ensure timestamp is valid ISO format (or format expected from device)
-        reading_ts = datetime.datetime.fromisoformat(data['timestamp'].replace('Z', '+00:00')).isoformat()
-    except ValueError:
-        abort(400, description="Invalid timestamp format. Use ISO 8601 format.")
-
-    # Find the device and its current assignment based on the hardware ID
-    device = query_db("SELECT id, farm_id, assigned_land_id, status FROM hardware_devices WHERE hardware_unique_id = ?", (hw_unique_id,), one=True)
+        reading_ts = ingest.parse_timestamp(data['timestamp'])
+    except ValueError as e:
+        abort(400, description=str(e))
 
-    if not device:
-        print(f"Warning: Received reading from unknown device HW ID: {hw_unique_id}")
-        # Consider if you want to create a log entry for unknown devices
-        abort(404, description="Device not registered.")
-
-    if not device['assigned_land_id']:
-        print(f"Info: Received reading from unassigned device: {hw_unique_id} (ID: {device['id']})")
+    if not device.land_id:
+        print(f"Info: Received reading from unassigned device: {device.hardware_unique_id} (ID: {device.device_id})")
         # Decide action: reject, store in a separate log, or store without land_id.
         # Current decision: Reject as readings are tied to land plots.
         return jsonify({"message": "Device is not assigned to a land plot. Reading ignored."}), 202 # Accepted but not processed as intended
 
-    land_id = device['assigned_land_id']
-    farm_id = device['farm_id']
-    device_id = device['id']
+    land_id = device.land_id
+    farm_id = device.farm_id
+    device_id = device.device_id
 
-    # Map incoming data keys to database columns, handling potential missing values gracefully (as NULL)
-    sql = """
-        INSERT INTO soil_readings (
-            device_id, land_id, farm_id, timestamp, ph_value,
-            nitrogen_value, phosphorus_value, potassium_value,
-            moisture_value, temperature_value, humidity_value
-            -- received_at is handled by DEFAULT CURRENT_TIMESTAMP in schema
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """
-    params = (
-        device_id,
-        land_id,
-        farm_id,
-        reading_ts, # Use validated timestamp
-        data.get('ph_value'), # .get() returns None if key is missing
-        data.get('nitrogen_value'),
-        data.get('phosphorus_value'),
-        data.get('potassium_value'),
-        data.get('moisture_value'),
-        data.get('temperature_value'),
-        data.get('humidity_value')
-    )
-    execute_db(sql, params)
+    # A device retrying a reading that was already stored gets the same answer, without the
+    # values being screened twice (the unique index still catches a concurrent retry)
+    if query_db(ingest.DUPLICATE_READING_SQL, (device_id, reading_ts), one=True):
+        return jsonify({"message": "Reading accepted", "duplicate": True}), 202
+
+    # Screen the values against this sensor's history; flagged readings are stored but kept
+    # out of "latest reading" lookups so they never reach the recommendation models
+    values = {column: data.get(column) for column in anomaly.PARAMETERS}
+    flags = anomaly.detector.observe(get_db(), device_id, values)
+    quality_flag = anomaly.reading_flag(flags)
+
+    # Missing values are stored as NULL
+    reading_id, = store_readings([ingest.reading_row(device_id, land_id, farm_id, reading_ts, values, quality_flag, 'sensor')])
+    if reading_id is None:
+        return jsonify({"message": "Reading accepted", "duplicate": True}), 202
 
     # Update last_seen_at and potentially status for the device
     # Set status to 'active' if it wasn't already? Or handle status based on reading quality?
-    execute_db("UPDATE hardware_devices SET last_seen_at = CURRENT_TIMESTAMP, status = 'active' WHERE id = ?", (device_id,))
+    # (also keeps the device's health counters current, see device_health.py)
+    execute_db(device_health.RECORD_READING_SQL, (device_id,))
 
-    # Optional: Trigger further processing (e.g., update land's latest reading cache, run checks)
+    if flags:
+        record_sensor_alerts(device_id, land_id, farm_id, flags)
+    if anomaly.detector.checkpoint_due():
+        anomaly.detector.checkpoint(get_db())
 
-    return jsonify({"message": "Reading accepted"}), 202 # Use 202 Accepted
+    response = {"message": "Reading accepted"}
+    if quality_flag:
+        response["quality_flag"] = quality_flag
+    return jsonify(response), 202 # Use 202 Accepted
+
+def store_readings(rows):
+    """
+    Insert readings (ingest.reading_row tuples) in one transaction, then push the clean ones to
+    open live streams and queue each land's newest clean reading for agronomic alerts.
+    Every ingestion path goes through here. Returns the new reading ids in row order, with None
+    for sensor readings skipped as duplicates.
+    """
+    conn = get_db()
+    start = time.perf_counter()
+    try:
+        with conn:
+            reading_ids = []
+            for row in rows:
+                cur = conn.execute(ingest.INSERT_READING_SQL, row)
+                reading_ids.append(cur.lastrowid if cur.rowcount else None)
+    except sqlite3.IntegrityError as e:
+        print(f"Database integrity error: {e}\nSQL: {ingest.INSERT_READING_SQL}")
+        abort(409, description=f"Data integrity violation: {e}")
+    except sqlite3.Error as e:
+        print(f"Database execution error: {e}\nSQL: {ingest.INSERT_READING_SQL}")
+        abort(500, description=f"Database execution error: {e}")
+    metrics.observe_query(_metrics_route(), 'execute', ingest.INSERT_READING_SQL, f"<{len(rows)} rows>", time.perf_counter() - start)
+
+    newest = {}  # land_id -> newest clean reading in this batch
+    newest_id = {}  # land_id -> highest clean reading id in this batch
+    for reading_id, params in zip(reading_ids, rows):
+        row = dict(zip(ingest.READING_COLUMNS, params))
+        if reading_id is None or row['quality_flag']:
+            continue
+        land_id = row['land_id']
+        newest_id[land_id] = max(reading_id, newest_id.get(land_id, 0))
+        if land_id not in newest or row['timestamp'] >= newest[land_id]['timestamp']:
+            newest[land_id] = row
+    # Agronomic alerts (pH, moisture, NPK) are about a land's current state, so a lab report of
+    # past samples alerts on its newest one only; they are evaluated in batches off the request path
+    # (clean readings' values all parsed as numbers)
+    for land_id, row in newest.items():
+        # Wakes this worker's open streams on the land, which read the new rows from the database
+        if live.soil_readings.has_subscribers(land_id):
+            live.soil_readings.publish(land_id, newest_id[land_id])
+        reading = {column: float(row[column]) for column in anomaly.PARAMETERS if row[column] is not None}
+        reading.update(land_id=land_id, timestamp=row['timestamp'])
+        alerts.engine.submit(app.config['DATABASE'], reading)
+        # Crop and fertilizer recommendations follow the newest NPK values, once they move materially
+        if (precompute.PRECOMPUTE_RECOMMENDATIONS
+                and any(column in reading for column in ('nitrogen_value', 'phosphorus_value', 'potassium_value'))
+                and recommendations_stale(land_id, reading)):
+            recommendation_precomputer.submit(land_id)
+    return reading_ids
+
+def record_sensor_alerts(device_id, land_id, farm_id, flags):
+    """Tell the farmer about anomalous sensor values, at most once per device/parameter/kind per cooldown."""
+    due = [flag for flag in flags if anomaly.detector.alert_due(device_id, flag[0], flag[1])]
+    if not due:
+        return
+    owner = query_db("SELECT user_id FROM farms WHERE id = ?", (farm_id,), one=True)
+    if not owner:
+        return
+    conn = get_db()
+    with conn:
+        conn.executemany(anomaly.INSERT_SENSOR_ALERTS_SQL, anomaly.sensor_alert_rows(owner['user_id'], land_id, due))
+
+@app.route('/api/v1/lands/<int:land_id>/manual-soil-reading', methods=['POST'])
+@auth_required
+@idempotent
+def add_manual_soil_reading(land_id):
+    land = query_db("SELECT l.id, l.farm_id, f.user_id FROM lands l JOIN farms f ON l.farm_id = f.id WHERE l.id = ?", (land_id,), one=True)
+    if not land or land['user_id'] != g.user['id']:
+        abort(404, description="Land not found or access denied.")
+
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        abort(400, description="Request body must be a JSON object.")
+    try:
+        reading_ts, values = ingest.manual_reading(data)
+    except ValueError as e:
+        abort(400, description=str(e))
+
+    # Entered by a person, not a sensor: no device, and only range-checked (see ingest.py)
+    reading_id, = store_readings([ingest.reading_row(None, land_id, land['farm_id'], reading_ts, values, None, 'manual')])
+    return jsonify({"message": "Reading saved", "id": reading_id, "source": "manual", "timestamp": reading_ts}), 201
+
+@app.route('/api/v1/farms/<int:farm_id>/soil-readings/import', methods=['POST'])
+@auth_required
+@idempotent
+def import_soil_readings(farm_id):
+    """
+    Import a lab report as CSV (the request body, or a multipart `file`). Rows name their land by
+    land_id or land_name within this farm; the whole file is validated, then inserted in one
+    transaction, or rejected with the offending lines.
+    """
+    farm = query_db("SELECT id FROM farms WHERE id = ? AND user_id = ?", (farm_id, g.user['id']), one=True)
+    if not farm:
+        abort(404, description="Farm not found or access denied.")
+
+    upload = request.files.get('file')
+    raw = upload.read() if upload else request.get_data()
+    try:
+        text = raw.decode('utf-8')
+    except UnicodeDecodeError:
+        abort(400, description="The file must be UTF-8 encoded CSV.")
+
+    rows, errors = ingest.parse_csv(text)
+    if rows:
+        lands = query_db("SELECT id, land_name FROM lands WHERE farm_id = ?", (farm_id,))
+        land_ids = {land['id'] for land in lands}
+        by_name = {land['land_name'].strip().lower(): land['id'] for land in lands if land['land_name']}
+        for row in rows:
+            if 'land_name' in row:
+                row['land_id'] = by_name.get(row['land_name'].lower())
+                if row['land_id'] is None:
+                    errors.append(f"line {row['line']}: no land named {row['land_name']!r} on this farm")
+            elif row['land_id'] not in land_ids:
+                errors.append(f"line {row['line']}: land {row['land_id']} is not on this farm")
+    if errors:
+        shown = "; ".join(error.rstrip('.') for error in errors[:10])
+        more = f" (and {len(errors) - 10} more)" if len(errors) > 10 else ""
+        abort(400, description=f"Nothing was imported. {shown}{more}")
+
+    store_readings([ingest.reading_row(None, row['land_id'], farm_id, row['timestamp'], row['values'], None, 'lab')
+                    for row in rows])
+    return jsonify({
+        "message": "Readings imported",
+        "imported": len(rows),
+        "land_ids": sorted({row['land_id'] for row in rows}),
+        "source": "lab",
+    }), 201
 
 # 7. Plantings (/lands/{land_id}/plantings and /plantings) - (Ownership checks seem okay)
 @app.route('/api/v1/lands/<int:land_id>/plantings', methods=['POST'])
@@ -1029,6 +1514,49 @@ def update_planting(planting_id):
     return jsonify(updated_planting), 200
 
 # 8. Diagnostics / Disease Scan (/diagnostics)
+DIAGNOSIS_MAX_WAIT_SECONDS = 25 # Longest a GET ?wait= may block; below common proxy idle timeouts
+DIAGNOSIS_RECHECK_SECONDS = 5 # Waiters re-read the log this often, for jobs finished by another worker
+# Runs analysis jobs off the request thread (placeholder for a real task queue)
+diagnosis_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='diagnosis')
+
+def run_diagnosis_job(db_file, log_id):
+    """
+    Placeholder analysis job: waits a moment, picks a random outcome, stores it and wakes any
+    requests long-polling this log. A real model/queue worker would replace the simulation.
+    """
+    time.sleep(random.uniform(1, 4)) # Simulated inference time
+    conn = sqlite3.connect(db_file, timeout=30)
+    try:
+        completion_status = random.choice(['completed', 'failed', 'no_disease_detected'])
+        detected_disease_id = None
+        confidence = None
+        error_message = None
+
+        if completion_status == 'completed':
+            # Pick a random disease from the DB for demo
+            dummy_disease = conn.execute("SELECT id FROM diseases ORDER BY RANDOM() LIMIT 1").fetchone()
+            if dummy_disease:
+                detected_disease_id = dummy_disease[0]
+                confidence = round(random.uniform(0.65, 0.98), 3)
+            else:
+                completion_status = 'no_disease_detected' # Fallback if no diseases exist
+        elif completion_status == 'failed':
+            error_message = random.choice(["Image quality too low", "Model inference error", "Timeout"])
+
+        with conn:
+            conn.execute("""
+                UPDATE diagnosis_logs
+                SET processing_status = ?, detected_disease_id = ?, confidence_score = ?, notes = COALESCE(?, notes), updated_at = CURRENT_TIMESTAMP
+                WHERE id = ? AND processing_status = 'pending' """, # The failure reason goes in notes (there is no error column)
+                (completion_status, detected_disease_id, confidence, error_message, log_id))
+        print(f"Diagnosis log {log_id} finished: {completion_status}")
+    except Exception as e:
+        print(f"Error: diagnosis job for log {log_id} failed: {e}")
+    finally:
+        conn.close()
+        # Committed (or given up) either way; waiters re-read the log
+        notifications.diagnosis_done.notify(log_id)
+
 @app.route('/api/v1/diagnostics/scan-plant', methods=['POST'])
 @auth_required
 def scan_plant_disease():
@@ -1070,72 +1598,38 @@ def scan_plant_disease():
     """
     log_id = execute_db(sql, (g.user['id'], land_id, planting_id, dummy_storage_url))
 
-    # --- Skipping Async ML Task Trigger ---
-    print(f"Log entry {log_id} created with status 'pending'. Skipping actual ML analysis trigger.")
     # In Production: Add task to a queue (Celery, RQ, Google Cloud Tasks)
-    # e.g., trigger_disease_analysis.delay(log_id, dummy_storage_url)
-    # --- End Skipping ---
+    diagnosis_executor.submit(run_diagnosis_job, app.config['DATABASE'], log_id)
 
-    # Return the ID so the client can poll for results
+    # Return the ID so the client can wait for results (GET /diagnostics/logs/<id>?wait=25)
     return jsonify({"log_id": log_id, "status": "pending", "image_url": dummy_storage_url, "message": "Image received, analysis queued."}), 202
 
 
 @app.route('/api/v1/diagnostics/logs/<int:log_id>', methods=['GET'])
 @auth_required
 def get_diagnosis_log(log_id):
-    # Verify ownership
-    log = query_db("SELECT * FROM diagnosis_logs WHERE id = ? AND user_id = ?", (log_id, g.user['id']), one=True)
-    if not log:
-        abort(404, description="Diagnosis log not found or access denied.")
-
-    # --- Placeholder: Simulate Async Task Completion ---
-    # This simulates the background ML task updating the record.
-    # In a real system, this check wouldn't be here; the background task would update the DB directly.
-    if log['processing_status'] == 'pending':
-        print(f"Simulating completion check for log_id: {log_id}")
-        # Randomly decide if the "task" has completed
-        if random.random() < 0.25: # ~25% chance to stay pending on each request
-            print("-> Simulation: Still pending.")
-            pass # Remain pending
-        else:
-            # Simulate completion: choose a status
-            possible_statuses = ['completed', 'failed', 'no_disease_detected']
-            completion_status = random.choice(possible_statuses)
-            detected_disease_id = None
-            confidence = None
-            error_message = None
-
-            if completion_status == 'completed':
-                 # Pick a random disease from the DB for demo
-                 dummy_disease = query_db("SELECT id FROM diseases ORDER BY RANDOM() LIMIT 1", one=True)
-                 if dummy_disease:
-                     detected_disease_id = dummy_disease['id']
-                     confidence = round(random.uniform(0.65, 0.98), 3)
-                     print(f"-> Simulation: Completed. Detected disease {detected_disease_id} with confidence {confidence}.")
-                 else:
-                     completion_status = 'no_disease_detected' # Fallback if no diseases exist
-                     print("-> Simulation: Changed to 'no_disease_detected' (no diseases in DB).")
-
-            elif completion_status == 'failed':
-                error_message = random.choice(["Image quality too low", "Model inference error", "Timeout"])
-                print(f"-> Simulation: Failed. Reason: {error_message}")
-
-            else: # no_disease_detected
-                 print("-> Simulation: Completed. No disease detected.")
-
-
-            # Update the log record in the database
-            execute_db("""
-                UPDATE diagnosis_logs
-                SET processing_status = ?, detected_disease_id = ?, confidence_score = ?, error_message = ?, updated_at = CURRENT_TIMESTAMP
-                WHERE id = ? AND processing_status = 'pending' """, # Add status check to prevent race conditions
-                       (completion_status, detected_disease_id, confidence, error_message, log_id))
-
-            # Re-fetch the log after the update to return the latest state
-            log = query_db("SELECT * FROM diagnosis_logs WHERE id = ?", (log_id,), one=True)
-            if not log: abort(500, "Failed to re-fetch log after simulated update.") # Should not happen
-
-    # --- End Placeholder Simulation ---
+    # ?wait=<seconds> long-polls: a pending log is only returned once its job finishes or the wait runs out
+    wait = min(max(request.args.get('wait', 0, type=float), 0), DIAGNOSIS_MAX_WAIT_SECONDS)
+    sql = "SELECT * FROM diagnosis_logs WHERE id = ? AND user_id = ?"
+
+    # Register before the first read so a job finishing in between still wakes us
+    with notifications.diagnosis_done.waiter(log_id) if wait else nullcontext() as done:
+        # Verify ownership
+        log = query_db(sql, (log_id, g.user['id']), one=True)
+        if not log:
+            abort(404, description="Diagnosis log not found or access denied.")
+
+        deadline = time.monotonic() + wait
+        while done is not None and log['processing_status'] == 'pending':
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            notified = done.wait(min(remaining, DIAGNOSIS_RECHECK_SECONDS))
+            log = query_db(sql, (log_id, g.user['id']), one=True)
+            if notified:
+                # The job has ended, even if it gave up before storing a result; the Event stays set,
+                # so waiting on would only spin
+                break
 
     # Prepare response data from the (potentially updated) log
     response_data = {k: v for k, v in log.items()}
@@ -1208,39 +1702,63 @@ def list_diagnosis_logs():
     logs = query_db(sql, tuple(params))
     total = query_db(count_base, tuple(count_params), one=True)['count']
 
-    return jsonify({"logs": logs, "total": total}), 200
+    return api_response({"logs": encoding.project(logs, requested_fields()), "total": total}), 200
 
 # 9. Recommendations (Crops, Fertilizers, Tips)
-@app.route('/api/v1/lands/<int:land_id>/crop-suggestions', methods=['GET'])
-@auth_required
-def get_crop_suggestions(land_id):
-     # Verify ownership
+# Shared by the Flask views below and the async versions served from asgi.py
+def land_for_recommendations(land_id, user_id):
     land = query_db("SELECT l.id, l.soil_type_detected, l.soil_type_manual, f.user_id FROM lands l JOIN farms f ON l.farm_id = f.id WHERE l.id = ?", (land_id,), one=True)
-    if not land or land['user_id'] != g.user['id']:
+    if not land or land['user_id'] != user_id:
         abort(404, description="Land not found or access denied.")
+    return land
 
-    # --- Placeholder: Crop Suggestion Logic ---
-    suggestions = []
-    latest_reading = query_db("""
-        SELECT timestamp, nitrogen_value, phosphorus_value, potassium_value
+def latest_npk_reading(land_id):
+    return query_db("""
+        SELECT id, timestamp, source, nitrogen_value, phosphorus_value, potassium_value, ph_value
         FROM soil_readings
-        WHERE land_id = ? AND (nitrogen_value IS NOT NULL OR phosphorus_value IS NOT NULL OR potassium_value IS NOT NULL)
+        WHERE land_id = ? AND quality_flag IS NULL
+          AND (nitrogen_value IS NOT NULL OR phosphorus_value IS NOT NULL OR potassium_value IS NOT NULL)
         ORDER BY timestamp DESC LIMIT 1
         """, (land_id,), one=True)
-    latest_reading_ts = latest_reading['timestamp'] if latest_reading else "N/A"
-    current_n = latest_reading.get('nitrogen_value',0)
-    current_p = latest_reading.get('phosphorus_value',0)
-    current_k = latest_reading.get('potassium_value',0)
-    ph_value = latest_reading.get('ph_value',0.7)
 
-    # score = max(0.5, min(0.99, round(score, 2)))
-    crop = Crop_Suggestion(GEN_API_KEY).execute(location="Maharashtra", WEATHER_API_KEY=WEATHER_API_KEY, soil_data={
-    "Nitrogen" : current_n,
-    "Phosphorus" : current_p,
-    "Pottasium" : current_k,
-    "pH" : ph_value
-    })
+def latest_npk_reading_with_crop(land_id):
+    return query_db("""
+        SELECT sr.id, sr.timestamp, sr.source, sr.nitrogen_value, sr.phosphorus_value, sr.potassium_value, sr.ph_value,
+               p.crop_id, c.crop_name, c.optimal_ph_min, c.optimal_ph_max, c.optimal_nitrogen_range,
+               c.optimal_phosphorus_range, c.optimal_potassium_range, c.optimal_moisture_range
+        FROM soil_readings sr
+        LEFT JOIN plantings p ON p.land_id = sr.land_id AND p.status = 'active'
+        LEFT JOIN crops c ON c.id = p.crop_id
+        WHERE sr.land_id = ? AND sr.quality_flag IS NULL
+          AND (sr.nitrogen_value IS NOT NULL OR sr.phosphorus_value IS NOT NULL OR sr.potassium_value IS NOT NULL)
+        ORDER BY sr.timestamp DESC
+        LIMIT 1
+    """, (land_id,), one=True)
 
+def crop_suggestions_key(land_id, latest_reading):
+    """Single-flight key: the suggestion depends on the land's latest clean NPK reading."""
+    return ('crop-suggestions', land_id, (latest_reading or {}).get('id'))
+
+def fertilizer_recommendations_key(land_id, latest_reading):
+    """Single-flight key: the recommendation also depends on the crop planted on the land."""
+    reading = latest_reading or {}
+    return ('fertilizer-recommendations', land_id, reading.get('id'), reading.get('crop_id'))
+
+def soil_data_from_reading(reading, default_ph):
+    """Agent input dict built from a soil reading row (missing values fall back to defaults)."""
+    reading = reading or {}
+    def value(key, default):
+        return reading.get(key) if reading.get(key) is not None else default
+    return {
+        "Nitrogen" : value('nitrogen_value', 0),
+        "Phosphorus" : value('phosphorus_value', 0),
+        "Pottasium" : value('potassium_value', 0),
+        "pH" : value('ph_value', default_ph)
+    }
+
+def crop_suggestions_payload(land_id, latest_reading, soil_data, crop):
+    latest_reading_ts = latest_reading['timestamp'] if latest_reading else "N/A"
+    suggestions = []
     suggestions.append({
         "crop": { # Nest crop details
             "id": 1,
@@ -1261,61 +1779,27 @@ def get_crop_suggestions(land_id):
              "ph_match": crop.get('Match'),
              # Add dummy NPK match details if needed
              "npk_match": crop.get('Match'),
-                 "Nitrogen" : current_n,
-    "Phosphorus" : current_p,
-    "Pottasium" : current_k,
-    "pH" : ph_value
+             "Nitrogen" : soil_data["Nitrogen"],
+             "Phosphorus" : soil_data["Phosphorus"],
+             "Pottasium" : soil_data["Pottasium"],
+             "pH" : soil_data["pH"]
          }
     })
 
     # Sort suggestions by score descending
     suggestions.sort(key=lambda x: x['suitability_score'], reverse=True)
-    # --- End Placeholder ---
 
-    return jsonify({
+    return {
         "based_on_reading_ts": latest_reading_ts,
+        "based_on_reading_source": latest_reading['source'] if latest_reading else None,
         "land_id": land_id,
         "suggestions": suggestions
-    }), 200
-
-@app.route('/api/v1/lands/<int:land_id>/fertilizer-recommendations', methods=['GET'])
-@auth_required
-def get_fertilizer_recommendations(land_id):
-     # Verify ownership
-    land = query_db("SELECT l.id, l.soil_type_detected, l.soil_type_manual, f.user_id FROM lands l JOIN farms f ON l.farm_id = f.id WHERE l.id = ?", (land_id,), one=True)
-    if not land or land['user_id'] != g.user['id']:
-        abort(404, description="Land not found or access denied.")
-
-    # --- Placeholder: Crop Suggestion Logic ---
-    suggestions = []
-    latest_reading = query_db("""
-        SELECT sr.timestamp, sr.nitrogen_value, sr.phosphorus_value, sr.potassium_value, sr.ph_value,
-               p.crop_id, c.crop_name
-        FROM soil_readings sr
-        LEFT JOIN plantings p ON p.land_id = sr.land_id AND p.status = 'active'
-        LEFT JOIN crops c ON c.id = p.crop_id
-        WHERE sr.land_id = ?
-          AND (sr.nitrogen_value IS NOT NULL OR sr.phosphorus_value IS NOT NULL OR sr.potassium_value IS NOT NULL)
-        ORDER BY sr.timestamp DESC
-        LIMIT 1
-    """, (land_id,), one=True)
+    }
 
+def fertilizer_recommendations_payload(land_id, latest_reading, fertilizer):
     latest_reading_ts = latest_reading['timestamp'] if latest_reading else "N/A"
-    current_n = latest_reading.get('nitrogen_value', 0)
-    current_p = latest_reading.get('phosphorus_value', 0)
-    current_k = latest_reading.get('potassium_value', 0)
-    ph_value = latest_reading.get('ph_value', 7.0)
-    crop_id = latest_reading.get('crop_id', None)
-    crop_name = latest_reading.get('crop_name', "Unknown")
-
-
-    # score = max(0.5, min(0.99, round(score, 2)))
-    fertilizer = FertilizerRecommender(GEN_API_KEY).execute(crop=crop_name, location="Maharashtra", WEATHER_API_KEY=WEATHER_API_KEY, soil_data={
-    "Nitrogen" : current_n,
-    "Phosphorus" : current_p,
-    "Pottasium" : current_k,
-    "pH" : ph_value
-    })
+    # Severity from the same crop thresholds the alert engine applies to the reading
+    fired = alerts.evaluate(latest_reading, alerts.rules_for(latest_reading)) if latest_reading else []
     dummy_recommendations = []
     dummy_recommendations.append({
          # "id": None, # Would get ID if persisted in `recommendations` table
@@ -1326,15 +1810,148 @@ def get_fertilizer_recommendations(land_id):
          "amount" : fertilizer['Amount'],
          "price" : fertilizer["Price"],
          "buyat" : fertilizer['Buy at'],
-         "severity": random.choice(["low", "medium"]), # Dummy severity
+         "severity": alerts.highest_severity(fired),
     })
-    # --- End Placeholder ---
-
-    return jsonify({
+    return {
         "based_on_reading_ts": latest_reading_ts,
+        "based_on_reading_source": latest_reading['source'] if latest_reading else None,
         "land_id": land_id,
         "recommendations": dummy_recommendations
-    }), 200
+    }
+
+@app.route('/api/v1/lands/<int:land_id>/crop-suggestions', methods=['GET'])
+@auth_required
+def get_crop_suggestions(land_id):
+     # Verify ownership
+    land = land_for_recommendations(land_id, g.user['id'])
+    return jsonify(crop_suggestions_for(land, latest_npk_reading(land_id))), 200
+
+@app.route('/api/v1/lands/<int:land_id>/fertilizer-recommendations', methods=['GET'])
+@auth_required
+def get_fertilizer_recommendations(land_id):
+     # Verify ownership
+    land = land_for_recommendations(land_id, g.user['id'])
+    return jsonify(fertilizer_recommendations_for(land, latest_npk_reading_with_crop(land_id))), 200
+
+def crop_suggestions_for(land, latest_reading):
+    """
+    The stored suggestion if it is still fresh (precompute.py), else computed now (once for all
+    identical requests in flight) and stored for the next request.
+    """
+    land_id = land['id']
+    stored = stored_recommendation(land_id, precompute.CROP_SUGGESTION, latest_reading)
+    if stored is not None:
+        return stored
+
+    # --- Placeholder: Crop Suggestion Logic ---
+    soil_data = soil_data_from_reading(latest_reading, default_ph=0.7)
+
+    # score = max(0.5, min(0.99, round(score, 2)))
+    def compute():
+        crop = provider.shared(Crop_Suggestion, GEN_API_KEY).execute(location="Maharashtra", WEATHER_API_KEY=WEATHER_API_KEY, soil_data=dict(soil_data))
+        payload = crop_suggestions_payload(land_id, latest_reading, soil_data, crop)
+        return store_recommendation(land['user_id'], land_id, precompute.CROP_SUGGESTION, latest_reading, payload)
+    # --- End Placeholder ---
+
+    # Identical requests arriving while this one computes wait for its result
+    return singleflight.crop_suggestions.do(crop_suggestions_key(land_id, latest_reading), compute)
+
+def fertilizer_recommendations_for(land, latest_reading):
+    """Like crop_suggestions_for, for the crop planted on the land."""
+    land_id = land['id']
+    stored = stored_recommendation(land_id, precompute.FERTILIZER, latest_reading)
+    if stored is not None:
+        return stored
+
+    soil_data = soil_data_from_reading(latest_reading, default_ph=7.0)
+    crop_name = (latest_reading or {}).get('crop_name') or "Unknown"
+
+    def compute():
+        fertilizer = provider.shared(FertilizerRecommender, GEN_API_KEY).execute(crop=crop_name, location="Maharashtra", WEATHER_API_KEY=WEATHER_API_KEY, soil_data=soil_data)
+        payload = fertilizer_recommendations_payload(land_id, latest_reading, fertilizer)
+        return store_recommendation(land['user_id'], land_id, precompute.FERTILIZER, latest_reading, payload)
+
+    return singleflight.fertilizer_recommendations.do(fertilizer_recommendations_key(land_id, latest_reading), compute)
+
+def stored_recommendation(land_id, rec_type, latest_reading):
+    """The land's stored API response of this type if it was computed from latest_reading and is fresh, else None."""
+    if not latest_reading:
+        return None
+    stored = query_db(precompute.STORED_SQL,
+                      (f'-{precompute.RECOMMENDATION_MAX_AGE_SECONDS} seconds', land_id, rec_type), one=True)
+    return json.loads(stored['payload']) if precompute.is_fresh(stored, latest_reading) else None
+
+def store_recommendation(user_id, land_id, rec_type, latest_reading, payload):
+    """Keep a computed API response as the land's row of this type in `recommendations`; returns the payload."""
+    if latest_reading:
+        title, details, reasoning, severity = precompute.feed_fields(rec_type, payload)
+        execute_db(precompute.UPSERT_SQL, (user_id, land_id, rec_type, title, details, reasoning,
+                                           latest_reading.get('crop_id'), severity, latest_reading['id'],
+                                           app.json.dumps(payload)))
+    return payload
+
+def recommendations_stale(land_id, reading):
+    """Whether the land's stored crop suggestion or fertilizer recommendation would not answer for this reading."""
+    stored = {row['recommendation_type']: row for row in query_db(
+        precompute.LAND_STORED_SQL, (f'-{precompute.RECOMMENDATION_MAX_AGE_SECONDS} seconds', land_id))}
+    return any(precompute.needs_refresh(stored.get(rec_type), reading)
+               for rec_type in (precompute.CROP_SUGGESTION, precompute.FERTILIZER))
+
+def precompute_recommendations(land_id):
+    """Bring a land's stored crop suggestion and fertilizer recommendation up to date (precompute.py thread)."""
+    with app.app_context():
+        g.metrics_route = 'precompute_recommendations'
+        land = query_db("SELECT l.id, f.user_id FROM lands l JOIN farms f ON l.farm_id = f.id WHERE l.id = ?", (land_id,), one=True)
+        if not land:
+            return
+        crop_suggestions_for(land, latest_npk_reading(land_id))
+        fertilizer_recommendations_for(land, latest_npk_reading_with_crop(land_id))
+
+recommendation_precomputer = precompute.Precomputer(precompute_recommendations)
+
+def fetch_recommendations_page(user_id, limit, offset, rec_type=None, is_read=None, land_id=None, with_total=True):
+    # Base query
+    sql_base = """
+        SELECT r.id, r.user_id, r.land_id, r.planting_id, r.recommendation_type, r.recommendation_date,
+               r.title, r.details, r.reasoning, r.related_crop_id, r.related_fertilizer_id, r.is_read,
+               r.is_archived, r.created_at, r.updated_at, r.alert_key, r.severity, r.based_on_reading_id,
+               l.land_name AS related_land_name, f.farm_name AS related_farm_name
+        FROM recommendations r
+        LEFT JOIN lands l ON r.land_id = l.id
+        LEFT JOIN farms f ON l.farm_id = f.id
+        WHERE r.user_id = ? AND r.is_archived = 0
+    """
+    count_base = "SELECT COUNT(*) AS count FROM recommendations r WHERE r.user_id = ? AND r.is_archived = 0"
+    params = [user_id]
+    count_params = [user_id]
+
+    # Filters
+    if rec_type:
+        sql_base += " AND r.recommendation_type = ?"
+        count_base += " AND r.recommendation_type = ?"
+        params.append(rec_type)
+        count_params.append(rec_type)
+
+    if is_read is not None:
+        is_read_val = 1 if is_read else 0
+        sql_base += " AND r.is_read = ?"
+        count_base += " AND r.is_read = ?"
+        params.append(is_read_val)
+        count_params.append(is_read_val)
+
+    if land_id:
+        sql_base += " AND r.land_id = ?"
+        count_base += " AND r.land_id = ?"
+        params.append(land_id)
+        count_params.append(land_id)
+
+    # Final query
+    sql_base += " ORDER BY r.recommendation_date DESC, r.created_at DESC LIMIT ? OFFSET ?"
+    params.extend([limit, offset])
+
+    recommendations = query_db(sql_base, tuple(params))
+    total = query_db(count_base, tuple(count_params), one=True)['count'] if with_total else None
+    return recommendations, total
 
 @app.route('/api/v1/recommendations', methods=['GET'])
 @auth_required
@@ -1352,46 +1969,12 @@ def get_recommendations():
         if is_read_filter and is_read_filter.lower() not in ['true', 'false']:
             return jsonify({"error": "Invalid is_read parameter"}), 400
 
-        # Base query
-        sql_base = """
-            SELECT r.*, l.land_name AS related_land_name, f.farm_name AS related_farm_name
-            FROM recommendations r
-            LEFT JOIN lands l ON r.land_id = l.id
-            LEFT JOIN farms f ON l.farm_id = f.id
-            WHERE r.user_id = ? AND r.is_archived = 0
-        """
-        count_base = "SELECT COUNT(*) AS count FROM recommendations r WHERE r.user_id = ? AND r.is_archived = 0"
-        params = [g.user['id']]
-        count_params = [g.user['id']]
-
-        # Filters
-        if rec_type:
-            sql_base += " AND r.recommendation_type = ?"
-            count_base += " AND r.recommendation_type = ?"
-            params.append(rec_type)
-            count_params.append(rec_type)
-
+        is_read = None
         if is_read_filter is not None:
-            is_read_val = 1 if is_read_filter.lower() == 'true' else 0
-            sql_base += " AND r.is_read = ?"
-            count_base += " AND r.is_read = ?"
-            params.append(is_read_val)
-            count_params.append(is_read_val)
-
-        if land_id:
-            sql_base += " AND r.land_id = ?"
-            count_base += " AND r.land_id = ?"
-            params.append(land_id)
-            count_params.append(land_id)
-
-        # Final query
-        sql_base += " ORDER BY r.recommendation_date DESC, r.created_at DESC LIMIT ? OFFSET ?"
-        params.extend([limit, offset])
+            is_read = is_read_filter.lower() == 'true'
 
-        recommendations = query_db(sql_base, tuple(params))
-        total = query_db(count_base, tuple(count_params), one=True)['count']
-
-        return jsonify({"recommendations": recommendations, "total": total}), 200
+        recommendations, total = fetch_recommendations_page(g.user['id'], limit, offset, rec_type, is_read, land_id)
+        return api_response({"recommendations": encoding.project(recommendations, requested_fields()), "total": total}), 200
 
     except Exception as e:
         logging.error(f"Error fetching recommendations: {e}", exc_info=True)
@@ -1442,26 +2025,250 @@ def update_recommendation_status(recommendation_id):
 
 
 # 10. Reference Data (Generally public or requires basic auth)
+# Reference catalogs rarely change and have no write endpoints, so they are read once per process.
+# serve.py loads them before forking so workers share one copy.
+REFERENCE_CATALOG_SQL = {
+    'crops': "SELECT id, crop_name, description, image_url, optimal_ph_min, optimal_ph_max FROM crops ORDER BY crop_name",
+    'diseases': "SELECT id, disease_name, description, symptoms, image_url FROM diseases ORDER BY disease_name",
+    'fertilizers': """SELECT id, fertilizer_name, type, description,
+                          n_content_percent AS n_percentage, p_content_percent AS p_percentage, k_content_percent AS k_percentage
+                   FROM fertilizers ORDER BY fertilizer_name""",
+}
+reference_catalogs = {}
+
+def load_reference_catalogs(db_file=None):
+    """(Re)load every reference catalog with a short-lived connection; safe to call outside a request."""
+    conn = sqlite3.connect(db_file or app.config['DATABASE'])
+    conn.row_factory = dict_factory
+    try:
+        for name, sql in REFERENCE_CATALOG_SQL.items():
+            reference_catalogs[name] = conn.execute(sql).fetchall()
+    finally:
+        conn.close()
+    return reference_catalogs
+
+def get_reference_catalog(name):
+    if name not in reference_catalogs:
+        reference_catalogs[name] = query_db(REFERENCE_CATALOG_SQL[name])
+    return reference_catalogs[name]
+
 @app.route('/api/v1/crops', methods=['GET'])
 # @auth_required # Decide if this needs auth
 def list_crops():
-    # Add caching here if data doesn't change often
-    crops = query_db("SELECT id, crop_name, description, image_url, optimal_ph_min, optimal_ph_max FROM crops ORDER BY crop_name")
-    return jsonify(crops if crops else []), 200
+    crops = get_reference_catalog('crops')
+    return api_response(encoding.project(crops or [], requested_fields())), 200
 
 @app.route('/api/v1/diseases', methods=['GET'])
 # @auth_required # Decide if this needs auth
 def list_diseases():
-    # Add caching
-    diseases = query_db("SELECT id, disease_name, description, symptoms, image_url FROM diseases ORDER BY disease_name")
-    return jsonify(diseases if diseases else []), 200
+    diseases = get_reference_catalog('diseases')
+    return api_response(encoding.project(diseases or [], requested_fields())), 200
 
 @app.route('/api/v1/fertilizers', methods=['GET'])
 # @auth_required # Decide if this needs auth
 def list_fertilizers():
-    # Add caching
-    fertilizers = query_db("SELECT id, fertilizer_name, type, description, n_percentage, p_percentage, k_percentage FROM fertilizers ORDER BY fertilizer_name")
-    return jsonify(fertilizers if fertilizers else []), 200
+    fertilizers = get_reference_catalog('fertilizers')
+    return api_response(encoding.project(fertilizers or [], requested_fields())), 200
+
+# 11. Screen Aggregates (one round trip per mobile screen)
+@app.route('/api/v1/dashboard', methods=['GET'])
+@auth_required
+def get_dashboard():
+    farms_limit = min(request.args.get('farms_limit', 5, type=int), 100)
+    courses_limit = min(request.args.get('courses_limit', 5, type=int), 100)
+    alerts_limit = min(request.args.get('alerts_limit', 3, type=int), 100)
+    user_id = g.user['id']
+
+    with read_transaction():
+        user = fetch_user_profile(user_id)
+        if not user:
+            abort(404, description="User not found.")
+        farms, farms_total = fetch_farms_page(user_id, farms_limit, 0)
+        courses = fetch_courses_page(courses_limit, 0)
+        recommendations = []
+        if farms:
+            recommendations, _ = fetch_recommendations_page(user_id, alerts_limit, 0, rec_type='alert', is_read=False, with_total=False)
+
+    return jsonify({
+        "user": user,
+        "farms": farms,
+        "farms_total": farms_total,
+        "courses": courses,
+        "recommendations": recommendations
+    }), 200
+
+@app.route('/api/v1/lands/<int:land_id>/overview', methods=['GET'])
+@auth_required
+def get_land_overview(land_id):
+    alerts_limit = min(request.args.get('alerts_limit', 3, type=int), 100)
+    user_id = g.user['id']
+
+    with read_transaction():
+        land = fetch_land_detail(land_id, user_id)
+        if not land:
+            abort(404, description="Land not found or access denied.")
+        user = fetch_user_profile(user_id)
+        alerts, _ = fetch_recommendations_page(user_id, alerts_limit, 0, rec_type='alert', land_id=land_id, with_total=False)
+
+    return jsonify({
+        "user": user,
+        "land": land,
+        "recommendations": alerts
+    }), 200
+
+# 12. Exports (full-history downloads, streamed)
+def validated_date_arg(name):
+    """ISO 8601 date/datetime query argument, or None; aborts 400 on a malformed value."""
+    value = request.args.get(name)
+    if value:
+        try:
+            datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            abort(400, description=f"Invalid {name}. Use ISO 8601 format (e.g., YYYY-MM-DD or YYYY-MM-DDTHH:MM:SSZ).")
+    return value
+
+def export_scope_filters(user_id, farm_column, land_column):
+    """WHERE fragments and params for the land_id/farm_id filters, after checking the caller owns them."""
+    clauses, params = [], []
+    land_id = request.args.get('land_id', type=int)
+    farm_id = request.args.get('farm_id', type=int)
+    if land_id:
+        owner_check = query_db("SELECT l.id, f.user_id FROM lands l JOIN farms f ON l.farm_id = f.id WHERE l.id = ?", (land_id,), one=True)
+        if not owner_check or owner_check['user_id'] != user_id:
+            abort(404, description="Land not found or access denied.")
+        clauses.append(f"{land_column} = ?")
+        params.append(land_id)
+    if farm_id:
+        if not query_db("SELECT id FROM farms WHERE id = ? AND user_id = ?", (farm_id, user_id), one=True):
+            abort(404, description="Farm not found or access denied.")
+        clauses.append(f"{farm_column} = ?")
+        params.append(farm_id)
+    return clauses, params
+
+def stream_export(sql, args, columns, filename):
+    """
+    Stream the rows of `sql` in the format requested by ?format= (csv, ndjson or parquet) with
+    chunked transfer encoding. The export runs on its own connection and cursor, fetching
+    EXPORT_CHUNK_ROWS at a time, so memory stays flat however many rows match.
+    """
+    export_format = request.args.get('format', 'csv')
+    if export_format not in exports.available_formats():
+        abort(400, description=f"Invalid format. Use one of: {', '.join(exports.available_formats())}.")
+    mimetype, extension = exports.FORMATS[export_format]
+    route = _metrics_route()
+
+    conn = sqlite3.connect(app.config['DATABASE'])
+    try:
+        cursor = conn.execute(sql, args)
+    except sqlite3.Error as e:
+        conn.close()
+        print(f"Database query error: {e}\nQuery: {sql}\nArgs: {args}")
+        abort(500, description=f"Database error: {e}")
+
+    if export_format == 'csv':
+        chunks = exports.csv_chunks(cursor, columns)
+    elif export_format == 'ndjson':
+        chunks = exports.ndjson_chunks(cursor, columns, app.json.dumpb)
+    else:
+        chunks = exports.parquet_chunks(cursor, columns)
+
+    def generate():
+        start = time.perf_counter()
+        try:
+            yield from chunks
+        finally:
+            cursor.close()
+            conn.close()
+            metrics.observe_query(route, 'export', sql, args, time.perf_counter() - start)
+
+    response = Response(generate(), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}.{extension}"'
+    return response
+
+@app.route('/api/v1/exports/soil-readings', methods=['GET'])
+@auth_required
+def export_soil_readings():
+    user_id = g.user['id']
+    start_date = validated_date_arg('start_date')
+    end_date = validated_date_arg('end_date')
+    clauses, params = export_scope_filters(user_id, 'r.farm_id', 'r.land_id')
+    if start_date:
+        clauses.append("r.timestamp >= ?")
+        params.append(start_date)
+    if end_date:
+        clauses.append("r.timestamp <= ?")
+        params.append(end_date)
+
+    sql = f"""
+        SELECT r.id, r.timestamp, r.received_at, r.farm_id, f.farm_name, r.land_id, l.land_name,
+               r.device_id, hd.hardware_unique_id, r.ph_value, r.nitrogen_value, r.phosphorus_value,
+               r.potassium_value, r.moisture_value, r.temperature_value, r.humidity_value, r.source
+        FROM soil_readings r
+        JOIN farms f ON r.farm_id = f.id
+        JOIN lands l ON r.land_id = l.id
+        LEFT JOIN hardware_devices hd ON r.device_id = hd.id
+        WHERE f.user_id = ? {''.join(' AND ' + c for c in clauses)}
+        ORDER BY r.land_id, r.timestamp
+    """
+    return stream_export(sql, (user_id, *params), exports.SOIL_READING_COLUMNS, "soil_readings")
+
+@app.route('/api/v1/exports/diagnosis-logs', methods=['GET'])
+@auth_required
+def export_diagnosis_logs():
+    user_id = g.user['id']
+    start_date = validated_date_arg('start_date')
+    end_date = validated_date_arg('end_date')
+    clauses, params = export_scope_filters(user_id, 'land.farm_id', 'dl.land_id')
+    if start_date:
+        clauses.append("dl.scan_timestamp >= ?")
+        params.append(start_date)
+    if end_date:
+        clauses.append("dl.scan_timestamp <= ?")
+        params.append(end_date)
+
+    sql = f"""
+        SELECT dl.id, dl.scan_timestamp, land.farm_id, dl.land_id, land.land_name, dl.planting_id,
+               dl.processing_status, dl.detected_disease_id, d.disease_name, dl.confidence_score,
+               dl.image_storage_url, dl.notes
+        FROM diagnosis_logs dl
+        LEFT JOIN diseases d ON dl.detected_disease_id = d.id
+        LEFT JOIN lands land ON dl.land_id = land.id
+        WHERE dl.user_id = ? {''.join(' AND ' + c for c in clauses)}
+        ORDER BY dl.scan_timestamp
+    """
+    return stream_export(sql, (user_id, *params), exports.DIAGNOSIS_LOG_COLUMNS, "diagnosis_logs")
+
+# 13. Admin / Diagnostics
+@app.route('/api/v1/admin/profile/sample', methods=['POST'])
+@admin_required
+def sample_profile():
+    # Blocks this request for `seconds` while every other thread in the worker is sampled
+    seconds = request.args.get('seconds', 10, type=float)
+    interval_ms = request.args.get('interval_ms', 10, type=float)
+    if seconds <= 0 or seconds > profiler.MAX_SAMPLE_SECONDS:
+        abort(400, description=f"seconds must be between 0 and {profiler.MAX_SAMPLE_SECONDS}.")
+    try:
+        collapsed = profiler.sample_stacks(seconds, interval_ms / 1000.0,
+                                           include_idle=request.args.get('include_idle') == 'true')
+    except profiler.ProfilerBusy as e:
+        abort(409, description=str(e))
+    response = Response(collapsed, mimetype='text/plain')
+    response.headers['Content-Disposition'] = f"attachment; filename=worker-{os.getpid()}.collapsed"
+    return response
+
+@app.route('/api/v1/admin/profile/requests/<string:profile_id>', methods=['GET'])
+@admin_required
+def get_request_profile(profile_id):
+    path = profiler.profile_path(profile_id)
+    if not path:
+        abort(404, description="Profile not found.")
+    if request.args.get('format') == 'raw':
+        with open(path, 'rb') as f:
+            data = f.read()
+        response = Response(data, mimetype='application/octet-stream')
+        response.headers['Content-Disposition'] = f"attachment; filename={profile_id}"
+        return response
+    return Response(profiler.profile_summary(path), mimetype='text/plain')
 
 # --- Error Handlers ---
 @app.errorhandler(400)
@@ -1494,6 +2301,13 @@ def conflict(error):
     response.status_code = 409
     return response
 
+@app.errorhandler(503)
+def service_unavailable(error):
+    response = jsonify({'error': 'Service Unavailable', 'message': error.description})
+    response.status_code = 503
+    response.headers['Retry-After'] = '1'
+    return response
+
 @app.errorhandler(500)
 def internal_server_error(error):
     response = jsonify({'error': 'Internal Server Error', 'message': error.description})
@@ -1509,73 +2323,12 @@ if __name__ == '__main__':
         print("Running the `create_db.py` script first to initialize the database schema.")
         createdb()
 
-    # --- Add default/dummy data only if DB is empty ---
-    # Connect once to check and potentially add data
-    needs_commit = False
-    try:
-        conn = sqlite3.connect(DATABASE)
-        conn.row_factory = dict_factory
-        conn.execute("PRAGMA foreign_keys = ON;")
-        cursor = conn.cursor()
-
-        # Check for users
-        cursor.execute("SELECT COUNT(*) as count FROM users")
-        user_count = cursor.fetchone()['count']
-        if user_count == 0:
-            print("Adding dummy user (id=1, email=test@example.com, pass=password)")
-            # Use the same hashing as the register endpoint
-            hashed_password = generate_password_hash('password')
-            cursor.execute("INSERT INTO users (id, name, email, password_hash) VALUES (?, ?, ?, ?)",
-                        (1, 'Test User', 'test@example.com', hashed_password))
-            needs_commit = True
-
-        # Check for crops
-        cursor.execute("SELECT COUNT(*) as count FROM crops")
-        crop_count = cursor.fetchone()['count']
-        if crop_count == 0:
-            print("Adding dummy crops (Corn, Tomato)")
-            cursor.execute("INSERT INTO crops (crop_name, optimal_ph_min, optimal_ph_max) VALUES (?, ?, ?)", ('Corn', 5.8, 7.0))
-            cursor.execute("INSERT INTO crops (crop_name, optimal_ph_min, optimal_ph_max) VALUES (?, ?, ?)", ('Tomato', 6.0, 6.8))
-            needs_commit = True
-
-        # Check for diseases
-        cursor.execute("SELECT COUNT(*) as count FROM diseases")
-        disease_count = cursor.fetchone()['count']
-        if disease_count == 0:
-            print("Adding dummy disease (Leaf Blight)")
-            disease_id = cursor.execute("INSERT INTO diseases (disease_name, description, symptoms) VALUES (?,?,?)",
-                        ('Leaf Blight', 'Fungal disease causing spots on leaves', 'Yellowish or brown spots, often with concentric rings.')).lastrowid
-            # Add a dummy remedy
-            cursor.execute("INSERT INTO remedies (disease_id, remedy_type, description) VALUES (?, ?, ?)",
-                           (disease_id, 'fungicide', 'Apply a broad-spectrum fungicide according to label instructions.'))
-            needs_commit = True
-
-        # Check for fertilizers
-        cursor.execute("SELECT COUNT(*) as count FROM fertilizers")
-        fertilizer_count = cursor.fetchone()['count']
-        if fertilizer_count == 0:
-             print("Adding dummy fertilizers")
-             cursor.execute("INSERT INTO fertilizers (fertilizer_name, type, n_percentage, p_percentage, k_percentage) VALUES (?, ?, ?, ?, ?)",
-                            ('Balanced NPK 10-10-10', 'npk_compound', 10, 10, 10))
-             cursor.execute("INSERT INTO fertilizers (fertilizer_name, type, n_percentage) VALUES (?, ?, ?)",
-                            ('Urea', 'nitrogen_source', 46))
-             needs_commit = True
-
-        if needs_commit:
-            conn.commit()
-            print("Dummy data added.")
-
-    except sqlite3.Error as e:
-        print(f"Error during initial data check/add: {e}")
-    finally:
-        if conn:
-            conn.close()
-    # --- End initial data add ---
+    # Dummy/reference rows are no longer added on every start; run `python create_db.py --seed` once instead.
 
     print(f"Starting Flask app on http://127.0.0.1:5000")
     print("Using SECRET_KEY: " + ("Set from environment variable." if os.environ.get('SECRET_KEY') else f"'{SECRET_KEY}' (Development Only!)"))
-    print("Auth: Use 'Bearer demo-token-user-<user_id>' (e.g., Bearer demo-token-user-1)")
-    print("Device Ingest Auth: Use 'X-Device-Key: device-key-<something>'")
+    print("Auth: POST /api/v1/auth/login for an access and refresh token, send 'Authorization: Bearer <access_token>', renew via POST /api/v1/auth/refresh")
+    print("Device Ingest Auth: send 'X-Device-Key: dk_...' with the key returned by POST /api/v1/hardware_devices (rotate via POST /api/v1/hardware_devices/<id>/api-key)")
     # Use debug=True ONLY for development. It enables auto-reloading and detailed error pages.
-    # Set debug=False and use a production WSGI server (like Gunicorn or uWSGI) in production.
+    # In production use serve.py (Gunicorn with a preloaded app) instead of this dev server.
     app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
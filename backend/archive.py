@@ -0,0 +1,224 @@
+"""
+Cold-storage tier for soil readings.
+
+The archive job moves readings older than a horizon out of SQLite into zstd-compressed
+Arrow IPC files, one per farm and month:
+
+    ARCHIVE_DIR/soil_readings/farm_id=<id>/month=<YYYY-MM>/part-<first id>-<last id>.arrow
+
+Each file is written and renamed into place before the same transaction records it in
+archived_reading_partitions (one row per land with its row count and timestamp range) and
+deletes the rows from soil_readings. A crash part-way leaves either the hot rows or a
+recorded file, never both or neither; an unrecorded file is simply overwritten next run.
+
+get_soil_readings reads the manifest to find the partitions a query touches, memory-maps
+them and merges them with the hot rows. Needs the optional pyarrow package.
+
+Run from the backend directory (e.g. nightly from cron):
+    python archive.py --older-than-days 180
+"""
+import os
+import sys
+import heapq
+import sqlite3
+import logging
+import argparse
+import datetime
+import itertools
+from functools import lru_cache
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.compute
+except ImportError:
+    pyarrow = None
+
+# --- Configuration ---
+ARCHIVE_DIR = os.environ.get('ARCHIVE_DIR', 'archive')
+ARCHIVE_AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS', '180'))
+# Decoded partitions kept in memory per worker; files never change once recorded
+ARCHIVE_CACHE_PARTITIONS = int(os.environ.get('ARCHIVE_CACHE_PARTITIONS', '32'))
+
+logger = logging.getLogger('kisansarthi.archive')
+
+# soil_readings columns, in table order, with their Arrow types
+READING_COLUMNS = (
+    ('id', 'int'), ('device_id', 'int'), ('land_id', 'int'), ('farm_id', 'int'),
+    ('timestamp', 'str'), ('received_at', 'str'),
+    ('ph_value', 'float'), ('nitrogen_value', 'float'), ('phosphorus_value', 'float'),
+    ('potassium_value', 'float'), ('moisture_value', 'float'), ('temperature_value', 'float'),
+    ('humidity_value', 'float'), ('quality_flag', 'str'), ('source', 'str'),
+)
+
+PARTITIONS_SQL = """
+    SELECT path, row_count, min_timestamp, max_timestamp
+    FROM archived_reading_partitions
+    WHERE land_id = ? AND (? IS NULL OR max_timestamp >= ?) AND (? IS NULL OR min_timestamp <= ?)
+    ORDER BY max_timestamp DESC
+"""
+
+
+def partitions_query_args(land_id, start_date=None, end_date=None):
+    return (land_id, start_date, start_date, end_date, end_date)
+
+
+def reading_schema():
+    types = {'int': pyarrow.int64(), 'float': pyarrow.float64(), 'str': pyarrow.string()}
+    return pyarrow.schema([(name, types[kind]) for name, kind in READING_COLUMNS])
+
+
+# --- Archiving ---
+def _next_month(month):
+    year, mon = int(month[:4]), int(month[5:7])
+    return f"{year + mon // 12:04d}-{mon % 12 + 1:02d}"
+
+
+def _write_partition(path, rows):
+    schema = reading_schema()
+    arrays = [pyarrow.array(values, type=field.type) for field, values in zip(schema, zip(*rows))]
+    table = pyarrow.Table.from_arrays(arrays, schema=schema)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    options = pyarrow.ipc.IpcWriteOptions(compression='zstd')
+    with pyarrow.OSFile(tmp_path, 'wb') as sink:
+        with pyarrow.ipc.new_file(sink, schema, options=options) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, path)
+
+
+def archive_readings(db_file, older_than_days=ARCHIVE_AFTER_DAYS, dry_run=False):
+    """
+    Move readings with a timestamp before (today - older_than_days) into archive partitions.
+    Returns [(farm_id, month, rows moved), ...].
+    """
+    if pyarrow is None:
+        raise RuntimeError("pyarrow is required to archive readings (pip install pyarrow).")
+    # Date-only cutoff: compares correctly against both 'YYYY-MM-DD HH:MM:SS' and ISO 'T' timestamps
+    cutoff = (datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=older_than_days)).strftime('%Y-%m-%d')
+    columns = ', '.join(name for name, _ in READING_COLUMNS)
+
+    conn = sqlite3.connect(db_file)
+    conn.execute("PRAGMA foreign_keys = ON;")
+    moved = []
+    try:
+        partitions = conn.execute("""
+            SELECT farm_id, substr(timestamp, 1, 7) AS month, COUNT(*)
+            FROM soil_readings WHERE timestamp < ?
+            GROUP BY farm_id, month ORDER BY farm_id, month
+        """, (cutoff,)).fetchall()
+        for farm_id, month, count in partitions:
+            if dry_run:
+                moved.append((farm_id, month, count))
+                continue
+            rows = conn.execute(f"""
+                SELECT {columns} FROM soil_readings
+                WHERE farm_id = ? AND timestamp >= ? AND timestamp < ? AND timestamp < ?
+                ORDER BY land_id, timestamp
+            """, (farm_id, month, _next_month(month), cutoff)).fetchall()
+            if not rows:
+                continue
+            ids = [row[0] for row in rows]
+            rel_path = os.path.join('soil_readings', f'farm_id={farm_id}', f'month={month}',
+                                    f'part-{min(ids)}-{max(ids)}.arrow')
+            _write_partition(os.path.join(ARCHIVE_DIR, rel_path), rows)
+
+            # Rows are ordered by land_id, so each group is one land's slice of the file
+            manifest = []
+            for land_id, land_rows in itertools.groupby(rows, key=lambda row: row[2]):
+                timestamps = [row[4] for row in land_rows]
+                manifest.append((farm_id, land_id, month, rel_path, len(timestamps), min(timestamps), max(timestamps)))
+            with conn:
+                conn.executemany("""
+                    INSERT INTO archived_reading_partitions
+                        (farm_id, land_id, month, path, row_count, min_timestamp, max_timestamp)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                """, manifest)
+                conn.executemany("DELETE FROM soil_readings WHERE id = ?", ((i,) for i in ids))
+            moved.append((farm_id, month, len(rows)))
+            logger.info("Archived %d readings for farm %s, %s -> %s", len(rows), farm_id, month, rel_path)
+    finally:
+        conn.close()
+    return moved
+
+
+# --- Reading ---
+@lru_cache(maxsize=ARCHIVE_CACHE_PARTITIONS)
+def load_partition(rel_path):
+    """Memory-map an archive file and return it as a pyarrow Table."""
+    source = pyarrow.memory_map(os.path.join(ARCHIVE_DIR, rel_path), 'r')
+    return pyarrow.ipc.open_file(source).read_all()
+
+
+def _matching(table, land_id, start_date, end_date):
+    pc = pyarrow.compute
+    mask = pc.equal(table['land_id'], land_id)
+    if start_date:
+        mask = pc.and_(mask, pc.greater_equal(table['timestamp'], start_date))
+    if end_date:
+        mask = pc.and_(mask, pc.less_equal(table['timestamp'], end_date))
+    return table.filter(mask)
+
+
+def _covers(partition, start_date, end_date):
+    return ((not start_date or partition['min_timestamp'] >= start_date)
+            and (not end_date or partition['max_timestamp'] <= end_date))
+
+
+def count_archived(partitions, land_id, start_date=None, end_date=None):
+    """Archived readings for the land in range; partitions wholly inside the range are counted from the manifest."""
+    total = 0
+    for partition in partitions:
+        if _covers(partition, start_date, end_date):
+            total += partition['row_count']
+        else:
+            total += _matching(load_partition(partition['path']), land_id, start_date, end_date).num_rows
+    return total
+
+
+def newest_archived(partitions, land_id, names, limit, start_date=None, end_date=None):
+    """
+    The `limit` newest archived readings for the land as (timestamp, id, row) tuples, newest first,
+    with `row` holding the `names` columns. `partitions` must be ordered by max_timestamp descending
+    (as PARTITIONS_SQL returns them); partitions that cannot reach the top `limit` are never opened.
+    """
+    collected = []
+    for partition in partitions:
+        if len(collected) >= limit and partition['max_timestamp'] < collected[limit - 1][0]:
+            break
+        table = _matching(load_partition(partition['path']), land_id, start_date, end_date)
+        # Files written before a column existed read back as NULLs for it
+        columns = [table[name].to_pylist() if name in table.column_names else [None] * table.num_rows
+                   for name in names]
+        timestamps = table['timestamp'].to_pylist()
+        ids = table['id'].to_pylist()
+        collected.extend(zip(timestamps, ids, zip(*columns)))
+        collected.sort(key=lambda item: (item[0], item[1]), reverse=True)
+        del collected[limit:]
+    return collected
+
+
+def merge_newest(hot, archived, limit):
+    """Merge two newest-first lists of (timestamp, id, row) and return the first `limit` rows."""
+    merged = heapq.merge(hot, archived, key=lambda item: (item[0], item[1]), reverse=True)
+    return [row for _, _, row in itertools.islice(merged, limit)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move old soil readings into the columnar archive.")
+    parser.add_argument('--db', default=os.environ.get('DATABASE', 'farm_app.db'))
+    parser.add_argument('--older-than-days', type=int, default=ARCHIVE_AFTER_DAYS)
+    parser.add_argument('--dry-run', action='store_true', help="Only report what would be archived")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    try:
+        moved = archive_readings(args.db, args.older_than_days, dry_run=args.dry_run)
+    except RuntimeError as e:
+        sys.exit(str(e))
+    verb = "Would archive" if args.dry_run else "Archived"
+    print(f"{verb} {sum(count for _, _, count in moved)} readings in {len(moved)} farm/month partitions.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,334 @@
+"""
+ASGI entry point.
+
+The I/O-bound recommendation routes are served natively here: they await the weather API
+and Gemini on the event loop, so one process can hold thousands of slow requests without
+pinning a thread each. SQLite work and model inference run briefly on a bounded thread pool.
+The live soil-reading stream (SSE) is served here too, so an open stream holds no thread.
+Identical requests in flight at once share one computation (singleflight.py), and a result
+precomputed after ingestion is served from the database while it is fresh (precompute.py).
+Every other route falls through to the existing Flask app unchanged, each request on a thread
+of its own pool (ASGI_WSGI_THREADS), so slow Flask routes do not queue behind one another.
+
+Run:
+    python asgi.py --workers 4 --limit-concurrency 4000
+or with any ASGI server:
+    uvicorn asgi:application --workers 4
+"""
+import os
+import re
+import time
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+from werkzeug.exceptions import HTTPException
+
+import app as flask_app
+import metrics
+import singleflight
+import precompute
+import live
+from agents.crop_suggestion import Crop_Suggestion
+from agents.fertilizer_recommender import FertilizerRecommender
+from agents.weather_agent import close_async_session
+from agents import provider
+
+# --- Configuration ---
+# Threads for SQLite queries and model inference; requests waiting on the network hold none
+DB_THREADS = int(os.environ.get('ASGI_DB_THREADS', '16'))
+# Threads running the Flask routes that fall through; each request in progress holds one
+WSGI_THREADS = int(os.environ.get('ASGI_WSGI_THREADS', '64'))
+
+
+class ThreadPoolWsgiToAsgi(WsgiToAsgi):
+    """
+    WsgiToAsgi runs every WSGI request on asgiref's single thread-sensitive executor, i.e. one
+    at a time per process; this adapter runs each one on a thread of its own pool instead.
+    """
+
+    def __init__(self, wsgi_application, threads):
+        super().__init__(wsgi_application)
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='asgi-wsgi')
+
+    async def __call__(self, scope, receive, send):
+        await _PooledWsgiInstance(self.wsgi_application, self.executor, self.duplicate_header_limit)(
+            scope, receive, send)
+
+
+class _PooledWsgiInstance(WsgiToAsgiInstance):
+    # The body of WsgiToAsgiInstance.run_wsgi_app, without its thread-sensitive sync_to_async
+    _run_wsgi_app = WsgiToAsgiInstance.run_wsgi_app.__wrapped__
+
+    def __init__(self, wsgi_application, executor, duplicate_header_limit=100):
+        super().__init__(wsgi_application, duplicate_header_limit)
+        self.executor = executor
+
+    async def run_wsgi_app(self, body):
+        await asyncio.get_running_loop().run_in_executor(self.executor, self._run_wsgi_app, body)
+
+
+wsgi_application = ThreadPoolWsgiToAsgi(flask_app.app, WSGI_THREADS)
+
+
+class AsyncRequest:
+    def __init__(self, scope, params):
+        self.scope = scope
+        self.params = params
+        self.method = scope['method']
+        self.headers = {k.decode('latin-1').lower(): v.decode('latin-1') for k, v in scope.get('headers', [])}
+
+
+async def db_call(route, fn, *args):
+    """Run a blocking helper from app.py (query_db and friends) on the DB thread pool inside an app context."""
+    def run():
+        with flask_app.app.app_context():
+            flask_app.g.metrics_route = route
+            return fn(*args)
+    return await asyncio.get_running_loop().run_in_executor(None, run)
+
+
+def authenticate(req):
+    user = flask_app.user_from_auth_header(req.headers.get('authorization'))
+    if not user:
+        flask_app.abort(401, description="Authentication required.")
+    return user
+
+
+# --- Async Routes ---
+async def crop_suggestions(req):
+    land_id = int(req.params[0])
+    user = authenticate(req)
+    route = 'get_crop_suggestions'
+    land = await db_call(route, flask_app.land_for_recommendations, land_id, user['id'])
+    latest_reading = await db_call(route, flask_app.latest_npk_reading, land_id)
+    stored = await db_call(route, flask_app.stored_recommendation, land_id, precompute.CROP_SUGGESTION, latest_reading)
+    if stored is not None:
+        return 200, stored
+    soil_data = flask_app.soil_data_from_reading(latest_reading, default_ph=0.7)
+
+    async def compute():
+        crop = await provider.shared(Crop_Suggestion, flask_app.GEN_API_KEY).aexecute(
+            location="Maharashtra", WEATHER_API_KEY=flask_app.WEATHER_API_KEY, soil_data=dict(soil_data))
+        payload = flask_app.crop_suggestions_payload(land_id, latest_reading, soil_data, crop)
+        return await db_call(route, flask_app.store_recommendation, land['user_id'], land_id,
+                             precompute.CROP_SUGGESTION, latest_reading, payload)
+    key = flask_app.crop_suggestions_key(land_id, latest_reading)
+    return 200, await singleflight.crop_suggestions.ado(key, compute)
+
+
+async def fertilizer_recommendations(req):
+    land_id = int(req.params[0])
+    user = authenticate(req)
+    route = 'get_fertilizer_recommendations'
+    land = await db_call(route, flask_app.land_for_recommendations, land_id, user['id'])
+    latest_reading = await db_call(route, flask_app.latest_npk_reading_with_crop, land_id)
+    stored = await db_call(route, flask_app.stored_recommendation, land_id, precompute.FERTILIZER, latest_reading)
+    if stored is not None:
+        return 200, stored
+    soil_data = flask_app.soil_data_from_reading(latest_reading, default_ph=7.0)
+    crop_name = (latest_reading or {}).get('crop_name') or "Unknown"
+
+    async def compute():
+        fertilizer = await provider.shared(FertilizerRecommender, flask_app.GEN_API_KEY).aexecute(
+            crop=crop_name, location="Maharashtra", WEATHER_API_KEY=flask_app.WEATHER_API_KEY, soil_data=soil_data)
+        payload = flask_app.fertilizer_recommendations_payload(land_id, latest_reading, fertilizer)
+        return await db_call(route, flask_app.store_recommendation, land['user_id'], land_id,
+                             precompute.FERTILIZER, latest_reading, payload)
+    key = flask_app.fertilizer_recommendations_key(land_id, latest_reading)
+    return 200, await singleflight.fertilizer_recommendations.ado(key, compute)
+
+
+# --- Async Streams ---
+async def soil_readings_stream(req):
+    """
+    stream_soil_readings from app.py on the event loop: an open stream holds no thread, only a
+    DB pool thread while it reads new rows. Returns (async iterator of SSE chunks, close callable).
+    """
+    land_id = int(req.params[0])
+    user = authenticate(req)
+    route = 'stream_soil_readings'
+    try:
+        resume_from = int(req.headers['last-event-id'])
+    except (KeyError, ValueError):
+        resume_from = None
+    last_id = await db_call(route, flask_app.live_stream_start, land_id, user['id'], resume_from)
+
+    subscriber = live.soil_readings.open(land_id)
+    if subscriber is None:
+        flask_app.abort(503, description="Too many live streams open. Try again shortly.")
+    loop = asyncio.get_running_loop()
+    woken = asyncio.Event()
+    subscriber.wake = lambda: loop.call_soon_threadsafe(woken.set)
+    db_file = flask_app.app.config['DATABASE']
+
+    async def events():
+        nonlocal last_id
+        yield b'retry: 5000\n\n'
+        deadline = time.monotonic() + live.LIVE_MAX_STREAM_SECONDS
+        # A reconnecting client first gets what it missed
+        more = resume_from is not None
+        while time.monotonic() < deadline:
+            was_woken = more
+            if not more:
+                try:
+                    await asyncio.wait_for(woken.wait(), live.LIVE_RECHECK_SECONDS)
+                    was_woken = True
+                except asyncio.TimeoutError:
+                    pass
+            # As in app.py: the hub only wakes the stream, rows always come from the database
+            woken.clear()
+            live.drain(subscriber)
+            rows = await db_call(route, flask_app.live_readings_after, db_file, land_id, last_id)
+            for reading_id, data in rows:
+                last_id = reading_id
+                yield live.sse_event('reading', data, reading_id)
+            more = len(rows) == live.LIVE_QUEUE_SIZE
+            if not rows and not was_woken:
+                yield b': keepalive\n\n'
+
+    return events(), lambda: live.soil_readings.close(subscriber)
+
+
+# (method, compiled path, handler, route label matching the Flask URL rule for metrics)
+ASYNC_ROUTES = [
+    ('GET', re.compile(r'^/api/v1/lands/(\d+)/crop-suggestions$'), crop_suggestions,
+     '/api/v1/lands/<int:land_id>/crop-suggestions'),
+    ('GET', re.compile(r'^/api/v1/lands/(\d+)/fertilizer-recommendations$'), fertilizer_recommendations,
+     '/api/v1/lands/<int:land_id>/fertilizer-recommendations'),
+]
+
+
+STREAM_ROUTES = [
+    ('GET', re.compile(r'^/api/v1/lands/(\d+)/soil-readings/stream$'), soil_readings_stream,
+     '/api/v1/lands/<int:land_id>/soil-readings/stream'),
+]
+
+
+def match_route(method, path, routes=ASYNC_ROUTES):
+    for route_method, pattern, handler, label in routes:
+        if route_method == method:
+            m = pattern.match(path)
+            if m:
+                return handler, m.groups(), label
+    return None
+
+
+async def send_json(send, status, payload):
+    body = flask_app.app.json.dumps(payload).encode('utf-8')
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def handle_async_route(scope, receive, send, handler, params, label):
+    start = time.perf_counter()
+    try:
+        status, payload = await handler(AsyncRequest(scope, params))
+    except HTTPException as e:
+        # Same body shape as the Flask error handlers in app.py
+        status, payload = e.code, {'error': e.name, 'message': e.description}
+    except Exception:
+        flask_app.app.logger.exception("Unhandled error in async route %s", label)
+        status, payload = 500, {'error': 'Internal Server Error', 'message': 'Internal server error.'}
+    await send_json(send, status, payload)
+    metrics.observe_request(label, scope['method'], status, time.perf_counter() - start)
+
+
+async def handle_stream_route(scope, receive, send, handler, params, label):
+    start = time.perf_counter()
+    try:
+        chunks, close = await handler(AsyncRequest(scope, params))
+    except HTTPException as e:
+        await send_json(send, e.code, {'error': e.name, 'message': e.description})
+        metrics.observe_request(label, scope['method'], e.code, time.perf_counter() - start)
+        return
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [(b'content-type', b'text/event-stream'), (b'cache-control', b'no-cache'),
+                    (b'x-accel-buffering', b'no')],  # Keep reverse proxies from buffering the stream
+    })
+
+    async def disconnected():
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+    client_gone = asyncio.ensure_future(disconnected())
+    chunk_iter = chunks.__aiter__()
+    try:
+        while True:
+            # Stop as soon as the client leaves, not at the next reading or keepalive
+            next_chunk = asyncio.ensure_future(chunk_iter.__anext__())
+            await asyncio.wait((next_chunk, client_gone), return_when=asyncio.FIRST_COMPLETED)
+            if client_gone.done():
+                next_chunk.cancel()
+                await asyncio.gather(next_chunk, return_exceptions=True)
+                break
+            try:
+                chunk = next_chunk.result()
+            except StopAsyncIteration:
+                await send({'type': 'http.response.body', 'body': b''})
+                break
+            await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+    finally:
+        client_gone.cancel()
+        await chunk_iter.aclose()
+        close()
+        metrics.observe_request(label, scope['method'], 200, time.perf_counter() - start)
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            asyncio.get_running_loop().set_default_executor(
+                ThreadPoolExecutor(max_workers=DB_THREADS, thread_name_prefix='asgi-db'))
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await close_async_session()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if scope['type'] == 'http':
+        route = match_route(scope['method'], scope['path'])
+        if route:
+            return await handle_async_route(scope, receive, send, *route)
+        route = match_route(scope['method'], scope['path'], STREAM_ROUTES)
+        if route:
+            return await handle_stream_route(scope, receive, send, *route)
+    return await wsgi_application(scope, receive, send)
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Serve the KisanSarthi API over ASGI.")
+    parser.add_argument('--host', default=os.environ.get('HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=int(os.environ.get('PORT', '5000')))
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('ASGI_WORKERS', '1')),
+                        help="Worker processes")
+    parser.add_argument('--limit-concurrency', type=int, default=int(os.environ.get('ASGI_LIMIT_CONCURRENCY', '4000')),
+                        help="Max concurrent connections per worker before answering 503")
+    parser.add_argument('--backlog', type=int, default=int(os.environ.get('ASGI_BACKLOG', '4096')))
+    parser.add_argument('--keep-alive', type=int, default=int(os.environ.get('ASGI_KEEP_ALIVE', '5')),
+                        help="Seconds to keep idle client connections open")
+    args = parser.parse_args()
+
+    uvicorn.run(
+        "asgi:application",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        limit_concurrency=args.limit_concurrency,
+        backlog=args.backlog,
+        timeout_keep_alive=args.keep_alive,
+        lifespan='on',
+    )
@@ -0,0 +1,317 @@
+"""
+Nightly refresh of every land's crop suggestion and fertilizer recommendation.
+
+Lands are split into shards of consecutive ids and processed on a ProcessPoolExecutor. Each
+worker process loads both models, builds the agents and opens its database connection once.
+For a shard it loads every land's latest clean NPK reading and planted crop in one query, fetches
+the weather once, and runs each model once over the whole shard. The Gemini text is requested for
+--lands-per-prompt lands at a time, in one prompt with the land ids as item IDs, and prompts from
+all workers share one rate limit (--llm-rate per second). Lands whose stored recommendations are still fresh (precompute.py) are skipped.
+
+The results are upserted into `recommendations` exactly as the GET routes store them, so the app
+serves them and the farmer sees them in the feed. Each shard's rows are written in one
+transaction together with its checkpoint in recommendation_batch_shards. Running the job again
+on the same day resumes the unfinished run with the shards that are still pending.
+
+Run from the backend directory (e.g. nightly from cron):
+    python batch_recommendations.py --workers 4 --llm-rate 2
+"""
+import os
+import sys
+import time
+import sqlite3
+import logging
+import argparse
+import datetime
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from serialization import dict_factory
+from agents import weather_agent
+from agents import crop_suggestion
+from agents import fertilizer_recommender
+from agents import provider
+import app as flask_app
+import precompute
+
+# --- Configuration ---
+BATCH_SHARD_SIZE = int(os.environ.get('BATCH_SHARD_SIZE', '200'))
+# Gemini requests per second across all worker processes
+BATCH_LLM_RATE_PER_SECOND = float(os.environ.get('BATCH_LLM_RATE_PER_SECOND', '2'))
+BATCH_LOCATION = os.environ.get('BATCH_LOCATION', 'Maharashtra')
+# Lands packed into one Gemini prompt (the instructions are sent once per prompt, not per land)
+BATCH_LANDS_PER_PROMPT = int(os.environ.get('BATCH_LANDS_PER_PROMPT', '10'))
+
+logger = logging.getLogger('kisansarthi.batch_recommendations')
+
+# Same reading and crop as latest_npk_reading_with_crop in app.py, for a range of lands at once
+SHARD_SQL = """
+    SELECT l.id AS land_id, f.user_id,
+           sr.id, sr.timestamp, sr.source, sr.nitrogen_value, sr.phosphorus_value, sr.potassium_value, sr.ph_value,
+           p.crop_id, c.crop_name, c.optimal_ph_min, c.optimal_ph_max, c.optimal_nitrogen_range,
+           c.optimal_phosphorus_range, c.optimal_potassium_range, c.optimal_moisture_range
+    FROM lands l
+    JOIN farms f ON f.id = l.farm_id
+    JOIN soil_readings sr ON sr.id = (
+        SELECT id FROM soil_readings
+        WHERE land_id = l.id AND quality_flag IS NULL
+          AND (nitrogen_value IS NOT NULL OR phosphorus_value IS NOT NULL OR potassium_value IS NOT NULL)
+        ORDER BY timestamp DESC LIMIT 1)
+    LEFT JOIN plantings p ON p.land_id = l.id AND p.status = 'active'
+    LEFT JOIN crops c ON c.id = p.crop_id
+    WHERE l.id BETWEEN ? AND ?
+    ORDER BY l.id
+"""
+
+STORED_SHARD_SQL = f"""
+    SELECT r.land_id, {precompute.STORED_COLUMNS}
+    FROM recommendations r
+    LEFT JOIN soil_readings b ON b.id = r.based_on_reading_id
+    WHERE r.land_id BETWEEN ? AND ? AND r.based_on_reading_id IS NOT NULL
+"""
+
+# The crop suggestion does not depend on the planted crop (see latest_npk_reading in app.py)
+CROP_READING_KEYS = ('id', 'timestamp', 'source', 'nitrogen_value', 'phosphorus_value', 'potassium_value', 'ph_value')
+
+SHARD_DONE_SQL = """
+    UPDATE recommendation_batch_shards SET status = 'done', written = ?, skipped = ?, failed = ?,
+        finished_at = CURRENT_TIMESTAMP
+    WHERE run_id = ? AND shard = ?
+"""
+
+
+class RateLimiter:
+    """Spaces calls from every worker process at least 1/rate seconds apart."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = multiprocessing.Value('d', 0.0)  # wall-clock time of the next free slot
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._next.get_lock():
+            now = time.time()
+            slot = max(now, self._next.value)
+            self._next.value = slot + self.interval
+        time.sleep(max(0.0, slot - now))
+
+
+# Per worker process, set up once by init_worker
+_worker = {}
+
+
+def init_worker(db_file, limiter):
+    conn = sqlite3.connect(db_file, timeout=30)
+    conn.row_factory = dict_factory
+    conn.execute("PRAGMA foreign_keys = ON")
+    crop_suggestion.load_model()
+    fertilizer_recommender.load_model()
+    _worker.update(
+        conn=conn,
+        limiter=limiter,
+        crop=provider.shared(crop_suggestion.Crop_Suggestion, flask_app.GEN_API_KEY),
+        fertilizer=provider.shared(fertilizer_recommender.FertilizerRecommender, flask_app.GEN_API_KEY),
+    )
+
+
+def run_shard(run_id, shard, first_land_id, last_land_id, location, lands_per_prompt):
+    """Refresh one shard and check it off. Returns (shard, written, skipped, failed)."""
+    conn = _worker['conn']
+    readings = {}
+    for row in conn.execute(SHARD_SQL, (first_land_id, last_land_id)):
+        readings.setdefault(row['land_id'], row)  # a land with two active plantings keeps the first
+    stored = {(row['land_id'], row['recommendation_type']): row for row in conn.execute(
+        STORED_SHARD_SQL, (f'-{precompute.RECOMMENDATION_MAX_AGE_SECONDS} seconds', first_land_id, last_land_id))}
+
+    crop_due, fertilizer_due = [], []
+    for land_id, reading in readings.items():
+        crop_reading = {key: reading[key] for key in CROP_READING_KEYS}
+        if not precompute.is_fresh(stored.get((land_id, precompute.CROP_SUGGESTION)), crop_reading):
+            crop_due.append((reading, crop_reading))
+        if not precompute.is_fresh(stored.get((land_id, precompute.FERTILIZER)), reading):
+            fertilizer_due.append(reading)
+    due_lands = {reading['land_id'] for reading, _ in crop_due} | {reading['land_id'] for reading in fertilizer_due}
+    skipped = len(readings) - len(due_lands)
+
+    rows, failed = [], set()
+    if crop_due or fertilizer_due:
+        weather = weather_agent.get_weather_data(location, flask_app.WEATHER_API_KEY)
+        if weather is None:
+            raise RuntimeError(f"No weather data for {location}")
+        rows.extend(crop_rows(crop_due, weather, lands_per_prompt, failed))
+        rows.extend(fertilizer_rows(fertilizer_due, weather, lands_per_prompt, failed))
+
+    with conn:
+        conn.executemany(precompute.UPSERT_SQL, rows)
+        conn.execute(SHARD_DONE_SQL, (len(rows), skipped, len(failed), run_id, shard))
+    return shard, len(rows), skipped, len(failed)
+
+
+def crop_rows(due, weather, lands_per_prompt, failed):
+    """UPSERT_SQL rows for [(reading, crop_reading), ...]; one model call, then Gemini prompts of several lands."""
+    agent = _worker['crop']
+    soil_datas = []
+    for _, crop_reading in due:
+        soil_data = flask_app.soil_data_from_reading(crop_reading, default_ph=0.7)
+        crop_suggestion.apply_weather(soil_data, weather)
+        soil_datas.append(soil_data)
+    predictions = agent.predict_many(soil_datas)
+    items = [(reading['land_id'], prediction, soil_data) for (reading, _), soil_data, prediction in zip(due, soil_datas, predictions)]
+    described = describe_in_prompts(agent, items, lands_per_prompt, failed)
+
+    rows = []
+    for (reading, crop_reading), soil_data in zip(due, soil_datas):
+        land_id = reading['land_id']
+        if land_id not in described:
+            continue
+        try:
+            payload = flask_app.crop_suggestions_payload(land_id, crop_reading, soil_data, described[land_id])
+        except Exception:
+            logger.warning("Crop suggestion for land %s failed", land_id, exc_info=True)
+            failed.add(land_id)
+            continue
+        rows.append(upsert_row(reading['user_id'], land_id, precompute.CROP_SUGGESTION, crop_reading, payload))
+    return rows
+
+
+def fertilizer_rows(due, weather, lands_per_prompt, failed):
+    """UPSERT_SQL rows for fertilizer recommendations; one model call, then Gemini prompts of several lands."""
+    agent = _worker['fertilizer']
+    soil_datas = []
+    for reading in due:
+        soil_data = flask_app.soil_data_from_reading(reading, default_ph=7.0)
+        soil_data.update(weather)
+        soil_datas.append(soil_data)
+    crops = [reading['crop_name'] or "Unknown" for reading in due]
+    # The model only gates the recommendation, as in FertilizerRecommender.execute
+    if due and agent.predict_many(soil_datas, crops) is None:
+        failed.update(reading['land_id'] for reading in due)
+        return []
+
+    described = describe_in_prompts(agent, [(reading['land_id'], soil_data) for reading, soil_data in zip(due, soil_datas)],
+                                    lands_per_prompt, failed)
+
+    rows = []
+    for reading in due:
+        land_id = reading['land_id']
+        if land_id not in described:
+            continue
+        try:
+            payload = flask_app.fertilizer_recommendations_payload(land_id, reading, described[land_id])
+        except Exception:
+            logger.warning("Fertilizer recommendation for land %s failed", land_id, exc_info=True)
+            failed.add(land_id)
+            continue
+        rows.append(upsert_row(reading['user_id'], land_id, precompute.FERTILIZER, reading, payload))
+    return rows
+
+
+def describe_in_prompts(agent, items, lands_per_prompt, failed):
+    """
+    {land_id: parsed Gemini response} from agent.describe_many, lands_per_prompt lands per prompt
+    (item IDs are land ids); lands of a prompt that fails are added to `failed`.
+    """
+    described = {}
+    for i in range(0, len(items), lands_per_prompt):
+        chunk = items[i:i + lands_per_prompt]
+        try:
+            _worker['limiter'].wait()
+            described.update(agent.describe_many(chunk))
+        except Exception:
+            logger.warning("Prompt for lands %s failed", [item[0] for item in chunk], exc_info=True)
+            failed.update(item[0] for item in chunk)
+    return described
+
+
+def upsert_row(user_id, land_id, rec_type, reading, payload):
+    """UPSERT_SQL parameters, as app.store_recommendation writes them."""
+    title, details, reasoning, severity = precompute.feed_fields(rec_type, payload)
+    return (user_id, land_id, rec_type, title, details, reasoning, reading.get('crop_id'), severity,
+            reading['id'], flask_app.app.json.dumps(payload))
+
+
+def start_or_resume(conn, shard_size, restart=False):
+    """(run_id, pending shards as (shard, first_land_id, last_land_id)) for today's run."""
+    run_date = datetime.datetime.now(datetime.timezone.utc).date().isoformat()
+    run = None if restart else conn.execute(
+        "SELECT id FROM recommendation_batch_runs WHERE run_date = ? AND finished_at IS NULL ORDER BY id DESC LIMIT 1",
+        (run_date,)).fetchone()
+    if run:
+        run_id = run['id']
+        logger.info("Resuming run %s", run_id)
+    else:
+        land_ids = [row['id'] for row in conn.execute("SELECT id FROM lands ORDER BY id")]
+        shards = [land_ids[i:i + shard_size] for i in range(0, len(land_ids), shard_size)]
+        with conn:
+            run_id = conn.execute(
+                "INSERT INTO recommendation_batch_runs (run_date, lands_total, shards_total) VALUES (?, ?, ?)",
+                (run_date, len(land_ids), len(shards))).lastrowid
+            conn.executemany(
+                "INSERT INTO recommendation_batch_shards (run_id, shard, first_land_id, last_land_id, lands) VALUES (?, ?, ?, ?, ?)",
+                [(run_id, i, ids[0], ids[-1], len(ids)) for i, ids in enumerate(shards)])
+        logger.info("Started run %s: %d lands in %d shards", run_id, len(land_ids), len(shards))
+    pending = [(row['shard'], row['first_land_id'], row['last_land_id']) for row in conn.execute(
+        "SELECT shard, first_land_id, last_land_id FROM recommendation_batch_shards WHERE run_id = ? AND status = 'pending' ORDER BY shard",
+        (run_id,))]
+    return run_id, pending
+
+
+def run(db_file, workers, shard_size=BATCH_SHARD_SIZE, llm_rate=BATCH_LLM_RATE_PER_SECOND,
+        location=BATCH_LOCATION, restart=False, lands_per_prompt=BATCH_LANDS_PER_PROMPT):
+    """Process today's run to completion (or as far as it gets). Returns (run_id, totals, shards left)."""
+    conn = sqlite3.connect(db_file, timeout=30)
+    conn.row_factory = dict_factory
+    try:
+        run_id, pending = start_or_resume(conn, shard_size, restart)
+        totals = {'written': 0, 'skipped': 0, 'failed': 0}
+        start = time.perf_counter()
+        limiter = RateLimiter(llm_rate)
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(db_file, limiter)) as pool:
+            futures = [pool.submit(run_shard, run_id, shard, first, last, location, lands_per_prompt)
+                       for shard, first, last in pending]
+            for done, future in enumerate(as_completed(futures), 1):
+                try:
+                    shard, written, skipped, failed = future.result()
+                except Exception:
+                    logger.exception("A shard failed; it stays pending and is retried when the run is resumed")
+                    continue
+                totals['written'] += written
+                totals['skipped'] += skipped
+                totals['failed'] += failed
+                logger.info("Shard %d done (%d/%d): %d written, %d fresh, %d failed, %.0f s elapsed",
+                            shard, done, len(pending), written, skipped, failed, time.perf_counter() - start)
+        left = conn.execute("SELECT COUNT(*) AS count FROM recommendation_batch_shards WHERE run_id = ? AND status = 'pending'",
+                            (run_id,)).fetchone()['count']
+        if not left:
+            with conn:
+                conn.execute("UPDATE recommendation_batch_runs SET finished_at = CURRENT_TIMESTAMP WHERE id = ?", (run_id,))
+        return run_id, totals, left
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Refresh every land's crop and fertilizer recommendations.")
+    parser.add_argument('--db', default=os.environ.get('DATABASE', 'farm_app.db'))
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--shard-size', type=int, default=BATCH_SHARD_SIZE, help="Lands per shard (and checkpoint)")
+    parser.add_argument('--llm-rate', type=float, default=BATCH_LLM_RATE_PER_SECOND,
+                        help="Gemini requests per second across all workers (0 = unlimited)")
+    parser.add_argument('--lands-per-prompt', type=int, default=BATCH_LANDS_PER_PROMPT,
+                        help="Lands described by one Gemini prompt")
+    parser.add_argument('--location', default=BATCH_LOCATION)
+    parser.add_argument('--restart', action='store_true', help="Start a new run instead of resuming today's")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    run_id, totals, left = run(args.db, args.workers, args.shard_size, args.llm_rate, args.location, args.restart,
+                             max(1, args.lands_per_prompt))
+    print(f"Run {run_id}: {totals['written']} recommendations written, {totals['skipped']} lands still fresh, "
+          f"{totals['failed']} lands failed.")
+    if left:
+        sys.exit(f"{left} shards did not finish; run again to resume.")
+
+
+if __name__ == '__main__':
+    main()
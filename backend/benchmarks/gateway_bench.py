@@ -0,0 +1,157 @@
+"""
+Ingestion throughput: HTTP /ingest/soil-readings vs the line-protocol gateway (gateway.py).
+
+Seeds a benchmark database, then sends the same number of readings through
+  - http:           the Flask ingest route, one POST per reading (load_test's in-process server)
+  - tcp_sequential: the gateway, each client waiting for "ok" before sending its next line
+  - tcp_pipelined:  the gateway, each client keeping --window lines in flight
+and reports readings/second. Gateway timings stop once every reading is committed, not just
+acknowledged, so they are comparable with HTTP, which commits before answering.
+
+Run from the backend directory:
+    python -m benchmarks.gateway_bench --readings-per-run 5000 --concurrency 8 --output gateway.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import socket
+import asyncio
+import argparse
+import platform
+import threading
+import contextlib
+
+from benchmarks import seed as bench_seed
+from benchmarks import stubs
+from benchmarks import load_test
+
+
+def reading_line(rng, land_id, ts):
+    return (f"{bench_seed.device_key_for_land(land_id)} {ts:.3f} "
+            f"ph={rng.uniform(5.0, 8.5):.2f},n={rng.uniform(10, 140):.1f},p={rng.uniform(5, 90):.1f},"
+            f"k={rng.uniform(5, 120):.1f},moisture={rng.uniform(10, 90):.1f},temp={rng.uniform(12, 40):.1f},"
+            f"humidity={rng.uniform(20, 95):.1f}\n").encode()
+
+
+@contextlib.contextmanager
+def local_gateway(db_file):
+    """Run an IngestGateway on its own event loop thread; yields (gateway, port, loop)."""
+    import gateway as gateway_module
+
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+
+    async def start():
+        gw = gateway_module.IngestGateway(db_file)
+        server = await gw.start('127.0.0.1', 0)
+        return gw, server.sockets[0].getsockname()[1]
+
+    gw, port = asyncio.run_coroutine_threadsafe(start(), loop).result()
+    try:
+        yield gw, port, loop
+    finally:
+        asyncio.run_coroutine_threadsafe(gw.stop(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+
+
+def tcp_client(port, lines, window):
+    """Send `lines` keeping at most `window` unanswered; returns the number of non-"ok" replies."""
+    errors = 0
+    with socket.create_connection(('127.0.0.1', port)) as sock:
+        replies = sock.makefile('rb')
+        sent = answered = 0
+        while answered < len(lines):
+            burst = lines[sent:min(len(lines), answered + window)]
+            if burst:
+                sock.sendall(b''.join(burst))
+                sent += len(burst)
+            reply = replies.readline()
+            if reply != b"ok\n":
+                errors += 1
+            answered += 1
+    return errors
+
+
+def run_gateway(gw, port, loop, planned, concurrency, window):
+    chunks = [planned[i::concurrency] for i in range(concurrency)]
+    errors = [0] * concurrency
+
+    def client(i):
+        errors[i] = tcp_client(port, chunks[i], window)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    acked = time.perf_counter() - start
+    asyncio.run_coroutine_threadsafe(gw.queue.join(), loop).result()
+    committed = time.perf_counter() - start
+    return {
+        "readings": len(planned),
+        "errors": sum(errors),
+        "acked_s": round(acked, 4),
+        "duration_s": round(committed, 4),
+        "throughput_rps": round(len(planned) / committed, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare HTTP and gateway ingestion throughput.")
+    parser.add_argument('--db', default='bench_gateway.db')
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--readings', type=int, default=10000, help="Readings seeded before the runs")
+    parser.add_argument('--readings-per-run', type=int, default=5000)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--window', type=int, default=64, help="Lines in flight per pipelined client")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default=None, help="Write JSON results here (default: stdout)")
+    args = parser.parse_args()
+
+    with contextlib.redirect_stdout(sys.stderr):
+        dataset = bench_seed.seed(args.db, args.users, readings=args.readings, seed_value=args.seed)
+    stubs.install()
+    rng = random.Random(args.seed)
+    lands = dataset["lands"]
+    results = {}
+
+    make_request = load_test.build_scenarios(dataset, rng)["ingest_soil_reading"]
+    with load_test.local_server(args.db, 0) as base_url:
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            results["http"] = load_test.run_scenario(base_url, make_request, args.readings_per_run, args.concurrency, 30.0)
+
+    now = time.time()
+    with local_gateway(args.db) as (gw, port, loop):
+        for name, window in (("tcp_sequential", 1), ("tcp_pipelined", args.window)):
+            planned = [reading_line(rng, rng.choice(lands)[0], now + i / 1000.0) for i in range(args.readings_per_run)]
+            results[name] = run_gateway(gw, port, loop, planned, args.concurrency, window)
+        counts = dict(gw.counts)
+
+    for name, stats in results.items():
+        print(f"{name:16} {stats['throughput_rps']:>10} readings/s  errors {stats['errors']}", file=sys.stderr)
+    report = {
+        "meta": {
+            "git_revision": load_test.git_revision(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "readings_per_run": args.readings_per_run,
+            "concurrency": args.concurrency,
+            "window": args.window,
+            "gateway_counts": counts,
+        },
+        "runs": results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
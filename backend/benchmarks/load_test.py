@@ -0,0 +1,313 @@
+"""
+End-to-end load test for the Flask API.
+
+Seeds a synthetic database, starts the app in-process behind a threaded WSGI server
+(with the LLM and weather service stubbed out), drives each key route with a pool of
+concurrent clients and writes per-route throughput and latency percentiles as JSON.
+
+Run from the backend directory:
+    python -m benchmarks.load_test --readings 1000000 --requests 500 --concurrency 16 --output bench.json
+
+Compare two runs (e.g. before/after a commit):
+    python -m benchmarks.load_test --compare old.json new.json
+"""
+import os
+import sys
+import json
+import math
+import time
+import random
+import logging
+import argparse
+import platform
+import threading
+import subprocess
+import contextlib
+import urllib.request
+import urllib.error
+from concurrent.futures import ThreadPoolExecutor
+
+# Tokens here are throwaway; app.py refuses to start without a key outside development
+os.environ.setdefault('SECRET_KEY', 'benchmark-only-secret-key')
+
+from benchmarks import seed as bench_seed
+from benchmarks import stubs
+
+
+_access_tokens = {}
+
+
+def auth_headers(user_id):
+    """Bearer header for a seeded user. One token per user, as a real client would reuse it."""
+    token = _access_tokens.get(user_id)
+    if token is None:
+        import app as flask_app
+        token = _access_tokens[user_id] = flask_app.tokens.issue(user_id)
+    return {"Authorization": f"Bearer {token}"}
+
+
+def device_headers(land_id):
+    return {"X-Device-Key": bench_seed.device_key_for_land(land_id)}
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    k = max(0, math.ceil(pct / 100.0 * len(sorted_values)) - 1)
+    return sorted_values[k]
+
+
+def build_scenarios(dataset, rng):
+    """
+    Each scenario returns (method, path, headers, body) for one request.
+    Grouped by the paths we care about for regressions: listing, ingestion and recommendations.
+    """
+    lands = dataset["lands"]
+
+    def pick():
+        return rng.choice(lands)
+
+    def list_farms():
+        _, _, user_id = pick()
+        return "GET", "/api/v1/farms", auth_headers(user_id), None
+
+    def list_lands():
+        _, farm_id, user_id = pick()
+        return "GET", f"/api/v1/farms/{farm_id}/lands", auth_headers(user_id), None
+
+    def get_land():
+        land_id, _, user_id = pick()
+        return "GET", f"/api/v1/lands/{land_id}", auth_headers(user_id), None
+
+    def soil_readings():
+        land_id, _, user_id = pick()
+        return "GET", f"/api/v1/lands/{land_id}/soil-readings?limit=1000", auth_headers(user_id), None
+
+    def recommendations():
+        _, _, user_id = pick()
+        return "GET", "/api/v1/recommendations", auth_headers(user_id), None
+
+    def ingest():
+        land_id, _, _ = pick()
+        body = {
+            "hardware_unique_id": bench_seed.hardware_id_for_land(land_id),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime()) + f".{rng.randrange(10**6):06d}",
+            "ph_value": round(rng.uniform(5.0, 8.5), 2),
+            "nitrogen_value": round(rng.uniform(10, 140), 1),
+            "phosphorus_value": round(rng.uniform(5, 90), 1),
+            "potassium_value": round(rng.uniform(5, 120), 1),
+            "moisture_value": round(rng.uniform(10, 90), 1),
+            "temperature_value": round(rng.uniform(12, 40), 1),
+            "humidity_value": round(rng.uniform(20, 95), 1),
+        }
+        return "POST", "/api/v1/ingest/soil-readings", device_headers(land_id), body
+
+    def crop_suggestions():
+        land_id, _, user_id = pick()
+        return "GET", f"/api/v1/lands/{land_id}/crop-suggestions", auth_headers(user_id), None
+
+    def fertilizer_recommendations():
+        land_id, _, user_id = pick()
+        return "GET", f"/api/v1/lands/{land_id}/fertilizer-recommendations", auth_headers(user_id), None
+
+    return {
+        "list_farms": list_farms,
+        "list_lands": list_lands,
+        "get_land": get_land,
+        "get_soil_readings": soil_readings,
+        "get_recommendations": recommendations,
+        "ingest_soil_reading": ingest,
+        "get_crop_suggestions": crop_suggestions,
+        "get_fertilizer_recommendations": fertilizer_recommendations,
+    }
+
+
+def send(base_url, method, path, headers, body, timeout):
+    data = None
+    headers = dict(headers)
+    if body is not None:
+        data = json.dumps(body).encode()
+        headers["Content-Type"] = "application/json"
+    req = urllib.request.Request(base_url + path, data=data, headers=headers, method=method)
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            resp.read()
+            status = resp.status
+    except urllib.error.HTTPError as e:
+        e.read()
+        status = e.code
+    except (urllib.error.URLError, OSError):
+        status = 0
+    return time.perf_counter() - start, status
+
+
+def run_scenario(base_url, make_request, requests, concurrency, timeout):
+    """Fire `requests` requests with `concurrency` clients; return summary stats for the route."""
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+    # Build requests up front so RNG/body construction is not counted as latency
+    planned = [make_request() for _ in range(requests)]
+
+    def worker(item):
+        nonlocal errors
+        elapsed, status = send(base_url, *item, timeout=timeout)
+        with lock:
+            latencies.append(elapsed)
+            if status == 0 or status >= 400:
+                errors += 1
+
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(worker, planned))
+    wall = time.perf_counter() - wall_start
+
+    latencies.sort()
+    ms = [v * 1000.0 for v in latencies]
+    return {
+        "requests": len(ms),
+        "errors": errors,
+        "duration_s": round(wall, 4),
+        "throughput_rps": round(len(ms) / wall, 2) if wall else None,
+        "mean_ms": round(sum(ms) / len(ms), 3) if ms else None,
+        "p50_ms": round(percentile(ms, 50), 3) if ms else None,
+        "p95_ms": round(percentile(ms, 95), 3) if ms else None,
+        "p99_ms": round(percentile(ms, 99), 3) if ms else None,
+        "max_ms": round(ms[-1], 3) if ms else None,
+    }
+
+
+@contextlib.contextmanager
+def local_server(db_file, port):
+    """Serve the real Flask app from a background thread against the benchmark database."""
+    from werkzeug.serving import make_server
+    import app as flask_app
+
+    flask_app.app.config['DATABASE'] = db_file
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', port, flask_app.app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_port}"
+    finally:
+        server.shutdown()
+        thread.join()
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(old_file, new_file):
+    """Print per-route deltas between two result files."""
+    with open(old_file) as f:
+        old = json.load(f)
+    with open(new_file) as f:
+        new = json.load(f)
+    print(f"{'route':32} {'rps old':>10} {'rps new':>10} {'p95 old':>10} {'p95 new':>10} {'p95 delta':>10}")
+    for route, stats in new["routes"].items():
+        before = old["routes"].get(route)
+        if not before:
+            continue
+        delta = None
+        if before["p95_ms"] and stats["p95_ms"]:
+            delta = f"{(stats['p95_ms'] - before['p95_ms']) / before['p95_ms'] * 100:+.1f}%"
+        print(f"{route:32} {before['throughput_rps']:>10} {stats['throughput_rps']:>10} {before['p95_ms']:>10} {stats['p95_ms']:>10} {delta or '-':>10}")
+
+
+def reuse_dataset(db_file):
+    """Rebuild the dataset description from an already seeded database."""
+    import sqlite3
+    conn = sqlite3.connect(db_file)
+    try:
+        lands = conn.execute("SELECT l.id, l.farm_id, f.user_id FROM lands l JOIN farms f ON l.farm_id = f.id").fetchall()
+        users = [row[0] for row in conn.execute("SELECT id FROM users")]
+        readings = conn.execute("SELECT COUNT(*) FROM soil_readings").fetchone()[0]
+    finally:
+        conn.close()
+    return {"db_file": db_file, "users": users, "lands": lands, "readings": readings}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the KisanSarthi API.")
+    parser.add_argument('--db', default='bench_farm_app.db', help="Benchmark database file (recreated unless --reuse-db)")
+    parser.add_argument('--reuse-db', action='store_true', help="Skip seeding and reuse an existing --db")
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--farms-per-user', type=int, default=2)
+    parser.add_argument('--lands-per-farm', type=int, default=4)
+    parser.add_argument('--readings', type=int, default=100000)
+    parser.add_argument('--requests', type=int, default=200, help="Requests per route")
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--routes', default=None, help="Comma-separated subset of routes to run")
+    parser.add_argument('--llm-latency-ms', type=int, default=0, help="Simulated Gemini latency")
+    parser.add_argument('--weather-latency-ms', type=int, default=0, help="Simulated weather API latency")
+    parser.add_argument('--port', type=int, default=0, help="Port for the in-process server (0 = any free port)")
+    parser.add_argument('--timeout', type=float, default=30.0)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default=None, help="Write JSON results here (default: stdout)")
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help="Compare two result files and exit")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    if args.reuse_db:
+        dataset = reuse_dataset(args.db)
+    else:
+        print(f"Seeding {args.db} ...", file=sys.stderr)
+        seed_start = time.perf_counter()
+        with contextlib.redirect_stdout(sys.stderr):
+            dataset = bench_seed.seed(args.db, args.users, args.farms_per_user, args.lands_per_farm, args.readings, seed_value=args.seed)
+        print(f"Seeded {dataset['readings']} readings in {time.perf_counter() - seed_start:.1f}s", file=sys.stderr)
+
+    stubs.install(llm_latency_ms=args.llm_latency_ms, weather_latency_ms=args.weather_latency_ms)
+    rng = random.Random(args.seed)
+    scenarios = build_scenarios(dataset, rng)
+    if args.routes:
+        wanted = [r.strip() for r in args.routes.split(',')]
+        scenarios = {name: fn for name, fn in scenarios.items() if name in wanted}
+
+    results = {}
+    with local_server(args.db, args.port) as base_url:
+        # Keep the app's own request logging out of the results stream
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            for name, make_request in scenarios.items():
+                results[name] = run_scenario(base_url, make_request, args.requests, args.concurrency, args.timeout)
+        for name, stats in results.items():
+            print(f"{name:32} {stats['throughput_rps']:>9} rps  p50 {stats['p50_ms']:>8} ms  p95 {stats['p95_ms']:>8} ms  p99 {stats['p99_ms']:>8} ms  errors {stats['errors']}", file=sys.stderr)
+
+    report = {
+        "meta": {
+            "git_revision": git_revision(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "dataset": {
+                "users": len(dataset["users"]),
+                "lands": len(dataset["lands"]),
+                "readings": dataset["readings"],
+            },
+            "requests_per_route": args.requests,
+            "concurrency": args.concurrency,
+            "llm_latency_ms": args.llm_latency_ms,
+            "weather_latency_ms": args.weather_latency_ms,
+        },
+        "routes": results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
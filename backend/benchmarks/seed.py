@@ -0,0 +1,150 @@
+import sqlite3
+import os
+import random
+import datetime
+import argparse
+from werkzeug.security import generate_password_hash
+
+from create_db import main as createdb
+from device_auth import KEY_PREFIX, hash_key
+
+# Reference rows every benchmark database needs so the recommendation paths have something to join against.
+BENCH_CROPS = [
+    ('Rice', 5.5, 6.5), ('Wheat', 6.0, 7.0), ('Cotton', 5.8, 8.0), ('Maize', 5.8, 7.0),
+    ('Sugarcane', 6.0, 7.5), ('Tur', 6.0, 7.5), ('Soybean', 6.0, 7.0), ('Groundnut', 6.0, 6.5),
+]
+
+READING_INTERVAL_MINUTES = 15
+INSERT_CHUNK = 50000
+
+
+def hardware_id_for_land(land_id):
+    """Hardware unique ID given to the device seeded on a land plot."""
+    return f"bench-hw-{land_id}"
+
+
+def device_key_for_land(land_id):
+    """Ingest API key of the device seeded on a land plot (deterministic, benchmark use only)."""
+    return f"{KEY_PREFIX}bench-{land_id}"
+
+
+def _reading_rows(device_id, land_id, farm_id, count, start, rng):
+    """Yield `count` synthetic soil readings, oldest first, one every READING_INTERVAL_MINUTES."""
+    step = datetime.timedelta(minutes=READING_INTERVAL_MINUTES)
+    for i in range(count):
+        ts = (start + step * i).isoformat()
+        yield (
+            device_id, land_id, farm_id, ts,
+            round(rng.uniform(5.0, 8.5), 2),    # ph
+            round(rng.uniform(10, 140), 1),     # nitrogen
+            round(rng.uniform(5, 90), 1),       # phosphorus
+            round(rng.uniform(5, 120), 1),      # potassium
+            round(rng.uniform(10, 90), 1),      # moisture
+            round(rng.uniform(12, 40), 1),      # temperature
+            round(rng.uniform(20, 95), 1),      # humidity
+        )
+
+
+def seed(db_file, users=10, farms_per_user=2, lands_per_farm=4, readings=100000, recommendations_per_land=3, seed_value=42):
+    """
+    Build a fresh benchmark database at `db_file` using the real schema from create_db.py
+    and fill it with a deterministic synthetic dataset.
+
+    :return: dict describing what was generated (ids are needed by the load generator)
+    """
+    if os.path.exists(db_file):
+        os.remove(db_file)
+    createdb(db_file)
+
+    rng = random.Random(seed_value)
+    conn = sqlite3.connect(db_file)
+    # Bulk load only: durability does not matter for a throwaway benchmark database
+    conn.execute("PRAGMA journal_mode = OFF;")
+    conn.execute("PRAGMA synchronous = OFF;")
+    conn.execute("PRAGMA foreign_keys = ON;")
+    cur = conn.cursor()
+
+    cur.executemany("INSERT INTO crops (crop_name, optimal_ph_min, optimal_ph_max) VALUES (?, ?, ?)", BENCH_CROPS)
+    crop_ids = [row[0] for row in cur.execute("SELECT id FROM crops")]
+
+    # Hashing is deliberately slow, so every synthetic user shares one hash
+    password_hash = generate_password_hash('benchmark')
+    cur.executemany(
+        "INSERT INTO users (name, phone_number, password_hash) VALUES (?, ?, ?)",
+        ((f"Bench User {i}", f"9{i:09d}", password_hash) for i in range(users))
+    )
+    user_ids = [row[0] for row in cur.execute("SELECT id FROM users ORDER BY id")]
+
+    lands = []  # (land_id, farm_id, user_id)
+    for user_id in user_ids:
+        for f in range(farms_per_user):
+            farm_id = cur.execute(
+                "INSERT INTO farms (user_id, farm_name, location_latitude, location_longitude, address) VALUES (?, ?, ?, ?, ?)",
+                (user_id, f"Farm {user_id}-{f}", rng.uniform(16, 21), rng.uniform(73, 80), "Maharashtra")
+            ).lastrowid
+            for l in range(lands_per_farm):
+                land_id = cur.execute(
+                    "INSERT INTO lands (farm_id, land_name, area, area_unit, soil_type_manual) VALUES (?, ?, ?, ?, ?)",
+                    (farm_id, f"Plot {l}", round(rng.uniform(0.5, 5.0), 2), 'acres', 'Black')
+                ).lastrowid
+                planting_id = cur.execute(
+                    "INSERT INTO plantings (land_id, crop_id, planting_date, status) VALUES (?, ?, DATE('now', '-30 days'), 'active')",
+                    (land_id, rng.choice(crop_ids))
+                ).lastrowid
+                cur.execute("UPDATE lands SET current_planting_id = ? WHERE id = ?", (planting_id, land_id))
+                cur.execute(
+                    "INSERT INTO hardware_devices (hardware_unique_id, farm_id, assigned_land_id, device_name, model, registration_date, status, api_key_hash) VALUES (?, ?, ?, ?, ?, DATE('now'), 'active', ?)",
+                    (hardware_id_for_land(land_id), farm_id, land_id, f"Sensor {land_id}", 'bench-v1', hash_key(device_key_for_land(land_id)))
+                )
+                lands.append((land_id, farm_id, user_id))
+
+    devices = {land_id: device_id for device_id, land_id in cur.execute("SELECT id, assigned_land_id FROM hardware_devices")}
+
+    # Spread readings evenly across lands, ending "now" so latest-reading queries see realistic data
+    per_land = max(1, readings // max(1, len(lands)))
+    start = datetime.datetime.utcnow().replace(microsecond=0) - datetime.timedelta(minutes=READING_INTERVAL_MINUTES * per_land)
+    insert_sql = """
+        INSERT INTO soil_readings (
+            device_id, land_id, farm_id, timestamp, ph_value,
+            nitrogen_value, phosphorus_value, potassium_value,
+            moisture_value, temperature_value, humidity_value
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """
+    total_readings = 0
+    for land_id, farm_id, _ in lands:
+        batch = list(_reading_rows(devices[land_id], land_id, farm_id, per_land, start, rng))
+        for i in range(0, len(batch), INSERT_CHUNK):
+            cur.executemany(insert_sql, batch[i:i + INSERT_CHUNK])
+        total_readings += len(batch)
+
+    rec_types = ['weekly_tip', 'fertilizer', 'pest_alert']
+    cur.executemany(
+        "INSERT INTO recommendations (user_id, land_id, recommendation_type, title, details) VALUES (?, ?, ?, ?, ?)",
+        ((user_id, land_id, rng.choice(rec_types), "Benchmark tip", "Synthetic recommendation body.")
+         for land_id, _, user_id in lands for _ in range(recommendations_per_land))
+    )
+
+    conn.commit()
+    conn.execute("ANALYZE;")
+    conn.close()
+
+    return {
+        "db_file": db_file,
+        "users": user_ids,
+        "lands": lands,
+        "readings": total_readings,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Seed a synthetic benchmark database.")
+    parser.add_argument('--db', default='bench_farm_app.db')
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--farms-per-user', type=int, default=2)
+    parser.add_argument('--lands-per-farm', type=int, default=4)
+    parser.add_argument('--readings', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    info = seed(args.db, args.users, args.farms_per_user, args.lands_per_farm, args.readings, seed_value=args.seed)
+    print(f"Seeded '{info['db_file']}': {len(info['users'])} users, {len(info['lands'])} lands, {info['readings']} soil readings.")
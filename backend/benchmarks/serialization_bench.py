@@ -0,0 +1,121 @@
+"""
+Micro-benchmark for the row-to-JSON path of a soil readings page.
+
+Compares the original per-row dict_factory + stdlib-JSON jsonify against serialization.py
+(tuples + cached column names + orjson), for the row and columnar response layouts, on the
+soil_readings schema from create_db.py.
+
+Run from the backend directory:
+    python -m benchmarks.serialization_bench --rows 1000 --repeat 200
+"""
+import json
+import time
+import random
+import sqlite3
+import argparse
+import datetime
+import statistics
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+import serialization
+
+
+def legacy_dict_factory(cursor, row):
+    """The row factory app.py used before serialization.py."""
+    d = {}
+    for idx, col in enumerate(cursor.description):
+        d[col[0]] = row[idx]
+    return d
+
+
+def build_db(rows, seed_value=42):
+    conn = sqlite3.connect(':memory:', detect_types=sqlite3.PARSE_DECLTYPES) # As app.get_db() connects
+    conn.execute("""
+        CREATE TABLE soil_readings (
+            id INTEGER PRIMARY KEY, device_id INTEGER, land_id INTEGER, farm_id INTEGER,
+            timestamp TEXT NOT NULL, received_at TEXT,
+            ph_value REAL, nitrogen_value REAL, phosphorus_value REAL, potassium_value REAL,
+            moisture_value REAL, temperature_value REAL, humidity_value REAL)
+    """)
+    rng = random.Random(seed_value)
+    start = datetime.datetime(2024, 1, 1)
+    conn.executemany(
+        "INSERT INTO soil_readings VALUES (NULL, 1, 1, 1, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        [((start + datetime.timedelta(minutes=15 * i)).isoformat(),
+          (start + datetime.timedelta(minutes=15 * i, seconds=3)).isoformat(sep=' '),
+          round(rng.uniform(5.5, 8.0), 2), round(rng.uniform(10, 120), 1), round(rng.uniform(5, 60), 1),
+          round(rng.uniform(50, 300), 1), round(rng.uniform(10, 60), 1), round(rng.uniform(15, 40), 1),
+          round(rng.uniform(30, 90), 1)) for i in range(rows)])
+    return conn
+
+
+SQL = "SELECT * FROM soil_readings WHERE land_id = ? ORDER BY timestamp DESC LIMIT ?"
+
+
+def legacy_rows(conn, app, limit):
+    conn.row_factory = legacy_dict_factory
+    readings = conn.execute(SQL, (1, limit)).fetchall()
+    return app.json.response({"readings": readings, "total": limit}).get_data()
+
+
+def fast_rows(conn, app, limit):
+    cur = conn.cursor()
+    cur.row_factory = None
+    rows = cur.execute(SQL, (1, limit)).fetchall()
+    names = serialization.column_names(cur)
+    return app.json.response({"readings": serialization.rows_to_dicts(names, rows), "total": limit}).get_data()
+
+
+def fast_columnar(conn, app, limit):
+    cur = conn.cursor()
+    cur.row_factory = None
+    rows = cur.execute(SQL, (1, limit)).fetchall()
+    names = serialization.column_names(cur)
+    return app.json.response({"format": "columnar", "readings": serialization.rows_to_columns(names, rows),
+                              "total": limit}).get_data()
+
+
+def measure(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        body = fn()
+        timings.append(time.perf_counter() - start)
+    return {
+        "median_ms": round(statistics.median(timings) * 1000, 3),
+        "min_ms": round(min(timings) * 1000, 3),
+        "bytes": len(body),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark row-to-JSON serialization for a readings page.")
+    parser.add_argument('--rows', type=int, default=1000, help="Rows per page")
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    conn = build_db(args.rows)
+    legacy_app = Flask('legacy')
+    legacy_app.json = DefaultJSONProvider(legacy_app)
+    fast_app = Flask('fast')
+    fast_app.json = serialization.FastJSONProvider(fast_app)
+
+    # Both paths must agree on the payload before their speed is worth comparing
+    assert json.loads(legacy_rows(conn, legacy_app, args.rows)) == json.loads(fast_rows(conn, fast_app, args.rows))
+
+    results = {
+        "dict_factory+json": measure(lambda: legacy_rows(conn, legacy_app, args.rows), args.repeat),
+        "tuples+orjson": measure(lambda: fast_rows(conn, fast_app, args.rows), args.repeat),
+        "tuples+orjson columnar": measure(lambda: fast_columnar(conn, fast_app, args.rows), args.repeat),
+    }
+    baseline = results["dict_factory+json"]["median_ms"]
+    for result in results.values():
+        result["speedup"] = round(baseline / result["median_ms"], 2)
+    print(json.dumps({"rows": args.rows, "repeat": args.repeat, "orjson": serialization.orjson is not None,
+                      "results": results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+import re
+import time
+import asyncio
+
+import agents.provider
+import agents.weather_agent
+import agents.crop_suggestion
+import agents.fertilizer_recommender
+
+# Canned responses in exactly the formats the agents' parsers expect
+CROP_RESPONSE = """Crop: Rice
+Match: 0.82
+Description: Benchmark crop description.
+Explanation: Benchmark explanation.
+Growing Season: Kharif
+Water Requirement: High
+Expected Yield: 4 t/ha
+Recommendations: Keep the field flooded\\nUse certified seed"""
+
+FERTILIZER_RESPONSE = """Crop: Rice
+Fertilizer: Urea
+Product: Urea 46-0-0
+Buy at: Local dealer
+Amount: 100 kg per hectare, twice per season
+Price: 300 INR per 45 kg bag
+Description: Benchmark fertilizer description.
+Explanation: Benchmark explanation."""
+
+STUB_WEATHER = {"humidity": 65, "rainfall": 2.5, "temperature": 28.0}
+
+# Label returned in place of the fertilizer model, whose pickle is not shipped with the repo
+STUB_FERTILIZER_LABEL = "Urea"
+
+
+def stub_response(task):
+    """The canned response for a prompt; batched prompts get one block per "Item: <id>" line."""
+    response = FERTILIZER_RESPONSE if "Fertilizer:" in task else CROP_RESPONSE
+    item_ids = re.findall(r'^Item: ([^<\s]\S*)$', task, re.MULTILINE)
+    if not item_ids:
+        return response
+    return "\n\n".join(f"Item: {item_id}\n{response}" for item_id in item_ids)
+
+
+def install(llm_latency_ms=0, weather_latency_ms=0):
+    """
+    Replace the Gemini client and OpenWeather calls with local stubs so the benchmark
+    measures our own code, with optional sleeps to emulate upstream latency.
+    """
+    llm_delay = llm_latency_ms / 1000.0
+    weather_delay = weather_latency_ms / 1000.0
+
+    def agent_init(self, GEN_API_KEY):
+        self.client = None
+
+    def agent_execute(self, task, data=None):
+        if llm_delay:
+            time.sleep(llm_delay)
+        return stub_response(task)
+
+    async def agent_aexecute(self, task, data=None):
+        if llm_delay:
+            await asyncio.sleep(llm_delay)
+        return stub_response(task)
+
+    def weather(city_name, WEATHER_API_KEY):
+        if weather_delay:
+            time.sleep(weather_delay)
+        return dict(STUB_WEATHER)
+
+    async def weather_async(city_name, WEATHER_API_KEY):
+        if weather_delay:
+            await asyncio.sleep(weather_delay)
+        return dict(STUB_WEATHER)
+
+    def fertilizer_predict(self, soil_data, crop):
+        return STUB_FERTILIZER_LABEL
+
+    def fertilizer_predict_many(self, soil_datas, crops):
+        return [STUB_FERTILIZER_LABEL] * len(soil_datas)
+
+    agents.provider.Agent.__init__ = agent_init
+    agents.provider.Agent.execute = agent_execute
+    agents.provider.Agent.aexecute = agent_aexecute
+    # Both agents import get_weather_data by name, so patch their module globals
+    # (batch_recommendations.py calls it through weather_agent)
+    agents.weather_agent.get_weather_data = weather
+    agents.crop_suggestion.get_weather_data = weather
+    agents.fertilizer_recommender.get_weather_data = weather
+    agents.crop_suggestion.get_weather_data_async = weather_async
+    agents.fertilizer_recommender.get_weather_data_async = weather_async
+    agents.fertilizer_recommender.FertilizerRecommender.load_model_and_predict = fertilizer_predict
+    agents.fertilizer_recommender.FertilizerRecommender.predict_many = fertilizer_predict_many
@@ -2,7 +2,7 @@ import sqlite3
 import os
 from sqlite3 import Error
 
-DATABASE_NAME = "farm_app.db"
+DATABASE_NAME = os.environ.get("DATABASE", "farm_app.db")
 
 def create_connection(db_file):
     """ create a database connection to the SQLite database specified by db_file
@@ -36,7 +36,106 @@ def execute_sql(conn, sql_statement):
     except Error as e:
         print(f"Error executing SQL: {e}\nStatement: {sql_statement}")
 
-def main():
+# (table, column, definition) for columns added to existing tables, oldest first
+ADDED_COLUMNS = [
+    ("soil_readings", "quality_flag", "TEXT NULL"),
+    ("recommendations", "alert_key", "TEXT NULL"),  # rule that raised an 'alert' recommendation
+    ("recommendations", "severity", "TEXT NULL"),
+    # Device health counters, maintained on ingest and by the offline sweeper
+    ("hardware_devices", "readings_count", "INTEGER NOT NULL DEFAULT 0"),
+    ("hardware_devices", "health_since", "TEXT NULL"),
+    ("hardware_devices", "offline_since", "TEXT NULL"),
+    ("hardware_devices", "offline_seconds", "REAL NOT NULL DEFAULT 0"),
+    ("hardware_devices", "offline_count", "INTEGER NOT NULL DEFAULT 0"),
+    ("hardware_devices", "api_key_hash", "TEXT NULL"),  # SHA-256 of the device's ingest key
+    ("soil_readings", "source", "TEXT NOT NULL DEFAULT 'sensor'"),  # 'sensor', 'manual' or 'lab'
+    # Precomputed crop suggestions and fertilizer recommendations (precompute.py): the reading
+    # they were computed from and the full API response
+    ("recommendations", "based_on_reading_id", "INTEGER NULL"),
+    ("recommendations", "payload", "TEXT NULL"),
+    # Bumped when a device's anomaly baseline is reset, so every worker drops its copy (anomaly.py)
+    ("hardware_devices", "detector_generation", "INTEGER NOT NULL DEFAULT 0"),
+]
+
+# soil_readings is rebuilt from this when an existing table still requires device_id
+SOIL_READINGS_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS {table} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        device_id INTEGER NULL, -- NULL for readings entered by hand or imported from a lab report
+        land_id INTEGER NOT NULL,
+        farm_id INTEGER NOT NULL,
+        timestamp TEXT NOT NULL,
+        received_at TEXT DEFAULT CURRENT_TIMESTAMP,
+        ph_value REAL NULL,
+        nitrogen_value REAL NULL,
+        phosphorus_value REAL NULL,
+        potassium_value REAL NULL,
+        moisture_value REAL NULL,
+        temperature_value REAL NULL,
+        humidity_value REAL NULL,
+        quality_flag TEXT NULL, -- NULL = passed anomaly checks, else 'range', 'outlier' or 'drift'
+        source TEXT NOT NULL DEFAULT 'sensor', -- 'sensor', 'manual' or 'lab'
+        FOREIGN KEY (device_id) REFERENCES hardware_devices (id) ON DELETE CASCADE,
+        FOREIGN KEY (land_id) REFERENCES lands (id) ON DELETE CASCADE,
+        FOREIGN KEY (farm_id) REFERENCES farms (id) ON DELETE CASCADE
+    );
+    """
+
+def add_missing_columns(conn):
+    """ALTER TABLE ... ADD COLUMN for every ADDED_COLUMNS entry the database does not have yet."""
+    for table, column, definition in ADDED_COLUMNS:
+        existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+        if column not in existing:
+            execute_sql(conn, f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+            print(f"Added column {table}.{column}")
+    conn.commit()
+
+def relax_soil_readings_device_id(conn):
+    """
+    Rebuild soil_readings without NOT NULL on device_id. SQLite cannot drop a column constraint
+    in place, so the rows are copied into a new table which then replaces the old one; its
+    indexes are dropped with it and recreated by main(). Runs once, in a single transaction.
+    """
+    columns = {row[1]: row[3] for row in conn.execute("PRAGMA table_info(soil_readings)")}
+    if not columns.get("device_id"):
+        return
+    print("Rebuilding soil_readings so manual readings need no device (one-off)...")
+    names = ", ".join(columns)
+    conn.commit()
+    conn.execute("PRAGMA foreign_keys = OFF;")  # has no effect inside a transaction
+    try:
+        # Explicit BEGIN: sqlite3 would otherwise autocommit the CREATE TABLE on its own
+        conn.execute("BEGIN")
+        conn.execute(SOIL_READINGS_TABLE_SQL.format(table="soil_readings_rebuild"))
+        conn.execute(f"INSERT INTO soil_readings_rebuild ({names}) SELECT {names} FROM soil_readings")
+        conn.execute("DROP TABLE soil_readings")
+        conn.execute("ALTER TABLE soil_readings_rebuild RENAME TO soil_readings")
+        conn.commit()
+    except Error:
+        conn.rollback()
+        raise
+    finally:
+        conn.execute("PRAGMA foreign_keys = ON;")
+    print("Rebuilt soil_readings.")
+
+def remove_duplicate_readings(conn):
+    """
+    Before the unique (device_id, timestamp) index exists, delete repeated sensor readings, keeping
+    the first stored copy. Manual and lab readings (no device) are left alone.
+    """
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_readings_device_id_timestamp'").fetchone():
+        return
+    with conn:
+        removed = conn.execute("""
+            DELETE FROM soil_readings
+            WHERE device_id IS NOT NULL AND id NOT IN (
+                SELECT MIN(id) FROM soil_readings WHERE device_id IS NOT NULL GROUP BY device_id, timestamp
+            )
+        """).rowcount
+    if removed:
+        print(f"Removed {removed} duplicate soil readings.")
+
+def main(db_file=DATABASE_NAME):
     # --- SQL Statements for Table Creation ---
 
     sql_create_users_table = """
@@ -102,26 +201,7 @@ def main():
     );
     """
 
-    sql_create_soil_readings_table = """
-    CREATE TABLE IF NOT EXISTS soil_readings (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        device_id INTEGER NOT NULL,
-        land_id INTEGER NOT NULL,
-        farm_id INTEGER NOT NULL,
-        timestamp TEXT NOT NULL,
-        received_at TEXT DEFAULT CURRENT_TIMESTAMP,
-        ph_value REAL NULL,
-        nitrogen_value REAL NULL,
-        phosphorus_value REAL NULL,
-        potassium_value REAL NULL,
-        moisture_value REAL NULL,
-        temperature_value REAL NULL,
-        humidity_value REAL NULL,
-        FOREIGN KEY (device_id) REFERENCES hardware_devices (id) ON DELETE CASCADE,
-        FOREIGN KEY (land_id) REFERENCES lands (id) ON DELETE CASCADE,
-        FOREIGN KEY (farm_id) REFERENCES farms (id) ON DELETE CASCADE
-    );
-    """
+    sql_create_soil_readings_table = SOIL_READINGS_TABLE_SQL.format(table="soil_readings")
 
     sql_create_crops_table = """
     CREATE TABLE IF NOT EXISTS crops (
@@ -258,6 +338,81 @@ def main():
     );
     """
 
+    # One row per (archive file, land): the readings moved out of soil_readings by archive.py
+    sql_create_archived_reading_partitions_table = """
+    CREATE TABLE IF NOT EXISTS archived_reading_partitions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        farm_id INTEGER NOT NULL,
+        land_id INTEGER NOT NULL,
+        month TEXT NOT NULL, -- 'YYYY-MM'
+        path TEXT NOT NULL, -- Relative to ARCHIVE_DIR
+        row_count INTEGER NOT NULL,
+        min_timestamp TEXT NOT NULL,
+        max_timestamp TEXT NOT NULL,
+        created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (farm_id) REFERENCES farms (id) ON DELETE CASCADE,
+        FOREIGN KEY (land_id) REFERENCES lands (id) ON DELETE CASCADE
+    );
+    """
+
+    # Per device/parameter baseline of the ingest anomaly detector (anomaly.py), checkpointed periodically
+    sql_create_sensor_detector_state_table = """
+    CREATE TABLE IF NOT EXISTS sensor_detector_state (
+        device_id INTEGER NOT NULL,
+        parameter TEXT NOT NULL,
+        count INTEGER NOT NULL,
+        mean REAL NOT NULL,
+        m2 REAL NOT NULL,
+        ewma REAL NULL,
+        updated_at TEXT DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (device_id, parameter),
+        FOREIGN KEY (device_id) REFERENCES hardware_devices (id) ON DELETE CASCADE
+    );
+    """
+
+    # Responses of requests sent with an Idempotency-Key, replayed to retries (see idempotency.py)
+    sql_create_idempotency_keys_table = """
+    CREATE TABLE IF NOT EXISTS idempotency_keys (
+        scope TEXT NOT NULL, -- 'user:<id>' or 'device:<id>'
+        idempotency_key TEXT NOT NULL,
+        fingerprint TEXT NOT NULL, -- SHA-256 of method, path and body
+        status_code INTEGER NULL, -- NULL while the first request is still running
+        response BLOB NULL,
+        created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (scope, idempotency_key)
+    );
+    """
+
+    # Nightly recommendation refresh (batch_recommendations.py): one row per run, and one per shard
+    # of lands as its checkpoint; an interrupted run resumes with its shards still 'pending'
+    sql_create_recommendation_batch_runs_table = """
+    CREATE TABLE IF NOT EXISTS recommendation_batch_runs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        run_date TEXT NOT NULL, -- 'YYYY-MM-DD' (UTC) the run refreshes
+        lands_total INTEGER NOT NULL,
+        shards_total INTEGER NOT NULL,
+        started_at TEXT DEFAULT CURRENT_TIMESTAMP,
+        finished_at TEXT NULL -- NULL until every shard is done
+    );
+    """
+
+    sql_create_recommendation_batch_shards_table = """
+    CREATE TABLE IF NOT EXISTS recommendation_batch_shards (
+        run_id INTEGER NOT NULL,
+        shard INTEGER NOT NULL,
+        first_land_id INTEGER NOT NULL,
+        last_land_id INTEGER NOT NULL,
+        lands INTEGER NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending', -- 'pending' or 'done'
+        written INTEGER NULL, -- recommendation rows upserted
+        skipped INTEGER NULL, -- lands whose stored recommendations were still fresh
+        failed INTEGER NULL, -- lands whose computation failed
+        finished_at TEXT NULL,
+        PRIMARY KEY (run_id, shard),
+        FOREIGN KEY (run_id) REFERENCES recommendation_batch_runs (id) ON DELETE CASCADE
+    );
+    """
+
     sql_create_courses_table = """
     CREATE TABLE IF NOT EXISTS Courses (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -277,10 +432,19 @@ def main():
     sql_create_devices_farm_id_index = "CREATE INDEX IF NOT EXISTS idx_devices_farm_id ON hardware_devices (farm_id);"
     sql_create_devices_land_id_index = "CREATE INDEX IF NOT EXISTS idx_devices_assigned_land_id ON hardware_devices (assigned_land_id);"
     sql_create_devices_hwid_index = "CREATE INDEX IF NOT EXISTS idx_devices_hardware_unique_id ON hardware_devices (hardware_unique_id);"
-    sql_create_readings_device_id_index = "CREATE INDEX IF NOT EXISTS idx_readings_device_id ON soil_readings (device_id);"
+    # Offline sweeps: active devices by last report
+    sql_create_devices_status_last_seen_index = "CREATE INDEX IF NOT EXISTS idx_devices_status_last_seen_at ON hardware_devices (status, last_seen_at);"
+    sql_create_devices_api_key_index = "CREATE UNIQUE INDEX IF NOT EXISTS idx_devices_api_key_hash ON hardware_devices (api_key_hash);"
+    # One reading per device and timestamp, so retried uploads are ignored (INSERT ... ON CONFLICT DO NOTHING);
+    # it also serves per-device lookups, which had their own index before
+    sql_create_readings_device_ts_index = "CREATE UNIQUE INDEX IF NOT EXISTS idx_readings_device_id_timestamp ON soil_readings (device_id, timestamp);"
     sql_create_readings_land_id_index = "CREATE INDEX IF NOT EXISTS idx_readings_land_id ON soil_readings (land_id);"
     sql_create_readings_farm_id_index = "CREATE INDEX IF NOT EXISTS idx_readings_farm_id ON soil_readings (farm_id);"
     sql_create_readings_timestamp_index = "CREATE INDEX IF NOT EXISTS idx_readings_timestamp ON soil_readings (timestamp);"
+    sql_create_readings_land_ts_index = "CREATE INDEX IF NOT EXISTS idx_readings_land_id_timestamp ON soil_readings (land_id, timestamp);"
+    # Partial index for "latest good reading" lookups, which skip readings flagged by the anomaly detector
+    sql_create_readings_land_ts_clean_index = "CREATE INDEX IF NOT EXISTS idx_readings_land_id_timestamp_clean ON soil_readings (land_id, timestamp) WHERE quality_flag IS NULL;"
+    sql_create_archive_land_ts_index = "CREATE INDEX IF NOT EXISTS idx_archive_land_id_max_timestamp ON archived_reading_partitions (land_id, max_timestamp);"
     sql_create_plantings_land_id_index = "CREATE INDEX IF NOT EXISTS idx_plantings_land_id ON plantings (land_id);"
     sql_create_plantings_crop_id_index = "CREATE INDEX IF NOT EXISTS idx_plantings_crop_id ON plantings (crop_id);"
     sql_create_plantings_status_index = "CREATE INDEX IF NOT EXISTS idx_plantings_status ON plantings (status);"
@@ -295,10 +459,14 @@ def main():
     sql_create_reco_type_index = "CREATE INDEX IF NOT EXISTS idx_reco_recommendation_type ON recommendations (recommendation_type);"
     sql_create_reco_date_index = "CREATE INDEX IF NOT EXISTS idx_reco_recommendation_date ON recommendations (recommendation_date);"
     sql_create_reco_read_index = "CREATE INDEX IF NOT EXISTS idx_reco_is_read ON recommendations (is_read);"
+    # Alert engine cooldown lookups: recent alerts per land and rule
+    sql_create_reco_alert_index = "CREATE INDEX IF NOT EXISTS idx_reco_land_id_alert_key_created_at ON recommendations (land_id, alert_key, created_at) WHERE alert_key IS NOT NULL;"
+    # One precomputed recommendation per land and type, replaced in place when recomputed
+    sql_create_reco_precomputed_index = "CREATE UNIQUE INDEX IF NOT EXISTS idx_reco_land_id_type_precomputed ON recommendations (land_id, recommendation_type) WHERE based_on_reading_id IS NOT NULL;"
 
 
     # --- Create database connection ---
-    conn = create_connection(DATABASE_NAME)
+    conn = create_connection(db_file)
 
     # --- Create tables and indexes ---
     if conn is not None:
@@ -325,8 +493,17 @@ def main():
         # `recommendations` references `users`, `lands`, `plantings`, `crops`, `fertilizers`
         execute_sql(conn, sql_create_recommendations_table)
         execute_sql(conn, sql_create_courses_table)
+        execute_sql(conn, sql_create_archived_reading_partitions_table)
+        execute_sql(conn, sql_create_sensor_detector_state_table)
+        execute_sql(conn, sql_create_idempotency_keys_table)
+        execute_sql(conn, sql_create_recommendation_batch_runs_table)
+        execute_sql(conn, sql_create_recommendation_batch_shards_table)
         print("Tables created (if they didn't exist).")
 
+        # Columns added after a table was first created; CREATE TABLE IF NOT EXISTS skips existing tables
+        add_missing_columns(conn)
+        relax_soil_readings_device_id(conn)
+
         print("\nCreating indexes...")
         execute_sql(conn, sql_create_farms_user_id_index)
         execute_sql(conn, sql_create_lands_farm_id_index)
@@ -334,10 +511,17 @@ def main():
         execute_sql(conn, sql_create_devices_farm_id_index)
         execute_sql(conn, sql_create_devices_land_id_index)
         execute_sql(conn, sql_create_devices_hwid_index)
-        execute_sql(conn, sql_create_readings_device_id_index)
+        execute_sql(conn, sql_create_devices_status_last_seen_index)
+        execute_sql(conn, sql_create_devices_api_key_index)
+        remove_duplicate_readings(conn)
+        execute_sql(conn, sql_create_readings_device_ts_index)
+        execute_sql(conn, "DROP INDEX IF EXISTS idx_readings_device_id;")
         execute_sql(conn, sql_create_readings_land_id_index)
         execute_sql(conn, sql_create_readings_farm_id_index)
         execute_sql(conn, sql_create_readings_timestamp_index)
+        execute_sql(conn, sql_create_readings_land_ts_index)
+        execute_sql(conn, sql_create_readings_land_ts_clean_index)
+        execute_sql(conn, sql_create_archive_land_ts_index)
         execute_sql(conn, sql_create_plantings_land_id_index)
         execute_sql(conn, sql_create_plantings_crop_id_index)
         execute_sql(conn, sql_create_plantings_status_index)
@@ -352,14 +536,83 @@ def main():
         execute_sql(conn, sql_create_reco_type_index)
         execute_sql(conn, sql_create_reco_date_index)
         execute_sql(conn, sql_create_reco_read_index)
+        execute_sql(conn, sql_create_reco_alert_index)
+        execute_sql(conn, sql_create_reco_precomputed_index)
         print("Indexes created (if they didn't exist).")
 
         # --- Commit changes and close connection ---
         conn.commit()
         conn.close()
-        print(f"\nDatabase '{DATABASE_NAME}' setup complete. Connection closed.")
+        print(f"\nDatabase '{db_file}' setup complete. Connection closed.")
     else:
-        print(f"Error! cannot create the database connection to '{DATABASE_NAME}'.")
+        print(f"Error! cannot create the database connection to '{db_file}'.")
+
+def seed_reference_data(db_file=DATABASE_NAME):
+    """ add default/dummy rows (demo user, crops, a disease with a remedy, fertilizers) to any empty table.
+    One-off command; the API server no longer does this on every start.
+    :param db_file: database file
+    """
+    from werkzeug.security import generate_password_hash
+
+    needs_commit = False
+    conn = None
+    try:
+        conn = sqlite3.connect(db_file)
+        conn.execute("PRAGMA foreign_keys = ON;")
+        cursor = conn.cursor()
+
+        # Check for users
+        user_count = cursor.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+        if user_count == 0:
+            print("Adding dummy user (id=1, phone=0000000000, pass=password)")
+            # Use the same hashing as the register endpoint
+            hashed_password = generate_password_hash('password')
+            cursor.execute("INSERT INTO users (id, name, phone_number, password_hash) VALUES (?, ?, ?, ?)",
+                           (1, 'Test User', '0000000000', hashed_password))
+            needs_commit = True
+
+        # Check for crops
+        crop_count = cursor.execute("SELECT COUNT(*) FROM crops").fetchone()[0]
+        if crop_count == 0:
+            print("Adding dummy crops (Corn, Tomato)")
+            cursor.execute("INSERT INTO crops (crop_name, optimal_ph_min, optimal_ph_max) VALUES (?, ?, ?)", ('Corn', 5.8, 7.0))
+            cursor.execute("INSERT INTO crops (crop_name, optimal_ph_min, optimal_ph_max) VALUES (?, ?, ?)", ('Tomato', 6.0, 6.8))
+            needs_commit = True
+
+        # Check for diseases
+        disease_count = cursor.execute("SELECT COUNT(*) FROM diseases").fetchone()[0]
+        if disease_count == 0:
+            print("Adding dummy disease (Leaf Blight)")
+            disease_id = cursor.execute("INSERT INTO diseases (disease_name, description, symptoms) VALUES (?,?,?)",
+                        ('Leaf Blight', 'Fungal disease causing spots on leaves', 'Yellowish or brown spots, often with concentric rings.')).lastrowid
+            # Add a dummy remedy
+            cursor.execute("INSERT INTO remedies (disease_id, remedy_type, description) VALUES (?, ?, ?)",
+                           (disease_id, 'fungicide', 'Apply a broad-spectrum fungicide according to label instructions.'))
+            needs_commit = True
+
+        # Check for fertilizers
+        fertilizer_count = cursor.execute("SELECT COUNT(*) FROM fertilizers").fetchone()[0]
+        if fertilizer_count == 0:
+            print("Adding dummy fertilizers")
+            cursor.execute("INSERT INTO fertilizers (fertilizer_name, type, n_content_percent, p_content_percent, k_content_percent) VALUES (?, ?, ?, ?, ?)",
+                           ('Balanced NPK 10-10-10', 'npk_compound', 10, 10, 10))
+            cursor.execute("INSERT INTO fertilizers (fertilizer_name, type, n_content_percent) VALUES (?, ?, ?)",
+                           ('Urea', 'nitrogen_source', 46))
+            needs_commit = True
+
+        if needs_commit:
+            conn.commit()
+            print("Dummy data added.")
+        else:
+            print("All reference tables already populated; nothing to seed.")
+    except Error as e:
+        print(f"Error during initial data check/add: {e}")
+    finally:
+        if conn:
+            conn.close()
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    import sys
+    main()
+    if '--seed' in sys.argv[1:]:
+        seed_reference_data()
\ No newline at end of file
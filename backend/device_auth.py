@@ -0,0 +1,106 @@
+"""
+Per-device API keys for the ingest endpoint.
+
+A key is issued when a device is registered (or rotated) and shown to the owner once; only its
+SHA-256 is stored in hardware_devices.api_key_hash. Keys carry 256 random bits, so a fast
+unsalted hash is as strong as a slow password hash here, without adding latency to every reading.
+
+Verified keys are cached per worker in an LRU with a TTL, mapping the key's digest to the
+device's identity and current assignment, so a steady stream of readings authenticates without
+touching the database. Changes made through this worker (reassignment, rotation, deletion)
+invalidate the entry at once; other workers see them within DEVICE_KEY_CACHE_TTL_SECONDS.
+"""
+import os
+import time
+import hashlib
+import secrets
+import threading
+from collections import OrderedDict, namedtuple
+
+# --- Configuration ---
+DEVICE_KEY_CACHE_SIZE = int(os.environ.get('DEVICE_KEY_CACHE_SIZE', '10000'))
+DEVICE_KEY_CACHE_TTL_SECONDS = float(os.environ.get('DEVICE_KEY_CACHE_TTL_SECONDS', '300'))
+
+KEY_PREFIX = 'dk_'
+
+DeviceIdentity = namedtuple('DeviceIdentity', ('device_id', 'land_id', 'farm_id', 'hardware_unique_id'))
+
+LOOKUP_SQL = """
+    SELECT id AS device_id, assigned_land_id AS land_id, farm_id, hardware_unique_id
+    FROM hardware_devices WHERE api_key_hash = ?
+"""
+
+
+def generate_key():
+    return KEY_PREFIX + secrets.token_urlsafe(32)
+
+
+def hash_key(key):
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+class DeviceKeyCache:
+    """Thread-safe LRU of key digest -> DeviceIdentity, with entries expiring after `ttl` seconds."""
+
+    def __init__(self, maxsize=DEVICE_KEY_CACHE_SIZE, ttl=DEVICE_KEY_CACHE_TTL_SECONDS):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()  # digest -> (identity, expires_at)
+        self._digests = {}  # device_id -> digest, for invalidation by device
+        self._lock = threading.Lock()
+
+    def get(self, digest):
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None:
+                return None
+            identity, expires_at = entry
+            if expires_at <= time.monotonic():
+                self._remove(digest)
+                return None
+            self._entries.move_to_end(digest)
+            return identity
+
+    def put(self, digest, identity):
+        with self._lock:
+            # A rotated key replaces the device's previous entry
+            previous = self._digests.get(identity.device_id)
+            if previous is not None and previous != digest:
+                self._remove(previous)
+            self._entries[digest] = (identity, time.monotonic() + self.ttl)
+            self._entries.move_to_end(digest)
+            self._digests[identity.device_id] = digest
+            while len(self._entries) > self.maxsize:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate_device(self, device_id):
+        with self._lock:
+            digest = self._digests.get(device_id)
+            if digest is not None:
+                self._remove(digest)
+
+    def _remove(self, digest):
+        identity, _ = self._entries.pop(digest)
+        if self._digests.get(identity.device_id) == digest:
+            del self._digests[identity.device_id]
+
+
+cache = DeviceKeyCache()
+
+
+def authenticate(key, lookup):
+    """
+    DeviceIdentity for a valid key, else None. `lookup(digest)` fetches the device row for a
+    digest (LOOKUP_SQL) and is only called on a cache miss.
+    """
+    if not key or not key.startswith(KEY_PREFIX):
+        return None
+    digest = hash_key(key)
+    identity = cache.get(digest)
+    if identity is None:
+        row = lookup(digest)
+        if row is None:
+            return None
+        identity = DeviceIdentity(row['device_id'], row['land_id'], row['farm_id'], row['hardware_unique_id'])
+        cache.put(digest, identity)
+    return identity
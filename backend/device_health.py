@@ -0,0 +1,140 @@
+"""
+Device health: offline sweeps and uptime / reporting-rate statistics.
+
+Ingest keeps a few counters on hardware_devices up to date (readings_count, health_since,
+offline_seconds, offline_since), so health is read straight off the device row instead of
+scanning soil_readings. A sweeper flips 'active' devices that have not reported for
+DEVICE_OFFLINE_AFTER_SECONDS to 'offline' in a single indexed UPDATE and raises an alert for
+each; the next reading brings the device back and adds the gap to its downtime.
+
+The API runs the sweeper on a background thread in each worker (the UPDATE only matches a
+device once, so concurrent workers do not double-alert). It can also be run from cron:
+    python device_health.py
+"""
+import os
+import time
+import sqlite3
+import logging
+import argparse
+import threading
+
+from serialization import dict_factory
+import alerts
+
+# --- Configuration ---
+DEVICE_OFFLINE_AFTER_SECONDS = int(os.environ.get('DEVICE_OFFLINE_AFTER_SECONDS', '1800'))
+DEVICE_SWEEP_SECONDS = float(os.environ.get('DEVICE_SWEEP_SECONDS', '60'))
+
+logger = logging.getLogger('kisansarthi.device_health')
+
+# Run on every accepted reading; an offline device coming back adds its outage to offline_seconds
+RECORD_READING_SQL = """
+    UPDATE hardware_devices SET
+        last_seen_at = CURRENT_TIMESTAMP,
+        status = 'active',
+        readings_count = readings_count + 1,
+        health_since = COALESCE(health_since, CURRENT_TIMESTAMP),
+        offline_seconds = offline_seconds + COALESCE((julianday('now') - julianday(offline_since)) * 86400, 0),
+        offline_since = NULL
+    WHERE id = ?
+"""
+
+# Uses idx_devices_status_last_seen_at. The outage is counted from the last reading.
+SWEEP_SQL = """
+    UPDATE hardware_devices SET
+        status = 'offline',
+        offline_since = last_seen_at,
+        offline_count = offline_count + 1,
+        updated_at = CURRENT_TIMESTAMP
+    WHERE status = 'active' AND last_seen_at < datetime('now', ?)
+    RETURNING id, farm_id, assigned_land_id, device_name, hardware_unique_id, last_seen_at
+"""
+
+
+def health_columns(table_alias='hd', prefix=''):
+    """
+    SELECT-list fragment with a device's uptime_pct (share of time since its first reading that it
+    was not offline) and readings_per_hour. Both are NULL until the device has reported.
+    """
+    t = table_alias
+    tracked = f"MAX((julianday('now') - julianday({t}.health_since)) * 86400, 60)"
+    down = f"{t}.offline_seconds + COALESCE((julianday('now') - julianday({t}.offline_since)) * 86400, 0)"
+    return (f"ROUND(MAX(100.0 * (1 - ({down}) / {tracked}), 0), 1) AS {prefix}uptime_pct, "
+            f"ROUND({t}.readings_count * 3600.0 / {tracked}, 2) AS {prefix}readings_per_hour, "
+            f"{t}.offline_count AS {prefix}offline_count")
+
+
+def sweep(conn):
+    """Mark stale devices offline and alert their owners. Returns the devices transitioned."""
+    with conn:
+        stale = conn.execute(SWEEP_SQL, (f'-{DEVICE_OFFLINE_AFTER_SECONDS} seconds',)).fetchall()
+        if not stale:
+            return []
+        farm_ids = sorted({device['farm_id'] for device in stale})
+        owners = {row['id']: row['user_id'] for row in conn.execute(
+            f"SELECT id, user_id FROM farms WHERE id IN ({','.join('?' * len(farm_ids))})", farm_ids)}
+        rows = [(owners[device['farm_id']], device['assigned_land_id'], 'alert',
+                 f"{device['device_name'] or device['hardware_unique_id']} is offline",
+                 f"No readings since {device['last_seen_at']} UTC.",
+                 "Check the device's power and network connection.", 'device_offline', 'medium')
+                for device in stale if device['farm_id'] in owners]
+        conn.executemany(alerts.INSERT_ALERTS_SQL, rows)
+    logger.info("Marked %d devices offline", len(stale))
+    return stale
+
+
+class DeviceSweeper:
+    """Runs sweep() every DEVICE_SWEEP_SECONDS on a daemon thread, one per worker process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self.db_file = None
+
+    def ensure_started(self, db_file):
+        # DEVICE_SWEEP_SECONDS=0 leaves sweeping to the cron command
+        if self._pid == os.getpid() or DEVICE_SWEEP_SECONDS <= 0:
+            return
+        with self._lock:
+            # Threads do not survive a fork, so each worker starts its own
+            if self._pid != os.getpid():
+                self.db_file = db_file
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='device-sweeper', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(DEVICE_SWEEP_SECONDS)
+            try:
+                conn = sqlite3.connect(self.db_file, timeout=30)
+                conn.row_factory = dict_factory
+                try:
+                    sweep(conn)
+                finally:
+                    conn.close()
+            except Exception:
+                logger.exception("Device sweep failed")
+
+
+sweeper = DeviceSweeper()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mark devices that stopped reporting as offline.")
+    parser.add_argument('--db', default=os.environ.get('DATABASE', 'farm_app.db'))
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    conn = sqlite3.connect(args.db)
+    conn.row_factory = dict_factory
+    try:
+        stale = sweep(conn)
+    finally:
+        conn.close()
+    print(f"Marked {len(stale)} devices offline.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""
+Response shaping for the list endpoints: sparse fieldsets (?fields=a,b), MessagePack for
+clients that ask for it, and gzip/brotli compression.
+
+msgpack and brotli are optional; without them clients get JSON and gzip respectively.
+"""
+import os
+import gzip
+import datetime
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# --- Configuration ---
+# Bodies smaller than this go out uncompressed; the headers would eat most of the saving
+COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', '1024'))
+GZIP_LEVEL = int(os.environ.get('GZIP_LEVEL', '6'))
+BROTLI_QUALITY = int(os.environ.get('BROTLI_QUALITY', '5'))
+
+MSGPACK_MIMETYPES = ('application/msgpack', 'application/x-msgpack')
+COMPRESSIBLE_MIMETYPES = ('application/json', 'text/csv', 'text/plain', 'application/x-ndjson') + MSGPACK_MIMETYPES
+
+
+def parse_fields(value, allowed=None):
+    """
+    Parse a comma-separated ?fields= value into an ordered list of field names, or None if
+    absent. Names outside `allowed` (when given) are dropped, like the readings `parameters` filter.
+    """
+    if not value:
+        return None
+    fields = []
+    for name in value.split(','):
+        name = name.strip()
+        if name and name not in fields and (allowed is None or name in allowed):
+            fields.append(name)
+    return fields or None
+
+
+def project(rows, fields):
+    """Keep only `fields` of each row dict (a single dict or a list of them); no-op when fields is None."""
+    if fields is None:
+        return rows
+    if isinstance(rows, dict):
+        return {k: rows[k] for k in fields if k in rows}
+    return [{k: row[k] for k in fields if k in row} for row in rows]
+
+
+def wants_msgpack(accept_mimetypes):
+    """True if msgpack is installed and the Accept header prefers it over JSON."""
+    if msgpack is None:
+        return False
+    best = accept_mimetypes.best_match(('application/json',) + MSGPACK_MIMETYPES, default='application/json')
+    return best in MSGPACK_MIMETYPES
+
+
+def _msgpack_default(value):
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    return str(value)
+
+
+def encode_msgpack(payload):
+    return msgpack.packb(payload, default=_msgpack_default, use_bin_type=True)
+
+
+def choose_content_encoding(accept_encodings):
+    """Pick 'br' or 'gzip' from a parsed Accept-Encoding header, or None for identity."""
+    candidates = ('br', 'gzip') if brotli is not None else ('gzip',)
+    return accept_encodings.best_match(candidates)
+
+
+def compress(body, content_encoding):
+    if content_encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
@@ -0,0 +1,114 @@
+"""
+Streaming export writers.
+
+Each writer takes an open cursor plus the export's column spec and yields encoded chunks
+of at most EXPORT_CHUNK_ROWS rows, so an export of any size is served in constant memory
+straight from SQLite. Parquet needs the optional pyarrow package.
+"""
+import io
+import os
+import csv
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# --- Configuration ---
+EXPORT_CHUNK_ROWS = int(os.environ.get('EXPORT_CHUNK_ROWS', '5000'))
+
+# (column, type) pairs; the type picks the Parquet column type, since SQLite columns are untyped
+SOIL_READING_COLUMNS = (
+    ('id', 'int'), ('timestamp', 'str'), ('received_at', 'str'),
+    ('farm_id', 'int'), ('farm_name', 'str'), ('land_id', 'int'), ('land_name', 'str'),
+    ('device_id', 'int'), ('hardware_unique_id', 'str'),
+    ('ph_value', 'float'), ('nitrogen_value', 'float'), ('phosphorus_value', 'float'),
+    ('potassium_value', 'float'), ('moisture_value', 'float'), ('temperature_value', 'float'),
+    ('humidity_value', 'float'), ('source', 'str'),
+)
+
+DIAGNOSIS_LOG_COLUMNS = (
+    ('id', 'int'), ('scan_timestamp', 'str'), ('farm_id', 'int'), ('land_id', 'int'), ('land_name', 'str'),
+    ('planting_id', 'int'), ('processing_status', 'str'), ('detected_disease_id', 'int'),
+    ('disease_name', 'str'), ('confidence_score', 'float'), ('image_storage_url', 'str'), ('notes', 'str'),
+)
+
+# format -> (mimetype, file extension)
+FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+
+
+def available_formats():
+    return [name for name in FORMATS if name != 'parquet' or pyarrow is not None]
+
+
+def _batches(cursor):
+    while True:
+        rows = cursor.fetchmany(EXPORT_CHUNK_ROWS)
+        if not rows:
+            return
+        yield rows
+
+
+def csv_chunks(cursor, columns):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([name for name, _ in columns])
+    for rows in _batches(cursor):
+        writer.writerows(rows)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    # Header only, for an empty export
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def ndjson_chunks(cursor, columns, dumpb):
+    """One JSON object per line; `dumpb` encodes a dict to bytes (app.json.dumpb)."""
+    names = [name for name, _ in columns]
+    for rows in _batches(cursor):
+        yield b''.join(dumpb(dict(zip(names, row))) + b'\n' for row in rows)
+
+
+def arrow_schema(columns):
+    types = {'int': pyarrow.int64(), 'float': pyarrow.float64(), 'str': pyarrow.string()}
+    return pyarrow.schema([(name, types[kind]) for name, kind in columns])
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands back whatever was written since the last drain()."""
+
+    def __init__(self):
+        self._parts = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self._parts)
+        self._parts = []
+        return data
+
+
+def parquet_chunks(cursor, columns):
+    """One Parquet row group per batch, flushed to the client as soon as it is written."""
+    schema = arrow_schema(columns)
+    sink = _ChunkSink()
+    writer = pyarrow.parquet.ParquetWriter(sink, schema, compression='zstd')
+    try:
+        for rows in _batches(cursor):
+            arrays = [pyarrow.array(values, type=field.type) for field, values in zip(schema, zip(*rows))]
+            writer.write_table(pyarrow.Table.from_arrays(arrays, schema=schema))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
@@ -0,0 +1,310 @@
+"""
+Asyncio ingestion gateway for high-frequency soil sensors.
+
+Posting JSON to /ingest/soil-readings costs an HTTP request, a Flask dispatch, a JSON decode and
+a commit per reading. Devices that report every minute can instead keep one TCP connection open
+to this gateway, or send UDP datagrams, with one reading per line:
+
+    <device key> <timestamp> <field>=<value>[,<field>=<value>...]
+    dk_3f9c... 1767225600 ph=6.4,n=42,p=18,k=110,moisture=31.5,temp=24.1,humidity=63
+
+The timestamp is unix seconds or ISO 8601. Fields are reading columns (ph_value) or the short
+names in FIELD_ALIASES. Over TCP every line is answered, in order, with "ok" or "err <reason>",
+so devices can pipeline; UDP is fire-and-forget and a datagram may hold several lines.
+
+Keys go through the same device_auth cache as the HTTP path, so a known device costs one
+SHA-256 and a dict lookup on the event loop. Accepted readings are queued and a single writer
+thread, which owns the SQLite connection, screens them with the anomaly detector and commits
+them in batches of up to GATEWAY_BATCH_SIZE, updating device health and raising sensor and
+agronomic alerts as the HTTP path does. A reading repeating a device and timestamp already
+stored is a retry and is skipped. "ok" means accepted for writing (as HTTP 202 does); the queue
+is drained on shutdown. When the queue is full, TCP connections stop being read (TCP flow
+control pushes back on the device) and UDP readings are dropped and counted.
+
+The gateway is its own process: readings reach the API's live streams through their periodic
+database recheck, and a device should use either this gateway or HTTP, since each process keeps
+its own anomaly state per device.
+
+Run from the backend directory:
+    python gateway.py --tcp-port 7070 --udp-port 7071
+"""
+import os
+import math
+import signal
+import asyncio
+import sqlite3
+import logging
+import argparse
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from serialization import dict_factory
+import anomaly
+import alerts
+import ingest
+import device_auth
+import device_health
+
+# --- Configuration ---
+GATEWAY_BATCH_SIZE = int(os.environ.get('GATEWAY_BATCH_SIZE', '500'))
+# How long the writer lets a batch fill up after the first reading arrives
+GATEWAY_BATCH_MS = float(os.environ.get('GATEWAY_BATCH_MS', '50'))
+# Readings accepted but not yet written; beyond this TCP waits and UDP drops
+GATEWAY_QUEUE_SIZE = int(os.environ.get('GATEWAY_QUEUE_SIZE', '10000'))
+GATEWAY_MAX_LINE_BYTES = int(os.environ.get('GATEWAY_MAX_LINE_BYTES', '1024'))
+
+logger = logging.getLogger('kisansarthi.gateway')
+
+FIELD_ALIASES = {
+    'ph': 'ph_value', 'n': 'nitrogen_value', 'p': 'phosphorus_value', 'k': 'potassium_value',
+    'moisture': 'moisture_value', 'temp': 'temperature_value', 'humidity': 'humidity_value',
+}
+FIELD_ALIASES.update({column: column for column in anomaly.PARAMETERS})
+
+OWNER_SQL = "SELECT user_id FROM farms WHERE id = ?"
+
+
+def parse_line(line):
+    """(key, timestamp, {column: float}) for one protocol line; ValueError with a short reason."""
+    parts = line.split()
+    if len(parts) != 3:
+        raise ValueError("expected '<key> <timestamp> <field>=<value>,...'")
+    key, timestamp, fields = parts
+    if timestamp.replace('.', '', 1).isdigit():
+        timestamp = datetime.datetime.fromtimestamp(float(timestamp), datetime.timezone.utc).isoformat()
+    else:
+        timestamp = ingest.parse_timestamp(timestamp)
+    values = {}
+    for field in fields.split(','):
+        name, sep, value = field.partition('=')
+        column = FIELD_ALIASES.get(name)
+        if column is None or not sep:
+            raise ValueError(f"unknown field {name!r}")
+        try:
+            number = float(value)
+        except ValueError:
+            raise ValueError(f"{name} is not a number") from None
+        if not math.isfinite(number):
+            raise ValueError(f"{name} is not a number")
+        values[column] = number
+    return key, timestamp, values
+
+
+class IngestGateway:
+    def __init__(self, db_file, batch_size=GATEWAY_BATCH_SIZE, batch_ms=GATEWAY_BATCH_MS, queue_size=GATEWAY_QUEUE_SIZE):
+        self.db_file = db_file
+        self.batch_size = batch_size
+        self.batch_seconds = batch_ms / 1000.0
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        # One thread owns the SQLite connection: key lookups on a cache miss and batch writes
+        self._db = ThreadPoolExecutor(max_workers=1, thread_name_prefix='gateway-db', initializer=self._connect)
+        self._conn = None
+        self._owners = {}  # farm_id -> user_id, for sensor alerts
+        self._writer = None
+        self._datagram_tasks = set()  # keeps UDP accept() tasks referenced until they finish
+        self.counts = {'accepted': 0, 'rejected': 0, 'dropped': 0, 'duplicates': 0, 'written': 0, 'failed': 0, 'batches': 0}
+
+    def _connect(self):
+        self._conn = sqlite3.connect(self.db_file, timeout=30)
+        self._conn.row_factory = dict_factory
+        self._conn.execute("PRAGMA foreign_keys = ON;")
+
+    def _lookup(self, digest):
+        return self._conn.execute(device_auth.LOOKUP_SQL, (digest,)).fetchone()
+
+    async def accept(self, line, wait=True):
+        """Validate, authenticate and queue one line. Returns the reply for the device."""
+        try:
+            key, timestamp, values = parse_line(line.decode('utf-8', 'replace'))
+        except ValueError as e:
+            self.counts['rejected'] += 1
+            return f"err {e}\n".encode()
+        device = None
+        if key.startswith(device_auth.KEY_PREFIX):
+            device = device_auth.cache.get(device_auth.hash_key(key))
+            if device is None:
+                device = await asyncio.get_running_loop().run_in_executor(
+                    self._db, device_auth.authenticate, key, self._lookup)
+        if device is None:
+            self.counts['rejected'] += 1
+            return b"err invalid device key\n"
+        if not device.land_id:
+            self.counts['rejected'] += 1
+            return b"err device is not assigned to a land plot\n"
+        item = (device, timestamp, values)
+        if wait:
+            await self.queue.put(item)
+        else:
+            try:
+                self.queue.put_nowait(item)
+            except asyncio.QueueFull:
+                self.counts['dropped'] += 1
+                return b"err gateway busy\n"
+        self.counts['accepted'] += 1
+        return b"ok\n"
+
+    async def handle_tcp(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if line.strip():
+                    writer.write(await self.accept(line))
+                # Replies are buffered; only wait when the device stops reading them
+                if writer.transport.get_write_buffer_size() > 65536:
+                    await writer.drain()
+            await writer.drain()
+        except ValueError:
+            # Line longer than the stream limit: the framing is lost, so drop the connection
+            writer.write(b"err line too long\n")
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    def handle_datagram(self, data):
+        for line in data.splitlines():
+            if line.strip():
+                task = asyncio.ensure_future(self.accept(line, wait=False))
+                self._datagram_tasks.add(task)
+                task.add_done_callback(self._datagram_tasks.discard)
+
+    async def run_writer(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            if self.queue.qsize() < self.batch_size - 1:
+                await asyncio.sleep(self.batch_seconds)
+            while len(batch) < self.batch_size and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            try:
+                await loop.run_in_executor(self._db, self.write_batch, batch)
+            except Exception:
+                # e.g. the database stayed locked past the timeout; the batch is lost, the gateway carries on
+                self.counts['failed'] += len(batch)
+                logger.exception("Gateway batch of %d readings failed", len(batch))
+            for _ in batch:
+                self.queue.task_done()
+
+    def write_batch(self, batch):
+        """Screen and insert a batch in one transaction (runs on the database thread)."""
+        conn = self._conn
+        rows, sensor_alerts, newest, seen = [], [], {}, set()
+        for device, timestamp, values in batch:
+            # Retries of readings already stored (or already in this batch) are skipped unscreened
+            if (device.device_id, timestamp) in seen or conn.execute(
+                    ingest.DUPLICATE_READING_SQL, (device.device_id, timestamp)).fetchone():
+                self.counts['duplicates'] += 1
+                continue
+            seen.add((device.device_id, timestamp))
+            flags = anomaly.detector.observe(conn, device.device_id, values)
+            quality_flag = anomaly.reading_flag(flags)
+            rows.append(ingest.reading_row(device.device_id, device.land_id, device.farm_id, timestamp, values, quality_flag, 'sensor'))
+            if flags:
+                due = [flag for flag in flags if anomaly.detector.alert_due(device.device_id, flag[0], flag[1])]
+                if due and self._owner(device.farm_id) is not None:
+                    sensor_alerts.extend(anomaly.sensor_alert_rows(self._owner(device.farm_id), device.land_id, due))
+            elif device.land_id not in newest or timestamp >= newest[device.land_id]['timestamp']:
+                newest[device.land_id] = dict(values, land_id=device.land_id, timestamp=timestamp)
+        try:
+            written = self._insert(rows, sensor_alerts)
+        except sqlite3.IntegrityError:
+            # e.g. a device deleted since its key was cached; keep the rest of the batch
+            written = 0
+            for row in rows:
+                try:
+                    written += self._insert([row], [])
+                except sqlite3.IntegrityError as e:
+                    self.counts['failed'] += 1
+                    logger.warning("Dropped reading from device %s: %s", row[0], e)
+        self.counts['batches'] += 1
+        self.counts['written'] += written
+        for reading in newest.values():
+            alerts.engine.submit(self.db_file, reading)
+        if anomaly.detector.checkpoint_due():
+            anomaly.detector.checkpoint(conn)
+
+    def _insert(self, rows, sensor_alerts):
+        """Insert rows and their device health updates in one transaction; returns how many were new."""
+        written = 0
+        with self._conn:
+            for row in rows:
+                # rowcount is 0 for a duplicate that raced past the check in write_batch
+                if self._conn.execute(ingest.INSERT_READING_SQL, row).rowcount:
+                    self._conn.execute(device_health.RECORD_READING_SQL, (row[0],))
+                    written += 1
+            if sensor_alerts:
+                self._conn.executemany(anomaly.INSERT_SENSOR_ALERTS_SQL, sensor_alerts)
+        return written
+
+    def _owner(self, farm_id):
+        if farm_id not in self._owners:
+            row = self._conn.execute(OWNER_SQL, (farm_id,)).fetchone()
+            self._owners[farm_id] = row['user_id'] if row else None
+        return self._owners[farm_id]
+
+    async def start(self, host='0.0.0.0', tcp_port=7070, udp_port=None):
+        """Start listening; returns the TCP server (its sockets give the bound port)."""
+        loop = asyncio.get_running_loop()
+        self._writer = asyncio.ensure_future(self.run_writer())
+        self.tcp_server = await asyncio.start_server(self.handle_tcp, host, tcp_port, limit=GATEWAY_MAX_LINE_BYTES)
+        self.udp_transport = None
+        if udp_port is not None:
+            gateway = self
+
+            class DatagramProtocol(asyncio.DatagramProtocol):
+                def datagram_received(self, data, addr):
+                    gateway.handle_datagram(data)
+
+            self.udp_transport, _ = await loop.create_datagram_endpoint(DatagramProtocol, local_addr=(host, udp_port))
+        return self.tcp_server
+
+    async def stop(self):
+        """Stop accepting, write everything already accepted, then checkpoint and flush alerts."""
+        self.tcp_server.close()
+        await self.tcp_server.wait_closed()
+        if self.udp_transport is not None:
+            self.udp_transport.close()
+        await self.queue.join()
+        self._writer.cancel()
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._db, anomaly.detector.checkpoint, self._conn)
+        await loop.run_in_executor(self._db, alerts.engine.flush)
+        self._db.shutdown()
+        logger.info("Gateway stopped: %s", self.counts)
+
+
+async def serve(db_file, host, tcp_port, udp_port):
+    gateway = IngestGateway(db_file)
+    server = await gateway.start(host, tcp_port, udp_port)
+    logger.info("Listening on tcp %s%s", ', '.join(str(s.getsockname()) for s in server.sockets),
+                f", udp {host}:{udp_port}" if udp_port is not None else "")
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stopping.set)
+    last = dict(gateway.counts)
+    while not stopping.is_set():
+        try:
+            await asyncio.wait_for(stopping.wait(), timeout=60)
+        except asyncio.TimeoutError:
+            if gateway.counts != last:
+                logger.info("Gateway: %s", gateway.counts)
+                last = dict(gateway.counts)
+    await gateway.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Line-protocol ingestion gateway for soil sensors.")
+    parser.add_argument('--db', default=os.environ.get('DATABASE', 'farm_app.db'))
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--tcp-port', type=int, default=int(os.environ.get('GATEWAY_TCP_PORT', '7070')))
+    parser.add_argument('--udp-port', type=int, default=None, help="Also accept UDP datagrams on this port")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(name)s %(message)s')
+    asyncio.run(serve(args.db, args.host, args.tcp_port, args.udp_port))
+
+
+if __name__ == '__main__':
+    main()
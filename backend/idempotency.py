@@ -0,0 +1,79 @@
+"""
+Idempotency keys for write endpoints that clients retry.
+
+A client that may resend a request (a device on a flaky link, the app re-uploading a lab report)
+sends an `Idempotency-Key` header. The first request with a key claims it in idempotency_keys
+before doing any work; once it succeeds its status and JSON body are stored, and any later
+request with the same key and the same body gets that stored response back instead of writing
+again. Keys are scoped to the caller (user or device), so clients cannot collide with each other.
+
+A key reused with a different request body is refused (409), as is a retry that arrives while the
+first request is still running. Failed requests release their key so the client can try again.
+Stored responses expire after IDEMPOTENCY_KEY_TTL_SECONDS; claims abandoned by a crashed worker
+can be taken over after IDEMPOTENCY_PENDING_SECONDS.
+"""
+import os
+import time
+import hashlib
+
+# --- Configuration ---
+IDEMPOTENCY_KEY_TTL_SECONDS = int(os.environ.get('IDEMPOTENCY_KEY_TTL_SECONDS', str(24 * 3600)))
+IDEMPOTENCY_PENDING_SECONDS = int(os.environ.get('IDEMPOTENCY_PENDING_SECONDS', '60'))
+MAX_KEY_LENGTH = 255
+
+# Takes the key if it is new, expired, or an abandoned claim; rowcount tells whether it did
+CLAIM_SQL = """
+    INSERT INTO idempotency_keys (scope, idempotency_key, fingerprint, created_at)
+    VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+    ON CONFLICT (scope, idempotency_key) DO UPDATE SET
+        fingerprint = excluded.fingerprint, status_code = NULL, response = NULL,
+        created_at = excluded.created_at
+    WHERE idempotency_keys.created_at < datetime('now', ?)
+       OR (idempotency_keys.status_code IS NULL AND idempotency_keys.created_at < datetime('now', ?))
+"""
+
+STORED_SQL = """
+    SELECT fingerprint, status_code, response FROM idempotency_keys
+    WHERE scope = ? AND idempotency_key = ?
+"""
+
+COMPLETE_SQL = """
+    UPDATE idempotency_keys SET status_code = ?, response = ?
+    WHERE scope = ? AND idempotency_key = ?
+"""
+
+RELEASE_SQL = "DELETE FROM idempotency_keys WHERE scope = ? AND idempotency_key = ? AND status_code IS NULL"
+
+PURGE_SQL = "DELETE FROM idempotency_keys WHERE created_at < datetime('now', ?)"
+
+_last_purge = 0.0
+
+
+def fingerprint(method, path, body):
+    return hashlib.sha256(method.encode() + b' ' + path.encode() + b'\n' + body).hexdigest()
+
+
+def claim(conn, scope, key, request_fingerprint):
+    """None if this request now owns the key, else the stored row (fingerprint, status_code, response)."""
+    with conn:
+        claimed = conn.execute(CLAIM_SQL, (scope, key, request_fingerprint,
+                                           f'-{IDEMPOTENCY_KEY_TTL_SECONDS} seconds',
+                                           f'-{IDEMPOTENCY_PENDING_SECONDS} seconds')).rowcount
+    if claimed:
+        return None
+    return conn.execute(STORED_SQL, (scope, key)).fetchone()
+
+
+def complete(conn, scope, key, status_code, body):
+    global _last_purge
+    with conn:
+        conn.execute(COMPLETE_SQL, (status_code, body, scope, key))
+        # Expired keys are cleared at most once a minute per worker, on the back of a write
+        if time.monotonic() - _last_purge >= 60:
+            _last_purge = time.monotonic()
+            conn.execute(PURGE_SQL, (f'-{IDEMPOTENCY_KEY_TTL_SECONDS} seconds',))
+
+
+def release(conn, scope, key):
+    with conn:
+        conn.execute(RELEASE_SQL, (scope, key))
@@ -0,0 +1,155 @@
+"""
+Validation shared by every way soil readings enter the database.
+
+Sensors post one reading at a time to /ingest/soil-readings; farmers enter a reading by hand
+(POST /lands/<id>/manual-soil-reading) or upload a lab report as CSV (POST
+/farms/<id>/soil-readings/import). All three build rows in READING_COLUMNS order and are
+inserted with INSERT_READING_SQL, and every row records its `source` ('sensor', 'manual' or
+'lab') so consumers can weigh sensor data and human-entered values differently.
+
+Sensor values are screened against the device's history by anomaly.py and stored flagged when
+suspicious. Human-entered values have no history to compare with, so they are only range
+checked, and an impossible value rejects the request instead of being stored. A CSV import is
+all or nothing: every row is validated before any is inserted, and errors name the CSV line.
+"""
+import io
+import os
+import csv
+import math
+import datetime
+
+import anomaly
+
+# --- Configuration ---
+# Largest lab report accepted by one import request
+IMPORT_MAX_ROWS = int(os.environ.get('IMPORT_MAX_ROWS', '5000'))
+
+SOURCES = ('sensor', 'manual', 'lab')
+
+# soil_readings columns written on ingest, in parameter order
+READING_COLUMNS = ('device_id', 'land_id', 'farm_id', 'timestamp', *anomaly.PARAMETERS, 'quality_flag', 'source')
+
+# A sensor reading repeating a (device_id, timestamp) already stored is a retry and is skipped;
+# the cursor's rowcount is 0 for it
+INSERT_READING_SQL = f"""
+    INSERT INTO soil_readings ({', '.join(READING_COLUMNS)})
+    VALUES ({', '.join('?' * len(READING_COLUMNS))})
+    ON CONFLICT DO NOTHING
+"""
+
+# Lets sensor paths recognise a retry before feeding its values to the anomaly detector again
+DUPLICATE_READING_SQL = "SELECT id FROM soil_readings WHERE device_id = ? AND timestamp = ?"
+
+# CSV headers are matched case-insensitively, with spaces read as underscores ("Land Name"),
+# against the column name or its label ("pH", "Nitrogen")
+CSV_HEADERS = {column: column for column in anomaly.PARAMETERS}
+CSV_HEADERS.update({spec[0].lower(): column for column, spec in anomaly.PARAMETERS.items()})
+
+
+def reading_row(device_id, land_id, farm_id, timestamp, values, quality_flag, source):
+    """Parameters for INSERT_READING_SQL; `values` maps parameter columns to values (missing = NULL)."""
+    return (device_id, land_id, farm_id, timestamp,
+            *(values.get(column) for column in anomaly.PARAMETERS), quality_flag, source)
+
+
+def parse_timestamp(value):
+    """
+    ISO 8601 text (a trailing 'Z' is accepted) normalised to isoformat(); ValueError if invalid.
+    Timestamps with an offset are converted to UTC, so one instant always has one spelling: the
+    duplicate check matches retries, and timestamps sort in time order.
+    """
+    if not isinstance(value, str):
+        raise ValueError("Invalid timestamp format. Use ISO 8601 format.")
+    try:
+        parsed = datetime.datetime.fromisoformat(value.strip().replace('Z', '+00:00'))
+    except ValueError:
+        raise ValueError("Invalid timestamp format. Use ISO 8601 format.") from None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(datetime.timezone.utc)
+    return parsed.isoformat()
+
+
+def checked_values(data):
+    """
+    {column: float or None} for the parameter columns in `data`. Raises ValueError naming every
+    value that is not a number or lies outside the parameter's valid range.
+    """
+    values, problems = {}, []
+    for column, (label, low, high, _) in anomaly.PARAMETERS.items():
+        value = data.get(column)
+        if value is None or (isinstance(value, str) and not value.strip()):
+            values[column] = None
+            continue
+        try:
+            number = float(value)
+        except (TypeError, ValueError):
+            problems.append(f"{label} value {value!r} is not a number")
+            continue
+        if math.isnan(number) or not low <= number <= high:
+            problems.append(f"{label} value {number:g} is outside the valid range {low:g}-{high:g}")
+            continue
+        values[column] = number
+    if problems:
+        raise ValueError("; ".join(problems))
+    if all(value is None for value in values.values()):
+        raise ValueError("At least one soil reading value is required.")
+    return values
+
+
+def manual_reading(data):
+    """(timestamp, values) for a reading entered by hand; the timestamp defaults to now (UTC)."""
+    if data.get('timestamp'):
+        timestamp = parse_timestamp(data['timestamp'])
+    else:
+        timestamp = datetime.datetime.now(datetime.timezone.utc).isoformat()
+    return timestamp, checked_values(data)
+
+
+def parse_csv(text, max_rows=IMPORT_MAX_ROWS):
+    """
+    Parse a lab report with a header row. Each row names its land by `land_id` or `land_name`,
+    has a `timestamp` (a sample date is enough) and at least one parameter column.
+    Returns (rows, errors): rows are dicts with 'line', 'land_id' or 'land_name', 'timestamp'
+    and 'values'; errors are "line N: ..." messages. Rows are only usable if errors is empty.
+    """
+    reader = csv.reader(io.StringIO(text.lstrip('\ufeff')))
+    header = next(reader, None)
+    if not header:
+        return [], ["The file is empty."]
+    names = [name.strip().lower().replace(' ', '_') for name in header]
+    columns = [CSV_HEADERS.get(name, name) for name in names]
+    if 'land_id' not in columns and 'land_name' not in columns:
+        return [], ["The header needs a land_id or land_name column."]
+    if 'timestamp' not in columns:
+        return [], ["The header needs a timestamp column."]
+    if not any(column in anomaly.PARAMETERS for column in columns):
+        return [], ["The header has no soil reading columns (e.g. ph_value, nitrogen_value)."]
+
+    rows, errors = [], []
+    for record in reader:
+        if not any(field.strip() for field in record):
+            continue
+        line = reader.line_num
+        if len(rows) + len(errors) >= max_rows:
+            errors.append(f"line {line}: more than {max_rows} rows; split the file.")
+            break
+        fields = dict(zip(columns, record))
+        row = {'line': line}
+        try:
+            if fields.get('land_id', '').strip():
+                if not fields['land_id'].strip().isdigit():
+                    raise ValueError(f"land_id {fields['land_id']!r} is not a number")
+                row['land_id'] = int(fields['land_id'])
+            elif fields.get('land_name', '').strip():
+                row['land_name'] = fields['land_name'].strip()
+            else:
+                raise ValueError("land_id or land_name is required")
+            row['timestamp'] = parse_timestamp(fields.get('timestamp', ''))
+            row['values'] = checked_values(fields)
+        except ValueError as e:
+            errors.append(f"line {line}: {e}")
+            continue
+        rows.append(row)
+    if not rows and not errors:
+        errors.append("The file has no readings.")
+    return rows, errors
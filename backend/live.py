@@ -0,0 +1,120 @@
+"""
+In-memory pub/sub for live updates (Server-Sent Events).
+
+Ingest publishes the newest new clean reading id of each land it stored readings for; every
+open stream for that land has its own bounded queue. Publishing never blocks: when a
+subscriber's queue is full its oldest message is dropped and the subscriber is marked as lagged,
+so a slow reader cannot hold up ingestion or grow memory.
+
+A message only wakes the stream up: the stream then reads every row after the last id it sent
+from the database, which is the one place readings from all workers meet, so a reading committed
+by another worker is never skipped and dropped messages lose nothing. The hub is per worker;
+streams also recheck the database every LIVE_RECHECK_SECONDS while idle, so readings ingested
+by another worker arrive even when nothing happens locally, just less promptly.
+"""
+import os
+import queue
+import threading
+
+# --- Configuration ---
+LIVE_QUEUE_SIZE = int(os.environ.get('LIVE_QUEUE_SIZE', '16'))
+# Streams held open at once per worker; each one occupies a server thread
+LIVE_MAX_SUBSCRIBERS = int(os.environ.get('LIVE_MAX_SUBSCRIBERS', '64'))
+LIVE_RECHECK_SECONDS = float(os.environ.get('LIVE_RECHECK_SECONDS', '15'))
+# Streams are closed after this long; EventSource-style clients reconnect with Last-Event-ID
+LIVE_MAX_STREAM_SECONDS = float(os.environ.get('LIVE_MAX_STREAM_SECONDS', '300'))
+
+
+class Subscriber:
+    __slots__ = ('topic', 'queue', 'lagged', 'dropped', 'wake')
+
+    def __init__(self, topic, size):
+        self.topic = topic
+        self.queue = queue.Queue(maxsize=size)
+        self.lagged = False
+        self.dropped = 0
+        # Optional callable run after each publish, from the publishing thread (asgi.py's
+        # streams wait on the event loop rather than on the queue)
+        self.wake = None
+
+
+class PubSubHub:
+    def __init__(self, queue_size=LIVE_QUEUE_SIZE, max_subscribers=LIVE_MAX_SUBSCRIBERS):
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self._topics = {}  # topic -> set of Subscriber
+        self._count = 0
+        self._dropped = 0
+        self._lock = threading.Lock()
+
+    def open(self, topic):
+        """A new Subscriber for `topic`, or None if the worker already has max_subscribers."""
+        with self._lock:
+            if self._count >= self.max_subscribers:
+                return None
+            subscriber = Subscriber(topic, self.queue_size)
+            self._topics.setdefault(topic, set()).add(subscriber)
+            self._count += 1
+            return subscriber
+
+    def close(self, subscriber):
+        """Unsubscribe; safe to call more than once."""
+        with self._lock:
+            subscribers = self._topics.get(subscriber.topic)
+            if subscribers is None or subscriber not in subscribers:
+                return
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self._topics[subscriber.topic]
+            self._count -= 1
+
+    def has_subscribers(self, topic):
+        # Unlocked read: publishers use it only to skip encoding when nobody is listening
+        return topic in self._topics
+
+    def publish(self, topic, message):
+        """Queue `message` for every subscriber of `topic` without blocking. Returns how many got it."""
+        with self._lock:
+            subscribers = list(self._topics.get(topic, ()))
+        for subscriber in subscribers:
+            while True:
+                try:
+                    subscriber.queue.put_nowait(message)
+                    break
+                except queue.Full:
+                    # Backpressure: drop the oldest message rather than block ingestion
+                    try:
+                        subscriber.queue.get_nowait()
+                    except queue.Empty:
+                        pass
+                    subscriber.lagged = True
+                    subscriber.dropped += 1
+                    with self._lock:
+                        self._dropped += 1
+            if subscriber.wake is not None:
+                subscriber.wake()
+        return len(subscribers)
+
+    def stats(self):
+        with self._lock:
+            return {"subscribers": self._count, "topics": len(self._topics), "dropped_messages": self._dropped}
+
+
+def drain(subscriber):
+    """Discard the subscriber's queued wake-ups; the caller reads the database next."""
+    while True:
+        try:
+            subscriber.queue.get_nowait()
+        except queue.Empty:
+            subscriber.lagged = False
+            return
+
+
+def sse_event(event, data, event_id=None):
+    """One Server-Sent Event; `data` is already-encoded JSON bytes without newlines."""
+    head = f"id: {event_id}\n".encode() if event_id is not None else b''
+    return head + b'event: ' + event.encode() + b'\ndata: ' + data + b'\n\n'
+
+
+# Keyed by land_id; messages are (reading id, encoded reading)
+soil_readings = PubSubHub()
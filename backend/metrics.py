@@ -0,0 +1,161 @@
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+# --- Configuration ---
+# Queries slower than this are logged with their SQL (0 disables the slow-query log)
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', '0'))
+
+# Same default buckets as the Prometheus client libraries, in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0)
+
+slow_query_logger = logging.getLogger('kisansarthi.slow_query')
+
+
+class Counter:
+    """Monotonic counter keyed by a tuple of label values."""
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(l, '')) for l in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield self.name, dict(zip(self.labelnames, key)), value
+
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by a tuple of label values."""
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}  # key -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(l, '')) for l in self.labelnames)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+            state[-2] += 1
+            state[-1] += value
+
+    def samples(self):
+        with self._lock:
+            items = [(key, list(state)) for key, state in self._values.items()]
+        for key, state in items:
+            labels = dict(zip(self.labelnames, key))
+            for i, bound in enumerate(self.buckets):
+                yield self.name + '_bucket', dict(labels, le=repr(bound)), state[i]
+            yield self.name + '_bucket', dict(labels, le='+Inf'), state[-2]
+            yield self.name + '_count', labels, state[-2]
+            yield self.name + '_sum', labels, state[-1]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """Render every metric in the Prometheus text exposition format."""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                if labels:
+                    label_str = ','.join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+                    lines.append(f"{name}{{{label_str}}} {value}")
+                else:
+                    lines.append(f"{name} {value}")
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+REGISTRY = Registry()
+
+HTTP_REQUESTS = REGISTRY.register(Counter(
+    'kisansarthi_http_requests_total', 'HTTP requests handled, by route, method and status.',
+    ('route', 'method', 'status')))
+HTTP_LATENCY = REGISTRY.register(Histogram(
+    'kisansarthi_http_request_duration_seconds', 'HTTP request latency, by route and method.',
+    ('route', 'method')))
+DB_QUERIES = REGISTRY.register(Counter(
+    'kisansarthi_db_queries_total', 'SQLite statements executed, by route and operation.',
+    ('route', 'operation')))
+DB_LATENCY = REGISTRY.register(Histogram(
+    'kisansarthi_db_query_duration_seconds', 'SQLite statement latency, by route and operation.',
+    ('route', 'operation'),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)))
+SLOW_QUERIES = REGISTRY.register(Counter(
+    'kisansarthi_db_slow_queries_total', 'SQLite statements slower than SLOW_QUERY_MS, by route.',
+    ('route',)))
+EXTERNAL_CALLS = REGISTRY.register(Counter(
+    'kisansarthi_external_calls_total', 'Model inference, LLM and weather calls, by kind and outcome.',
+    ('kind', 'name', 'outcome')))
+EXTERNAL_LATENCY = REGISTRY.register(Histogram(
+    'kisansarthi_external_call_duration_seconds', 'Model inference, LLM and weather call latency, by kind.',
+    ('kind', 'name')))
+
+
+@contextmanager
+def timed(kind, name):
+    """
+    Time a block of model inference ('model'), LLM ('llm') or weather ('weather') work.
+        with timed('llm', 'crop_suggestion'):
+            response = agent.execute(task)
+    """
+    outcome = 'ok'
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        outcome = 'error'
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        EXTERNAL_LATENCY.observe(elapsed, kind=kind, name=name)
+        EXTERNAL_CALLS.inc(kind=kind, name=name, outcome=outcome)
+
+
+def observe_query(route, operation, sql, args, elapsed):
+    """Record one SQLite statement and log it if it crossed the slow-query threshold."""
+    DB_QUERIES.inc(route=route, operation=operation)
+    DB_LATENCY.observe(elapsed, route=route, operation=operation)
+    if SLOW_QUERY_MS and elapsed * 1000.0 >= SLOW_QUERY_MS:
+        SLOW_QUERIES.inc(route=route)
+        slow_query_logger.warning("Slow query (%.1f ms) in %s: %s | args=%r",
+                                  elapsed * 1000.0, route, ' '.join(sql.split()), args)
+
+
+def observe_request(route, method, status, elapsed):
+    HTTP_REQUESTS.inc(route=route, method=method, status=status)
+    HTTP_LATENCY.observe(elapsed, route=route, method=method)
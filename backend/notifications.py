@@ -0,0 +1,65 @@
+"""
+In-process wake-ups for requests waiting on background work.
+
+A request that wants to block until something happens registers a waiter under a key, then
+checks the current state and waits; whoever finishes the work calls notify(key), which wakes
+exactly the requests registered under that key. Registering before the check means a notify
+that lands in between is never missed.
+
+Waiters only hear about work finished in their own process. Callers should recheck the
+database every so often so work completed by another worker is still picked up.
+"""
+import os
+import threading
+from contextlib import contextmanager
+
+# Requests allowed to block at once per worker; each one holds a server thread while it waits
+MAX_WAITERS = int(os.environ.get('NOTIFY_MAX_WAITERS', '64'))
+
+
+class NotificationRegistry:
+    def __init__(self, max_waiters=MAX_WAITERS):
+        self.max_waiters = max_waiters
+        self._waiters = {}  # key -> set of threading.Event
+        self._count = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def waiter(self, key):
+        """
+        Yields an Event that is set when `key` is notified, or None if max_waiters requests are
+        already waiting (the caller should answer immediately instead of blocking).
+        """
+        event = threading.Event()
+        with self._lock:
+            if self._count >= self.max_waiters:
+                event = None
+            else:
+                self._waiters.setdefault(key, set()).add(event)
+                self._count += 1
+        try:
+            yield event
+        finally:
+            if event is not None:
+                with self._lock:
+                    waiters = self._waiters.get(key)
+                    waiters.discard(event)
+                    if not waiters:
+                        del self._waiters[key]
+                    self._count -= 1
+
+    def notify(self, key):
+        """Wake every request waiting on `key`. Returns how many were woken."""
+        with self._lock:
+            waiters = list(self._waiters.get(key, ()))
+        for event in waiters:
+            event.set()
+        return len(waiters)
+
+    def waiting(self):
+        with self._lock:
+            return self._count
+
+
+# Keyed by diagnosis_logs.id; notified when a log leaves 'pending'
+diagnosis_done = NotificationRegistry()
@@ -0,0 +1,174 @@
+"""
+Precomputed crop suggestions and fertilizer recommendations.
+
+Both depend only on a land's latest clean NPK reading, the crop planted on it and the weather,
+yet used to be computed from scratch (weather API, model, Gemini) on every GET. Now the ingest
+path submits each land that received a new NPK reading; the land is debounced for
+PRECOMPUTE_DEBOUNCE_SECONDS so a burst of readings (a sensor catching up, a lab report) costs one
+computation, though never deferred more than PRECOMPUTE_MAX_DELAY_SECONDS. A background thread
+(one per worker) then computes both recommendations and upserts them into `recommendations`,
+one row per land and type, with the reading they were based on and the full API response.
+
+Sensors report every minute or so, and consecutive readings rarely differ by more than noise, so
+a row stays fresh while N, P, K and pH are each within RECOMMENDATION_DRIFT_FRACTION of the
+reading it was based on, the planted crop (fertilizer) is the same and it is younger than
+RECOMMENDATION_MAX_AGE_SECONDS, as the weather moves on. The ingest path only submits a land
+whose stored rows that reading would make stale, so a steady sensor costs one computation per
+max age rather than one per reading. The GET routes serve a fresh row; otherwise they compute in
+the request as before and store the result, so readings that arrive without a precompute (the
+line-protocol gateway runs in its own process) are only computed once as well.
+"""
+import os
+import time
+import logging
+import threading
+
+# --- Configuration ---
+# '0' leaves computing to the GET routes (and their cache), e.g. to save LLM calls for lands nobody opens
+PRECOMPUTE_RECOMMENDATIONS = os.environ.get('PRECOMPUTE_RECOMMENDATIONS', '1') == '1'
+PRECOMPUTE_DEBOUNCE_SECONDS = float(os.environ.get('PRECOMPUTE_DEBOUNCE_SECONDS', '30'))
+PRECOMPUTE_MAX_DELAY_SECONDS = float(os.environ.get('PRECOMPUTE_MAX_DELAY_SECONDS', '300'))
+RECOMMENDATION_MAX_AGE_SECONDS = int(os.environ.get('RECOMMENDATION_MAX_AGE_SECONDS', str(6 * 3600)))
+# Relative change in N, P, K or pH from the basis reading that makes a stored row stale
+RECOMMENDATION_DRIFT_FRACTION = float(os.environ.get('RECOMMENDATION_DRIFT_FRACTION', '0.05'))
+
+CROP_SUGGESTION = 'crop_suggestion'
+FERTILIZER = 'fertilizer'
+
+logger = logging.getLogger('kisansarthi.precompute')
+
+# Values the recommendations are computed from
+DRIFT_PARAMETERS = ('nitrogen_value', 'phosphorus_value', 'potassium_value', 'ph_value')
+
+# `recent` is 1 while the row is younger than the max age passed as the first parameter; the
+# basis_* columns are the reading it was computed from (NULL if that reading is gone)
+STORED_COLUMNS = """
+    r.recommendation_type, r.based_on_reading_id, r.related_crop_id,
+    r.updated_at >= datetime('now', ?) AS recent, b.id AS basis_id,
+    b.nitrogen_value AS basis_nitrogen_value, b.phosphorus_value AS basis_phosphorus_value,
+    b.potassium_value AS basis_potassium_value, b.ph_value AS basis_ph_value
+"""
+
+STORED_SQL = f"""
+    SELECT {STORED_COLUMNS}, r.payload
+    FROM recommendations r
+    LEFT JOIN soil_readings b ON b.id = r.based_on_reading_id
+    WHERE r.land_id = ? AND r.recommendation_type = ? AND r.based_on_reading_id IS NOT NULL
+"""
+
+# Both types for one land, without the payload (the ingest path's check)
+LAND_STORED_SQL = f"""
+    SELECT {STORED_COLUMNS}
+    FROM recommendations r
+    LEFT JOIN soil_readings b ON b.id = r.based_on_reading_id
+    WHERE r.land_id = ? AND r.based_on_reading_id IS NOT NULL
+"""
+
+# Replaces the land's previous row of the same type, which becomes unread again
+UPSERT_SQL = """
+    INSERT INTO recommendations (user_id, land_id, recommendation_type, title, details, reasoning,
+                                 related_crop_id, severity, based_on_reading_id, payload)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (land_id, recommendation_type) WHERE based_on_reading_id IS NOT NULL DO UPDATE SET
+        user_id = excluded.user_id, title = excluded.title, details = excluded.details,
+        reasoning = excluded.reasoning, related_crop_id = excluded.related_crop_id,
+        severity = excluded.severity, based_on_reading_id = excluded.based_on_reading_id,
+        payload = excluded.payload, is_read = 0, is_archived = 0,
+        recommendation_date = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
+"""
+
+
+def drifted(stored, reading):
+    """Whether any of N, P, K or pH moved more than RECOMMENDATION_DRIFT_FRACTION from the stored row's basis reading."""
+    for column in DRIFT_PARAMETERS:
+        basis, value = stored['basis_' + column], reading.get(column)
+        if basis is None or value is None:
+            if basis is not value:
+                return True
+        elif abs(float(value) - float(basis)) > RECOMMENDATION_DRIFT_FRACTION * abs(float(basis)):
+            return True
+    return False
+
+
+def needs_refresh(stored, reading):
+    """Whether a stored row (STORED_COLUMNS) is missing, too old or no longer matches the reading's values."""
+    return not (stored and reading and stored['recent'] and stored['basis_id'] is not None
+                and not drifted(stored, reading))
+
+
+def is_fresh(stored, latest_reading):
+    """Whether a STORED_SQL row still answers for the land's current reading and crop."""
+    return (not needs_refresh(stored, latest_reading)
+            and stored['related_crop_id'] == latest_reading.get('crop_id'))
+
+
+def feed_fields(rec_type, payload):
+    """(title, details, reasoning, severity) shown for the stored row in the recommendations feed."""
+    if rec_type == CROP_SUGGESTION:
+        best = payload['suggestions'][0]
+        return (f"Suggested crop: {best['crop']['crop_name']}", best['crop']['description'] or '',
+                best['reasoning'], None)
+    best = payload['recommendations'][0]
+    return best['title'], best['details'] or '', best['reasoning'], best['severity']
+
+
+class Precomputer:
+    """Debounces lands submitted by the ingest path and recomputes them on a background thread."""
+
+    def __init__(self, compute):
+        self.compute = compute  # compute(land_id)
+        self._due = {}  # land_id -> (first submitted, run at), time.monotonic()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._pid = None
+
+    def submit(self, land_id):
+        now = time.monotonic()
+        with self._cond:
+            first = self._due[land_id][0] if land_id in self._due else now
+            self._due[land_id] = (first, min(now + PRECOMPUTE_DEBOUNCE_SECONDS, first + PRECOMPUTE_MAX_DELAY_SECONDS))
+            # Threads do not survive a fork, so each worker starts its own on first use
+            if self._thread is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='recommendation-precompute', daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def pending(self):
+        with self._cond:
+            return len(self._due)
+
+    def _take_due(self, everything=False):
+        now = time.monotonic()
+        ready = [land_id for land_id, (_, run_at) in self._due.items() if everything or run_at <= now]
+        for land_id in ready:
+            del self._due[land_id]
+        return ready
+
+    def _run(self):
+        while True:
+            with self._cond:
+                ready = self._take_due()
+                while not ready:
+                    next_run = min((run_at for _, run_at in self._due.values()), default=None)
+                    self._cond.wait(None if next_run is None else max(0.0, next_run - time.monotonic()))
+                    ready = self._take_due()
+            self._compute_all(ready)
+
+    def flush(self):
+        """Compute every submitted land now, without waiting out the debounce. Returns how many."""
+        with self._cond:
+            ready = self._take_due(everything=True)
+        self._compute_all(ready)
+        return len(ready)
+
+    def _compute_all(self, land_ids):
+        start = time.perf_counter()
+        for land_id in land_ids:
+            try:
+                self.compute(land_id)
+            except Exception:
+                logger.exception("Precomputing recommendations for land %s failed", land_id)
+        if land_ids:
+            logger.debug("Precomputed recommendations for %d lands in %.1f ms",
+                         len(land_ids), (time.perf_counter() - start) * 1000)
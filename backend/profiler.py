@@ -0,0 +1,107 @@
+import io
+import os
+import sys
+import time
+import pstats
+import cProfile
+import threading
+import collections
+
+# --- Configuration ---
+PROFILE_DIR = os.environ.get('PROFILE_DIR', 'profiles')
+MAX_SAMPLE_SECONDS = 120
+MIN_INTERVAL_SECONDS = 0.001
+
+# Only one sampling session per worker at a time; overlapping samplers would skew each other
+_sampling_lock = threading.Lock()
+
+
+class ProfilerBusy(Exception):
+    pass
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+def sample_stacks(seconds, interval=0.01, include_idle=False):
+    """
+    Sample every Python thread in this process for `seconds`, once per `interval`,
+    and return the stacks in collapsed format ("root;child;leaf count" per line),
+    which flamegraph.pl, speedscope and inferno read directly.
+
+    Runs in the calling thread; the sampler's own stack is excluded.
+    """
+    seconds = max(0.0, min(float(seconds), MAX_SAMPLE_SECONDS))
+    interval = max(MIN_INTERVAL_SECONDS, float(interval))
+    if not _sampling_lock.acquire(blocking=False):
+        raise ProfilerBusy("A sampling profile is already running in this worker.")
+    try:
+        me = threading.get_ident()
+        names = {}
+        counts = collections.Counter()
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            frames = sys._current_frames()
+            if len(names) != len(frames):
+                names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in frames.items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                if not include_idle and _is_idle(stack):
+                    continue
+                stack.append(names.get(ident, f"thread-{ident}"))
+                counts[';'.join(reversed(stack))] += 1
+            del frames
+            time.sleep(interval)
+    finally:
+        _sampling_lock.release()
+    return ''.join(f"{stack} {count}\n" for stack, count in counts.most_common())
+
+
+# Leaf functions that mean a thread is parked rather than doing work
+_IDLE_LEAVES = ('threading.py:wait', 'selectors.py:select', 'socketserver.py:serve_forever',
+                'queue.py:get', 'socket.py:accept', 'threading.py:_wait_for_tstate_lock')
+
+
+def _is_idle(stack):
+    return bool(stack) and stack[0] in _IDLE_LEAVES
+
+
+def start_request_profile():
+    profile = cProfile.Profile()
+    profile.enable()
+    return profile
+
+
+def finish_request_profile(profile, endpoint):
+    """
+    Stop a per-request cProfile capture and save it under PROFILE_DIR as a .prof file
+    (loadable by pstats, snakeviz or `python -m pstats`). Returns the file name.
+    """
+    profile.disable()
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    name = f"{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}-{endpoint or 'unmatched'}-{time.perf_counter_ns() % 1000000}.prof"
+    profile.dump_stats(os.path.join(PROFILE_DIR, name))
+    return name
+
+
+def profile_path(name):
+    """Resolve a saved profile name to a path inside PROFILE_DIR, or None if it is not one of ours."""
+    if os.path.basename(name) != name or not name.endswith('.prof'):
+        return None
+    path = os.path.join(PROFILE_DIR, name)
+    return path if os.path.isfile(path) else None
+
+
+def profile_summary(path, limit=40):
+    """Human-readable top functions by cumulative time for a saved profile."""
+    out = io.StringIO()
+    stats = pstats.Stats(path, stream=out)
+    stats.strip_dirs().sort_stats('cumulative').print_stats(limit)
+    return out.getvalue()
@@ -0,0 +1,148 @@
+"""
+Bearer tokens and password hashing.
+
+Tokens are HMAC-SHA256 signed and laid out like an HS256 JWT (base64url header.payload.signature)
+with the claims {"sub": user id, "typ": "access" | "refresh", "iat", "exp"}. Access tokens
+authenticate API calls for ACCESS_TOKEN_TTL_SECONDS; refresh tokens are only accepted by
+POST /auth/refresh and last REFRESH_TOKEN_TTL_SECONDS.
+
+Verification never touches the database. Tokens verified recently are kept in a small LRU, so a
+client's repeat requests skip the HMAC and JSON decode and only have their cached expiry checked.
+
+Password hashes are deliberately slow, so hashing runs on a small bounded thread pool: a burst of
+logins queues for PASSWORD_HASH_WORKERS threads instead of taking every request thread's CPU,
+and requests that cannot get a slot within PASSWORD_HASH_WAIT_SECONDS are refused (503).
+"""
+import os
+import json
+import time
+import hmac
+import base64
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+# --- Configuration ---
+ACCESS_TOKEN_TTL_SECONDS = int(os.environ.get('ACCESS_TOKEN_TTL_SECONDS', '900'))
+REFRESH_TOKEN_TTL_SECONDS = int(os.environ.get('REFRESH_TOKEN_TTL_SECONDS', str(30 * 24 * 3600)))
+TOKEN_CACHE_SIZE = int(os.environ.get('TOKEN_CACHE_SIZE', '4096'))
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', '2'))
+# Hash jobs allowed to wait for a worker before new ones are refused
+PASSWORD_HASH_QUEUE = int(os.environ.get('PASSWORD_HASH_QUEUE', '32'))
+PASSWORD_HASH_WAIT_SECONDS = float(os.environ.get('PASSWORD_HASH_WAIT_SECONDS', '5'))
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=')
+
+
+def _b64decode(data):
+    return base64.urlsafe_b64decode(data + b'=' * (-len(data) % 4))
+
+
+_HEADER = _b64encode(json.dumps({"alg": "HS256", "typ": "JWT"}, separators=(',', ':')).encode())
+
+
+class TokenSigner:
+    """Issues and verifies signed tokens for one secret key."""
+
+    def __init__(self, secret_key, cache_size=TOKEN_CACHE_SIZE):
+        self._key = secret_key.encode('utf-8')
+        self._cache_size = cache_size
+        self._verified = OrderedDict()  # token -> (user_id, typ, exp)
+        self._lock = threading.Lock()
+
+    def _sign(self, signing_input):
+        return _b64encode(hmac.new(self._key, signing_input, hashlib.sha256).digest())
+
+    def issue(self, user_id, typ='access'):
+        now = int(time.time())
+        ttl = ACCESS_TOKEN_TTL_SECONDS if typ == 'access' else REFRESH_TOKEN_TTL_SECONDS
+        claims = {"sub": user_id, "typ": typ, "iat": now, "exp": now + ttl}
+        signing_input = _HEADER + b'.' + _b64encode(json.dumps(claims, separators=(',', ':')).encode())
+        return (signing_input + b'.' + self._sign(signing_input)).decode('ascii')
+
+    def issue_pair(self, user_id):
+        """Response fields for a successful login, registration or refresh."""
+        return {
+            "token": self.issue(user_id, 'access'),
+            "refresh_token": self.issue(user_id, 'refresh'),
+            "token_type": "Bearer",
+            "expires_in": ACCESS_TOKEN_TTL_SECONDS,
+        }
+
+    def verify(self, token, typ='access'):
+        """User id for a valid, unexpired token of the given type, else None."""
+        now = time.time()
+        with self._lock:
+            cached = self._verified.get(token)
+            if cached is not None:
+                self._verified.move_to_end(token)
+        if cached is None:
+            cached = self._decode(token)
+            if cached is None:
+                return None
+            with self._lock:
+                self._verified[token] = cached
+                if len(self._verified) > self._cache_size:
+                    self._verified.popitem(last=False)
+        user_id, token_typ, exp = cached
+        if token_typ != typ or exp <= now:
+            return None
+        return user_id
+
+    def _decode(self, token):
+        try:
+            signing_input, signature = token.encode('ascii').rsplit(b'.', 1)
+            header, payload = signing_input.split(b'.')
+        except (UnicodeEncodeError, ValueError):
+            return None
+        if header != _HEADER or not hmac.compare_digest(signature, self._sign(signing_input)):
+            return None
+        try:
+            claims = json.loads(_b64decode(payload))
+            return int(claims['sub']), claims['typ'], claims['exp']
+        except (ValueError, KeyError, TypeError):
+            return None
+
+
+class PoolBusy(Exception):
+    """No password hashing slot became free within PASSWORD_HASH_WAIT_SECONDS."""
+
+
+_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix='password-hash')
+_slots = threading.BoundedSemaphore(PASSWORD_HASH_WORKERS + PASSWORD_HASH_QUEUE)
+_dummy_hash = None
+
+
+def _run_bounded(fn, *args):
+    if not _slots.acquire(timeout=PASSWORD_HASH_WAIT_SECONDS):
+        raise PoolBusy()
+    try:
+        future = _executor.submit(fn, *args)
+    except BaseException:
+        _slots.release()
+        raise
+    future.add_done_callback(lambda _: _slots.release())
+    return future.result()
+
+
+def hash_password(password):
+    return _run_bounded(generate_password_hash, password)
+
+
+def check_password(password_hash, password):
+    """
+    True if the password matches. A missing hash (unknown user) is checked against a dummy hash,
+    so the response time does not reveal which phone numbers are registered.
+    """
+    global _dummy_hash
+    if password_hash is None:
+        if _dummy_hash is None:
+            _dummy_hash = generate_password_hash('not-a-real-password')
+        _run_bounded(check_password_hash, _dummy_hash, password)
+        return False
+    return _run_bounded(check_password_hash, password_hash, password)
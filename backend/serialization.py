@@ -0,0 +1,94 @@
+"""
+Fast path from SQLite rows to response bytes.
+
+query_db fetches plain tuples and builds each row dict once from column names read a single
+time per cursor, instead of a Python row_factory call per row that walks cursor.description.
+Pages that are serialized straight back out (soil readings) can skip the dicts entirely and
+go from tuples to columns. JSON is encoded with orjson when it is installed, producing the
+same output as Flask's default provider (sorted keys, RFC 822 dates).
+"""
+import datetime
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Last (description, names) pair seen by column_names. Rows of one cursor share the same
+# description object, so consecutive calls hit this without rebuilding the names.
+_last_columns = (None, ())
+
+
+def column_names(cursor):
+    """Column names of the cursor's current result set, cached for its lifetime."""
+    global _last_columns
+    description = cursor.description
+    cached = _last_columns
+    if cached[0] is description:
+        return cached[1]
+    names = tuple(col[0] for col in description) if description else ()
+    _last_columns = (description, names)
+    return names
+
+
+def dict_factory(cursor, row):
+    """sqlite3 row_factory for code that iterates get_db() cursors directly."""
+    return dict(zip(column_names(cursor), row))
+
+
+def rows_to_dicts(names, rows):
+    return [dict(zip(names, row)) for row in rows]
+
+
+def rows_to_columns(names, rows):
+    """{column: [values...]} from a list of tuples without building a dict per row."""
+    if not rows:
+        return {name: [] for name in names}
+    return {name: list(values) for name, values in zip(names, zip(*rows))}
+
+
+_DAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+_MONTHS = ('', 'Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')
+
+
+def http_date(value):
+    """Same output as werkzeug.http.http_date (naive values are UTC) without the email.utils round trip."""
+    if isinstance(value, datetime.datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(datetime.timezone.utc)
+        hour, minute, second = value.hour, value.minute, value.second
+    else:
+        hour = minute = second = 0
+    return (f"{_DAYS[value.weekday()]}, {value.day:02d} {_MONTHS[value.month]} {value.year:04d} "
+            f"{hour:02d}:{minute:02d}:{second:02d} GMT")
+
+
+def _orjson_default(value):
+    # Dates are passed through to us so they keep Flask's HTTP-date format instead of orjson's ISO 8601
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return http_date(value)
+    return DefaultJSONProvider.default(value)
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider that encodes with orjson when available, otherwise behaves as the default."""
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs.get('indent'):
+            return super().dumps(obj, **kwargs)
+        return self.dumpb(obj).decode('utf-8')
+
+    def dumpb(self, obj):
+        """Serialize straight to UTF-8 bytes."""
+        if orjson is None:
+            return super().dumps(obj, separators=(',', ':')).encode('utf-8')
+        return orjson.dumps(obj, default=_orjson_default,
+                            option=orjson.OPT_SORT_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS)
+
+    def response(self, *args, **kwargs):
+        if orjson is None or (self.compact is None and self._app.debug) or self.compact is False:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self.dumpb(obj) + b'\n', mimetype=self.mimetype)
@@ -0,0 +1,119 @@
+"""
+Production launcher.
+
+Loads the Flask app, the ML models and the reference catalogs once in the Gunicorn master,
+freezes them out of the garbage collector and then forks workers, so every worker shares
+those pages copy-on-write instead of unpickling its own copy on first request.
+
+    python serve.py --workers 4 --threads 8          # WSGI (gthread workers)
+    python serve.py --asgi --workers 4               # ASGI (needs uvicorn-worker, see asgi.py)
+
+Database setup is a separate one-off step:
+    python create_db.py --seed
+"""
+import os
+import gc
+import sys
+import time
+import argparse
+import logging
+import importlib.util
+
+from gunicorn.app.base import BaseApplication
+
+logger = logging.getLogger('kisansarthi.serve')
+
+
+def preload(asgi=False):
+    """
+    Import and warm everything workers need. Returns (application, [(stage, seconds), ...]).
+    Each stage is timed so slow cold starts can be attributed.
+    """
+    timings = []
+
+    def stage(name, fn):
+        start = time.perf_counter()
+        result = fn()
+        timings.append((name, time.perf_counter() - start))
+        return result
+
+    flask_app = stage('import app', lambda: __import__('app'))
+    if not os.path.exists(flask_app.app.config['DATABASE']):
+        sys.exit(f"Database file '{flask_app.app.config['DATABASE']}' not found. Run `python create_db.py --seed` first.")
+
+    from agents import crop_suggestion, fertilizer_recommender
+    stage('load crop model', crop_suggestion.load_model)
+    stage('load fertilizer model', fertilizer_recommender.load_model)
+    stage('load reference catalogs', flask_app.load_reference_catalogs)
+
+    application = flask_app.app
+    if asgi:
+        application = stage('import asgi', lambda: __import__('asgi')).application
+
+    # Move everything loaded so far out of the GC's tracked generations; otherwise the
+    # first collection in each worker writes to these objects and un-shares their pages
+    stage('gc freeze', lambda: (gc.collect(), gc.freeze()))
+    return application, timings
+
+
+def report_startup(timings, total):
+    lines = [f"  {name:<26} {seconds * 1000:8.1f} ms" for name, seconds in timings]
+    logger.warning("Startup breakdown (master, before fork):\n%s\n  %-26s %8.1f ms",
+                   '\n'.join(lines), 'total', total * 1000)
+
+
+class PreloadedApplication(BaseApplication):
+    def __init__(self, application, options):
+        self.application = application
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            if key in self.cfg.settings and value is not None:
+                self.cfg.set(key, value)
+
+    def load(self):
+        return self.application
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the KisanSarthi API under Gunicorn with a preloaded app.")
+    parser.add_argument('--bind', default=os.environ.get('BIND', f"{os.environ.get('HOST', '0.0.0.0')}:{os.environ.get('PORT', '5000')}"))
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('WEB_WORKERS', os.cpu_count() or 2)))
+    parser.add_argument('--threads', type=int, default=int(os.environ.get('WEB_THREADS', '8')),
+                        help="Threads per worker (WSGI mode)")
+    parser.add_argument('--asgi', action='store_true', help="Serve asgi.application with uvicorn workers")
+    parser.add_argument('--worker-connections', type=int, default=int(os.environ.get('WEB_WORKER_CONNECTIONS', '4000')),
+                        help="Max concurrent connections per worker")
+    parser.add_argument('--timeout', type=int, default=int(os.environ.get('WEB_TIMEOUT', '120')))
+    parser.add_argument('--max-requests', type=int, default=int(os.environ.get('WEB_MAX_REQUESTS', '0')),
+                        help="Recycle a worker after this many requests (0 = never)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    start = time.perf_counter()
+    application, timings = preload(asgi=args.asgi)
+    report_startup(timings, time.perf_counter() - start)
+
+    options = {
+        'bind': args.bind,
+        'workers': args.workers,
+        'timeout': args.timeout,
+        'max_requests': args.max_requests,
+        'worker_connections': args.worker_connections,
+        'preload_app': True,
+    }
+    if args.asgi:
+        # uvicorn's built-in uvicorn.workers is deprecated in favour of the uvicorn-worker package
+        if importlib.util.find_spec('uvicorn_worker') is None:
+            sys.exit("--asgi needs the uvicorn-worker package: pip install uvicorn-worker")
+        options['worker_class'] = 'uvicorn_worker.UvicornWorker'
+    else:
+        options['worker_class'] = 'gthread'
+        options['threads'] = args.threads
+    PreloadedApplication(application, options).run()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,194 @@
+"""
+Single-flight coalescing for expensive, identical concurrent requests.
+
+Opening the crop-suggestion screen on two phones, or an app retry while the first request is
+still running, sends the same recommendation request twice; each would fetch the weather, run
+the model and call Gemini. Callers wrap the expensive part in `group.do(key, fn)`: the first
+request for a key runs fn, and every request arriving with the same key while it runs waits for
+that result (or that exception) instead of computing its own. Keys name everything the result
+depends on, e.g. ('crop-suggestions', land_id, reading_id), so a new reading starts a new flight.
+
+Within a worker this is an in-memory table of in-flight calls, for threads (`do`) and for the
+ASGI event loop (`ado`). Setting SINGLEFLIGHT_LOCK_DIR extends it across worker processes on
+one host: the leader also holds an flock on a per-key file while it computes and leaves the
+JSON result next to it for SINGLEFLIGHT_RESULT_SECONDS, so a leader in another worker that was
+blocked on the lock picks that result up instead of computing again. Results must be JSON
+serialisable for that. Without fcntl (Windows) only in-worker coalescing is done.
+"""
+import os
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+import metrics
+
+# --- Configuration ---
+# Directory for cross-worker lock and result files; empty keeps coalescing within each worker
+SINGLEFLIGHT_LOCK_DIR = os.environ.get('SINGLEFLIGHT_LOCK_DIR', '')
+# How long a finished result is handed to requests from other workers that waited on its lock
+SINGLEFLIGHT_RESULT_SECONDS = float(os.environ.get('SINGLEFLIGHT_RESULT_SECONDS', '30'))
+
+logger = logging.getLogger('kisansarthi.singleflight')
+
+FLIGHTS = metrics.REGISTRY.register(metrics.Counter(
+    'kisansarthi_singleflight_total',
+    'Coalesced computations, by group and outcome (computed, coalesced, shared across workers).',
+    ('group', 'outcome')))
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self, name, lock_dir=SINGLEFLIGHT_LOCK_DIR, result_seconds=SINGLEFLIGHT_RESULT_SECONDS):
+        self.name = name
+        if lock_dir and fcntl is None:
+            logger.warning("fcntl is unavailable; %s is coalesced within each worker only", name)
+            lock_dir = ''
+        if lock_dir:
+            os.makedirs(lock_dir, exist_ok=True)
+        self.lock_dir = lock_dir
+        self.result_seconds = result_seconds
+        self._calls = {}   # key -> _Call, threads
+        self._tasks = {}   # key -> asyncio.Task, event loop
+        self._lock = threading.Lock()
+        self._last_purge = 0.0
+
+    def do(self, key, fn):
+        """Result of fn(), shared with every other thread that asks for `key` while it runs."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            FLIGHTS.inc(group=self.name, outcome='coalesced')
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._across_workers(key, fn)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    async def ado(self, key, coro_fn):
+        """Like do() for the event loop: the coroutine from coro_fn() runs once per key at a time."""
+        task = self._tasks.get(key)
+        if task is None:
+            task = self._tasks[key] = asyncio.ensure_future(self._lead_async(key, coro_fn))
+            task.add_done_callback(lambda _: self._tasks.pop(key, None))
+        else:
+            FLIGHTS.inc(group=self.name, outcome='coalesced')
+        # Shielded so a client that disconnects does not cancel the work others are waiting on
+        return await asyncio.shield(task)
+
+    def _across_workers(self, key, fn):
+        if not self.lock_dir:
+            FLIGHTS.inc(group=self.name, outcome='computed')
+            return fn()
+        base = self._path(key)
+        with open(base + '.lock', 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                os.utime(base + '.lock')
+                shared = self._shared_result(base)
+                if shared is not None:
+                    return shared
+                FLIGHTS.inc(group=self.name, outcome='computed')
+                result = fn()
+                self._store_result(base, result)
+                return result
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    async def _lead_async(self, key, coro_fn):
+        if not self.lock_dir:
+            FLIGHTS.inc(group=self.name, outcome='computed')
+            return await coro_fn()
+        base = self._path(key)
+        loop = asyncio.get_running_loop()
+        with open(base + '.lock', 'a') as lock_file:
+            # flock blocks, so wait for the other worker's computation on the thread pool
+            await loop.run_in_executor(None, fcntl.flock, lock_file, fcntl.LOCK_EX)
+            try:
+                os.utime(base + '.lock')
+                shared = self._shared_result(base)
+                if shared is not None:
+                    return shared
+                FLIGHTS.inc(group=self.name, outcome='computed')
+                result = await coro_fn()
+                self._store_result(base, result)
+                return result
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _path(self, key):
+        digest = hashlib.sha1(repr(key).encode()).hexdigest()
+        return os.path.join(self.lock_dir, f"{self.name}-{digest}")
+
+    def _shared_result(self, base):
+        """The result another worker stored for this key within result_seconds, else None."""
+        try:
+            with open(base + '.json', 'rb') as f:
+                stored = json.loads(f.read())
+        except (OSError, ValueError):
+            return None
+        if time.time() - stored.get('stored_at', 0) > self.result_seconds:
+            return None
+        FLIGHTS.inc(group=self.name, outcome='shared')
+        return stored['result']
+
+    def _store_result(self, base, result):
+        try:
+            body = json.dumps({'stored_at': time.time(), 'result': result})
+        except (TypeError, ValueError):
+            return
+        tmp_path = f"{base}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(body)
+        os.replace(tmp_path, base + '.json')
+        self._purge()
+
+    def _purge(self):
+        """Remove this group's lock and result files untouched for 10 minutes, at most once a minute."""
+        if time.monotonic() - self._last_purge < 60:
+            return
+        self._last_purge = time.monotonic()
+        cutoff = time.time() - max(600, self.result_seconds)
+        try:
+            names = os.listdir(self.lock_dir)
+        except OSError:
+            return
+        for name in names:
+            if not name.startswith(self.name + '-'):
+                continue
+            path = os.path.join(self.lock_dir, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
+
+
+crop_suggestions = SingleFlight('crop-suggestions')
+fertilizer_recommendations = SingleFlight('fertilizer-recommendations')
@@ -0,0 +1,60 @@
+"""
+Resetting a device's anomaly baseline in one worker resets it in every worker.
+
+Run from backend/:  python -m pytest tests
+"""
+import io
+import os
+import sqlite3
+import tempfile
+import unittest
+import contextlib
+
+from benchmarks import seed
+from serialization import dict_factory
+import anomaly
+
+
+class ForgetDeviceAcrossWorkersTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        db_file = os.path.join(self.tmp.name, 'anomaly.db')
+        with contextlib.redirect_stdout(io.StringIO()):
+            seed.seed(db_file, users=1, farms_per_user=1, lands_per_farm=1, readings=10)
+        self.conn = sqlite3.connect(db_file)
+        self.conn.row_factory = dict_factory
+        self.device_id = self.conn.execute("SELECT id FROM hardware_devices LIMIT 1").fetchone()['id']
+
+    def tearDown(self):
+        self.conn.close()
+        self.tmp.cleanup()
+
+    def stored_count(self):
+        row = self.conn.execute("SELECT count FROM sensor_detector_state WHERE device_id = ? AND parameter = 'ph_value'",
+                                (self.device_id,)).fetchone()
+        return row and row['count']
+
+    def test_other_worker_drops_state_and_does_not_write_it_back(self):
+        resetting, other = anomaly.AnomalyDetector(), anomaly.AnomalyDetector()
+        for _ in range(30):
+            other.observe(self.conn, self.device_id, {'ph_value': 6.5})
+        other.checkpoint(self.conn)
+        self.assertEqual(self.stored_count(), 30)
+
+        resetting.forget_device(self.conn, self.device_id)
+        self.assertIsNone(self.stored_count())
+
+        # The other worker keeps learning until its checkpoint, which must not undo the reset
+        other.observe(self.conn, self.device_id, {'ph_value': 6.5})
+        other.checkpoint(self.conn)
+        self.assertIsNone(self.stored_count())
+
+        # ...and reloads the device from scratch afterwards
+        other.observe(self.conn, self.device_id, {'ph_value': 6.5})
+        other.checkpoint(self.conn)
+        self.assertEqual(self.stored_count(), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
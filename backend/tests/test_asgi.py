@@ -0,0 +1,139 @@
+"""
+Flask routes that fall through the ASGI entry point run concurrently, not one at a time, and
+the live soil-reading stream is served on the event loop without holding a thread.
+
+Run from backend/:  python -m pytest tests
+"""
+import io
+import os
+import time
+import sqlite3
+import asyncio
+import datetime
+import tempfile
+import unittest
+import contextlib
+
+from benchmarks import seed, stubs
+
+os.environ.setdefault('SECRET_KEY', 'test-only-secret-key')
+
+stubs.install()
+
+import app as flask_app
+import asgi
+import live
+
+
+def http_scope(path, headers=()):
+    return {'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+            'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': b'',
+            'root_path': '', 'headers': list(headers), 'client': ('127.0.0.1', 1), 'server': ('127.0.0.1', 80)}
+
+
+async def call(scope_path):
+    """Drive asgi.application with one GET request; returns (status, body)."""
+    scope = http_scope(scope_path)
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    await asgi.application(scope, receive, send)
+    return messages[0]['status'], b''.join(m.get('body', b'') for m in messages[1:])
+
+
+class FallThroughConcurrencyTest(unittest.TestCase):
+
+    def test_two_slow_flask_requests_overlap(self):
+        view = flask_app.app.view_functions['prometheus_metrics']
+
+        def slow_view():
+            time.sleep(0.5)
+            return view()
+        flask_app.app.view_functions['prometheus_metrics'] = slow_view
+        self.addCleanup(flask_app.app.view_functions.__setitem__, 'prometheus_metrics', view)
+
+        async def both():
+            return await asyncio.gather(call('/metrics'), call('/metrics'))
+
+        start = time.perf_counter()
+        results = asyncio.run(both())
+        elapsed = time.perf_counter() - start
+
+        self.assertEqual([status for status, _ in results], [200, 200])
+        self.assertLess(elapsed, 0.9)  # one after the other would take 1.0 s
+
+
+class NativeStreamTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_file = os.path.join(self.tmp.name, 'asgi.db')
+        with contextlib.redirect_stdout(io.StringIO()):
+            dataset = seed.seed(self.db_file, users=1, farms_per_user=1, lands_per_farm=1, readings=20)
+        flask_app.app.config['DATABASE'] = self.db_file
+        self.land_id, self.farm_id, self.user_id = dataset['lands'][0]
+
+    def tearDown(self):
+        flask_app.alerts.engine.flush()  # queued alerts write to this database
+        self.tmp.cleanup()
+
+    def insert_reading(self, nitrogen):
+        conn = sqlite3.connect(self.db_file)
+        with conn:
+            device_id = conn.execute("SELECT id FROM hardware_devices WHERE assigned_land_id = ?",
+                                     (self.land_id,)).fetchone()[0]
+            cursor = conn.execute(
+                "INSERT INTO soil_readings (device_id, land_id, farm_id, timestamp, nitrogen_value) VALUES (?, ?, ?, ?, ?)",
+                (device_id, self.land_id, self.farm_id, datetime.datetime.utcnow().isoformat(), nitrogen))
+        conn.close()
+        return cursor.lastrowid
+
+    def test_open_stream_does_not_block_flask_routes_and_ends_on_disconnect(self):
+        token = flask_app.tokens.issue(self.user_id)
+        scope = http_scope(f'/api/v1/lands/{self.land_id}/soil-readings/stream',
+                           [(b'authorization', f'Bearer {token}'.encode())])
+
+        async def scenario():
+            incoming = asyncio.Queue()
+            await incoming.put({'type': 'http.request', 'body': b'', 'more_body': False})
+            sent = []
+            got_reading = asyncio.Event()
+
+            async def send(message):
+                sent.append(message)
+                if b'event: reading' in message.get('body', b''):
+                    got_reading.set()
+
+            stream = asyncio.ensure_future(asgi.application(scope, incoming.get, send))
+            while not sent:
+                await asyncio.sleep(0.01)
+
+            start = time.perf_counter()
+            status, _ = await asyncio.wait_for(call('/metrics'), 2)
+            metrics_seconds = time.perf_counter() - start
+
+            other_worker_id = await asyncio.to_thread(self.insert_reading, 80.0)
+            local_id = await asyncio.to_thread(self.insert_reading, 81.0)
+            live.soil_readings.publish(self.land_id, local_id)
+            await asyncio.wait_for(got_reading.wait(), 2)
+
+            await incoming.put({'type': 'http.disconnect'})
+            await asyncio.wait_for(stream, 2)
+            return sent, status, metrics_seconds, [other_worker_id, local_id]
+
+        sent, status, metrics_seconds, expected_ids = asyncio.run(scenario())
+        self.assertEqual(sent[0]['status'], 200)
+        self.assertEqual(status, 200)
+        self.assertLess(metrics_seconds, 1.0)
+        body = b''.join(m.get('body', b'') for m in sent[1:]).decode()
+        self.assertEqual([int(line[4:]) for line in body.splitlines() if line.startswith('id: ')], expected_ids)
+        self.assertEqual(live.soil_readings.stats()['subscribers'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+"""
+Long-polling a diagnosis log returns once its job has ended, even when the job stored nothing.
+
+Run from backend/:  python -m pytest tests
+"""
+import io
+import os
+import time
+import sqlite3
+import tempfile
+import threading
+import unittest
+import contextlib
+
+from benchmarks import seed, stubs
+
+os.environ.setdefault('SECRET_KEY', 'test-only-secret-key')
+
+stubs.install()
+
+import app as flask_app
+import notifications
+
+
+class DiagnosisWaitTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        db_file = os.path.join(self.tmp.name, 'diagnosis.db')
+        with contextlib.redirect_stdout(io.StringIO()):
+            dataset = seed.seed(db_file, users=1, farms_per_user=1, lands_per_farm=1, readings=10)
+        flask_app.app.config['DATABASE'] = db_file
+        self.user_id = dataset['users'][0]
+        conn = sqlite3.connect(db_file)
+        with conn:
+            self.log_id = conn.execute(
+                "INSERT INTO diagnosis_logs (user_id, image_storage_url, processing_status) VALUES (?, ?, 'pending')",
+                (self.user_id, 'dummy_storage/test.jpg')).lastrowid
+        conn.close()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_job_that_gave_up_ends_the_wait(self):
+        # A job that could not store its result (e.g. the database stayed locked) still notifies
+        timer = threading.Timer(0.2, notifications.diagnosis_done.notify, (self.log_id,))
+        timer.start()
+        self.addCleanup(timer.cancel)
+
+        token = flask_app.tokens.issue(self.user_id)
+        start = time.perf_counter()
+        response = flask_app.app.test_client().get(f'/api/v1/diagnostics/logs/{self.log_id}?wait=3',
+                                                   headers={'Authorization': f'Bearer {token}'})
+        elapsed = time.perf_counter() - start
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['processing_status'], 'pending')
+        self.assertLess(elapsed, 1.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
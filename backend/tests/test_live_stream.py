@@ -0,0 +1,76 @@
+"""
+Live soil-reading streams deliver readings committed by other workers, not just this worker's hub.
+
+Run from backend/:  python -m pytest tests
+"""
+import io
+import os
+import sqlite3
+import datetime
+import tempfile
+import unittest
+import contextlib
+
+from benchmarks import seed, stubs
+
+os.environ.setdefault('SECRET_KEY', 'test-only-secret-key')
+
+stubs.install()
+
+import app as flask_app
+import live
+
+
+class LiveStreamTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_file = os.path.join(self.tmp.name, 'live.db')
+        with contextlib.redirect_stdout(io.StringIO()):
+            dataset = seed.seed(self.db_file, users=1, farms_per_user=1, lands_per_farm=1, readings=20)
+        flask_app.app.config['DATABASE'] = self.db_file
+        self.land_id, self.farm_id, self.user_id = dataset['lands'][0]
+        self.client = flask_app.app.test_client()
+
+    def tearDown(self):
+        flask_app.alerts.engine.flush()  # queued alerts write to this database
+        self.tmp.cleanup()
+
+    def insert_reading(self, nitrogen):
+        """A reading committed by another worker: in the database, never on this worker's hub."""
+        conn = sqlite3.connect(self.db_file)
+        with conn:
+            device_id = conn.execute("SELECT id FROM hardware_devices WHERE assigned_land_id = ?",
+                                     (self.land_id,)).fetchone()[0]
+            cursor = conn.execute(
+                "INSERT INTO soil_readings (device_id, land_id, farm_id, timestamp, nitrogen_value) VALUES (?, ?, ?, ?, ?)",
+                (device_id, self.land_id, self.farm_id, datetime.datetime.utcnow().isoformat(), nitrogen))
+        conn.close()
+        return cursor.lastrowid
+
+    def reading_ids(self, chunks, count):
+        ids = []
+        for chunk in chunks:
+            ids += [int(line[4:]) for line in chunk.decode().splitlines() if line.startswith('id: ')]
+            if len(ids) >= count:
+                return ids
+        return ids
+
+    def test_local_wake_up_does_not_skip_lower_id_from_another_worker(self):
+        token = flask_app.tokens.issue(self.user_id)
+        response = self.client.get(f'/api/v1/lands/{self.land_id}/soil-readings/stream',
+                                   headers={'Authorization': f'Bearer {token}'}, buffered=False)
+        chunks = response.response
+        self.assertEqual(next(chunks), b'retry: 5000\n\n')
+
+        other_worker_id = self.insert_reading(80.0)      # id N, only in the database
+        local_id = self.insert_reading(81.0)             # id N+1 ...
+        live.soil_readings.publish(self.land_id, local_id)  # ... published on this worker's hub
+        try:
+            self.assertEqual(self.reading_ids(chunks, 2), [other_worker_id, local_id])
+        finally:
+            response.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+"""
+Precomputed recommendations follow material N/P/K changes, not every sensor reading.
+
+Run from backend/:  python -m pytest tests
+"""
+import io
+import os
+import datetime
+import tempfile
+import unittest
+import contextlib
+
+from benchmarks import seed, stubs
+
+os.environ.setdefault('SECRET_KEY', 'test-only-secret-key')
+
+stubs.install()
+
+import app as flask_app
+import agents.provider
+
+
+class PrecomputeDriftTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        db_file = os.path.join(self.tmp.name, 'precompute.db')
+        with contextlib.redirect_stdout(io.StringIO()):
+            dataset = seed.seed(db_file, users=1, farms_per_user=1, lands_per_farm=1, readings=50)
+        flask_app.app.config['DATABASE'] = db_file
+        self.land_id, _, self.user_id = dataset['lands'][0]
+        self.client = flask_app.app.test_client()
+        self.clock = datetime.datetime.utcnow()
+
+        self.llm_calls = 0
+        execute = agents.provider.Agent.execute
+
+        def counting(agent, task, data=None):
+            self.llm_calls += 1
+            return execute(agent, task, data)
+        agents.provider.Agent.execute = counting
+        self.addCleanup(setattr, agents.provider.Agent, 'execute', execute)
+
+    def tearDown(self):
+        flask_app.alerts.engine.flush()  # queued alerts write to this database
+        self.tmp.cleanup()
+
+    def ingest(self, nitrogen, phosphorus, potassium, ph=6.5):
+        """Post one sensor reading, then run the precompute the way its thread would."""
+        self.clock += datetime.timedelta(seconds=60)
+        response = self.client.post('/api/v1/ingest/soil-readings', json={
+            'hardware_unique_id': seed.hardware_id_for_land(self.land_id),
+            'timestamp': self.clock.isoformat(),
+            'nitrogen_value': nitrogen, 'phosphorus_value': phosphorus,
+            'potassium_value': potassium, 'ph_value': ph, 'moisture_value': 40.0,
+        }, headers={'X-Device-Key': seed.device_key_for_land(self.land_id)})
+        self.assertEqual(response.status_code, 202, response.get_data(as_text=True))
+        return flask_app.recommendation_precomputer.flush()
+
+    def get(self, what):
+        token = flask_app.tokens.issue(self.user_id)
+        response = self.client.get(f'/api/v1/lands/{self.land_id}/{what}',
+                                   headers={'Authorization': f'Bearer {token}'})
+        self.assertEqual(response.status_code, 200, response.get_data(as_text=True))
+        return response.get_json()
+
+    def test_near_identical_readings_compute_once_and_are_served_stored(self):
+        self.assertEqual(self.ingest(100.0, 40.0, 60.0), 1)
+        computed = self.llm_calls
+        self.assertEqual(computed, 2)  # one crop suggestion, one fertilizer recommendation
+
+        first_ts = self.get('crop-suggestions')['based_on_reading_ts']
+        for nitrogen, phosphorus, potassium in ((100.4, 40.1, 59.8), (99.7, 39.9, 60.2), (100.2, 40.0, 60.1)):
+            self.assertEqual(self.ingest(nitrogen, phosphorus, potassium), 0)
+
+        self.assertEqual(self.get('crop-suggestions')['based_on_reading_ts'], first_ts)
+        self.get('fertilizer-recommendations')
+        self.assertEqual(self.llm_calls, computed)
+
+    def test_material_change_recomputes(self):
+        self.ingest(100.0, 40.0, 60.0)
+        computed = self.llm_calls
+        self.assertEqual(self.ingest(130.0, 40.0, 60.0), 1)
+        self.assertEqual(self.llm_calls, computed + 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
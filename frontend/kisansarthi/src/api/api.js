@@ -13,6 +13,8 @@ const BASE_URL = Platform.OS === 'android'
 
 // Key for storing the auth token in AsyncStorage
 const AUTH_TOKEN_KEY = 'userAuthToken';
+// Long-lived token used to get a new access token when the current one expires
+const REFRESH_TOKEN_KEY = 'userRefreshToken';
 
 // --- Helper Functions ---
 
@@ -50,12 +52,49 @@ const storeAuthToken = async (token) => {
  */
 const removeAuthToken = async () => {
     try {
-        await AsyncStorage.removeItem(AUTH_TOKEN_KEY);
+        await AsyncStorage.multiRemove([AUTH_TOKEN_KEY, REFRESH_TOKEN_KEY]);
     } catch (e) {
         console.error('Failed to remove auth token from storage', e);
     }
 };
 
+/**
+ * Stores the refresh token returned by login, register and refresh.
+ * @param {string} token The refresh token to store.
+ * @returns {Promise<void>}
+ */
+const storeRefreshToken = async (token) => {
+    try {
+        await AsyncStorage.setItem(REFRESH_TOKEN_KEY, token);
+    } catch (e) {
+        console.error('Failed to save refresh token to storage', e);
+    }
+};
+
+/**
+ * Exchanges the stored refresh token for a new access token.
+ * @returns {Promise<string|null>} The new access token, or null if the session cannot be refreshed.
+ */
+const refreshAccessToken = async () => {
+    try {
+        const refreshToken = await AsyncStorage.getItem(REFRESH_TOKEN_KEY);
+        if (!refreshToken) return null;
+        const response = await fetch(`${BASE_URL}/auth/refresh`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json', 'Accept': 'application/json' },
+            body: JSON.stringify({ refresh_token: refreshToken }),
+        });
+        if (!response.ok) return null;
+        const tokens = await response.json();
+        await storeAuthToken(tokens.token);
+        await storeRefreshToken(tokens.refresh_token);
+        return tokens.token;
+    } catch (e) {
+        console.error('Failed to refresh auth token', e);
+        return null;
+    }
+};
+
 
 /**
  * Generic request handler.
@@ -64,10 +103,12 @@ const removeAuthToken = async () => {
  * @param {object|null} [body=null] - Request body for POST/PUT.
  * @param {boolean} [isAuthenticated=true] - Whether to include the Auth header.
  * @param {boolean} [isFormData=false] - Whether the body is FormData.
+ * @param {boolean} [isRetry=false] - Set on the replay after a token refresh.
+ * @param {object} [extraHeaders={}] - Additional request headers (e.g. Idempotency-Key).
  * @returns {Promise<any>} - The JSON response body.
  * @throws {Error} - Throws an error on network issues or non-OK responses.
  */
-const request = async (endpoint, method = 'GET', body = null, isAuthenticated = true, isFormData = false) => {
+const request = async (endpoint, method = 'GET', body = null, isAuthenticated = true, isFormData = false, isRetry = false, extraHeaders = {}) => {
     const url = `${BASE_URL}${endpoint}`;
     const headers = new Headers();
 
@@ -75,6 +116,7 @@ const request = async (endpoint, method = 'GET', body = null, isAuthenticated =
          headers.append('Content-Type', 'application/json');
     }
     headers.append('Accept', 'application/json');
+    Object.entries(extraHeaders).forEach(([name, value]) => headers.append(name, value));
 
 
     if (isAuthenticated) {
@@ -102,6 +144,14 @@ const request = async (endpoint, method = 'GET', body = null, isAuthenticated =
     try {
         const response = await fetch(url, config);
 
+        // Access tokens are short-lived: refresh once and replay the request
+        if (response.status === 401 && isAuthenticated && !isRetry) {
+            const newToken = await refreshAccessToken();
+            if (newToken) {
+                return request(endpoint, method, body, isAuthenticated, isFormData, true, extraHeaders);
+            }
+        }
+
         // Handle No Content response
         if (response.status === 204) {
             return null; // Or {}, depending on how you want to handle it
@@ -130,9 +180,13 @@ const request = async (endpoint, method = 'GET', body = null, isAuthenticated =
 // --- API Endpoint Functions ---
 
 // 1. Authentication
-export const register = (userData) => request('/auth/register', 'POST', userData, false); // No auth needed
-export const login = (credentials) => request('/auth/login', 'POST', credentials, false); // No auth needed
-// Note: We'll call storeAuthToken after successful login/register in the UI logic
+const keepRefreshToken = async (response) => {
+    if (response?.refresh_token) await storeRefreshToken(response.refresh_token);
+    return response;
+};
+export const register = (userData) => request('/auth/register', 'POST', userData, false).then(keepRefreshToken); // No auth needed
+export const login = (credentials) => request('/auth/login', 'POST', credentials, false).then(keepRefreshToken); // No auth needed
+// Note: We'll call storeAuthToken after successful login/register in the UI logic (the refresh token is stored here)
 
 // Utility to be called on logout
 export const logout = removeAuthToken;
@@ -170,6 +224,7 @@ export const getHardwareDevice = (deviceId) => request(`/hardware_devices/${devi
 export const updateHardwareDevice = (deviceId, deviceData) => request(`/hardware_devices/${deviceId}`, 'PUT', deviceData);
 export const updateDeviceAssignment = (deviceId, assignmentData) => request(`/hardware_devices/${deviceId}/assignment`, 'PUT', assignmentData);
 export const deleteHardwareDevice = (deviceId) => request(`/hardware_devices/${deviceId}`, 'DELETE');
+export const rotateDeviceApiKey = (deviceId) => request(`/hardware_devices/${deviceId}/api-key`, 'POST');
 
 // 6. Soil Readings
 export const getSoilReadings = (landId, params = {}) => {
@@ -179,6 +234,79 @@ export const getSoilReadings = (landId, params = {}) => {
 };
 // Note: Ingest endpoint is called by the device, not the mobile app.
 
+const STREAM_RECONNECT_MS = 3000;
+
+/**
+ * Subscribes to new readings for a land over Server-Sent Events.
+ * React Native has no EventSource, so the stream is read incrementally through XHR progress
+ * events. The server ends each stream after a few minutes; we reconnect with Last-Event-ID so
+ * nothing in between is missed.
+ * @param {number} landId
+ * @param {object} handlers - { onReading(reading), onResync() } - onResync means updates were
+ *   dropped and the caller should refetch.
+ * @returns {function} Call to unsubscribe.
+ */
+export const subscribeToSoilReadings = (landId, { onReading, onResync } = {}) => {
+    let xhr = null;
+    let lastEventId = null;
+    let reconnectTimer = null;
+    let closed = false;
+
+    const dispatch = (block) => {
+        let event = 'message';
+        let data = '';
+        block.split('\n').forEach((line) => {
+            if (line.startsWith('event: ')) event = line.slice(7);
+            else if (line.startsWith('id: ')) lastEventId = line.slice(4);
+            else if (line.startsWith('data: ')) data += line.slice(6);
+        });
+        if (event === 'reading' && onReading) {
+            try { onReading(JSON.parse(data)); } catch (e) { console.warn('Bad stream event:', e); }
+        } else if (event === 'resync' && onResync) {
+            onResync();
+        }
+    };
+
+    const connect = async (isRetry = false) => {
+        if (closed) return;
+        const token = await getAuthToken();
+        if (closed) return;
+        let seen = 0;
+        let buffer = '';
+        xhr = new XMLHttpRequest();
+        xhr.open('GET', `${BASE_URL}/lands/${landId}/soil-readings/stream`);
+        xhr.setRequestHeader('Accept', 'text/event-stream');
+        if (token) xhr.setRequestHeader('Authorization', `Bearer ${token}`);
+        if (lastEventId) xhr.setRequestHeader('Last-Event-ID', lastEventId);
+        xhr.onprogress = () => {
+            buffer += xhr.responseText.slice(seen);
+            seen = xhr.responseText.length;
+            let end;
+            while ((end = buffer.indexOf('\n\n')) !== -1) {
+                dispatch(buffer.slice(0, end));
+                buffer = buffer.slice(end + 2);
+            }
+        };
+        xhr.onloadend = async () => {
+            if (closed) return;
+            if (xhr.status === 401 && !isRetry && await refreshAccessToken()) {
+                connect(true);
+                return;
+            }
+            if (xhr.status === 401 || xhr.status === 403 || xhr.status === 404) return; // Not recoverable
+            reconnectTimer = setTimeout(() => connect(), STREAM_RECONNECT_MS);
+        };
+        xhr.send();
+    };
+
+    connect();
+    return () => {
+        closed = true;
+        clearTimeout(reconnectTimer);
+        if (xhr) xhr.abort();
+    };
+};
+
 // 7. Plantings
 export const startPlanting = (landId, plantingData) => request(`/lands/${landId}/plantings`, 'POST', plantingData);
 export const getPlanting = (plantingId) => request(`/plantings/${plantingId}`, 'GET');
@@ -210,7 +338,8 @@ export const scanPlantDisease = (imageData, landId = null, plantingId = null) =>
     console.log("Yayyyyyyy")
     return request('/diagnostics/scan-plant', 'POST', formData, true, true);
 };
-export const getDiagnosisLog = (logId) => request(`/diagnostics/logs/${logId}`, 'GET');
+// With `wait` (seconds) the server holds a pending log until it completes or the wait runs out
+export const getDiagnosisLog = (logId, wait = 0) => request(`/diagnostics/logs/${logId}${wait ? `?wait=${wait}` : ''}`, 'GET');
 export const listDiagnosisLogs = (params = {}) => {
      // params could be { limit, offset, land_id }
     const query = new URLSearchParams(params).toString();
@@ -227,6 +356,17 @@ export const getRecommendations = (params = {}) => {
 };
 export const updateRecommendationStatus = (recommendationId, statusData) => request(`/recommendations/${recommendationId}/status`, 'PUT', statusData);
 
+// Screen aggregates (one round trip per screen)
+export const getDashboard = (params = {}) => {
+    // params could be { farms_limit, courses_limit, alerts_limit }
+    const query = new URLSearchParams(params).toString();
+    return request(`/dashboard?${query}`, 'GET');
+};
+export const getLandOverview = (landId, params = {}) => {
+    const query = new URLSearchParams(params).toString();
+    return request(`/lands/${landId}/overview?${query}`, 'GET');
+};
+
 // 10. Reference Data
 export const listCrops = () => request('/crops', 'GET', null, false); // Assuming public or auth optional
 export const listDiseases = () => request('/diseases', 'GET', null, false); // Assuming public or auth optional
@@ -238,10 +378,26 @@ export const saveManualSoilReading = (landId, readingData) => {
         ...readingData,
         timestamp: new Date().toISOString(),
     };
-    // Assuming a new dedicated endpoint for clarity
-    return request(`/lands/${landId}/manual-soil-reading`, 'POST', dataWithTimestamp, true);
-    // Alternative (if modifying ingest):
-    // return request(`/ingest/soil-readings`, 'POST', { ...dataWithTimestamp, land_id: landId }, true); // Use user auth
+    // Stored with source 'manual'; out-of-range values are rejected with a 400.
+    // The key makes a resend of this same reading (e.g. after a dropped connection) a no-op.
+    const idempotencyKey = `manual-${landId}-${dataWithTimestamp.timestamp}`;
+    return request(`/lands/${landId}/manual-soil-reading`, 'POST', dataWithTimestamp, true, false, false,
+        { 'Idempotency-Key': idempotencyKey });
+};
+
+/**
+ * Imports a lab report CSV for a farm (all rows or none).
+ * @param {number} farmId
+ * @param {object} file - { uri, name } of the picked CSV file.
+ * Columns: land_id or land_name, timestamp, and any of ph_value/pH, nitrogen_value/Nitrogen, ...
+ */
+export const importSoilReadings = (farmId, file) => {
+    const formData = new FormData();
+    formData.append('file', { uri: file.uri, name: file.name || 'readings.csv', type: 'text/csv' });
+    // Uploading the same file again within a day replays the first import instead of duplicating it
+    const idempotencyKey = `import-${farmId}-${file.name || ''}-${file.size || ''}`;
+    return request(`/farms/${farmId}/soil-readings/import`, 'POST', formData, true, true, false,
+        { 'Idempotency-Key': idempotencyKey });
 };
 
 // --- Export Auth Helpers ---
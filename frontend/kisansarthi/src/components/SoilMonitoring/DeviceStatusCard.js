@@ -1,11 +1,16 @@
 import React from 'react';
 import { View, Text, StyleSheet } from 'react-native';
-import { Smartphone, Zap } from 'lucide-react-native'; // Example icons
+import { Smartphone, Zap, Activity } from 'lucide-react-native'; // Example icons
 import { COLORS } from '../../theme/colors';
 
 const DeviceStatusCard = ({ device }) => {
     const deviceName = device?.device_name || 'Unnamed Device';
     const hardwareId = device?.hardware_unique_id || 'N/A';
+    // Health stats come precomputed with the device (null until it has reported)
+    const hasHealth = device?.uptime_pct != null;
+    const health = hasHealth
+        ? `${device.uptime_pct}% uptime · ${device.readings_per_hour} readings/hr`
+        : 'No readings yet';
     // Add other relevant details like model, battery level if available
 
     return (
@@ -24,6 +29,14 @@ const DeviceStatusCard = ({ device }) => {
                      <Text style={styles.label}>Hardware ID</Text>
                      <Text style={styles.value}>{hardwareId}</Text>
                 </View>
+             </View>
+             <View style={styles.separator} />
+             <View style={styles.row}>
+                 <Activity size={18} color={COLORS.textMedium} style={styles.icon}/>
+                 <View style={styles.textContainer}>
+                     <Text style={styles.label}>Health</Text>
+                     <Text style={styles.value}>{health}</Text>
+                </View>
              </View>
               {/* Add more rows for battery, model etc. if needed */}
         </View>
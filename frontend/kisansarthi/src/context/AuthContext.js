@@ -50,7 +50,7 @@ export const AuthProvider = ({ children }) => {
             },
             logout: async () => {
                 try {
-                    await AsyncStorage.removeItem(AUTH_TOKEN_KEY);
+                    await api.logout(); // Clears the access and refresh tokens
                     setUserToken(null); // Update state
                 } catch (e) {
                     console.error('Failed to remove token on logout', e);
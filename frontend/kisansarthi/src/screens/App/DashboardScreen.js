@@ -41,23 +41,17 @@ const DashboardScreen = ({ navigation }) => {
     setError(null);
 
     try {
-      const [userRes, farmsRes, coursesRes] = await Promise.all([
-        api.getCurrentUser(),
-        api.listFarms(5),
-        api.getCourses(5) // Fetch courses
-      ]);
-
-      setUserData(userRes);
-      setFarms(farmsRes?.farms ?? []);
-      setCourses(coursesRes?.courses ?? []);  // Set the courses data
-      console.log(farmsRes);
-      if (farmsRes?.farms.length != 0) {
-        recommendationsRes = await api.getRecommendations({
-          type: "alert",
-          limit: 3,
-          is_read: false,
-        });
-        const allRecs = recommendationsRes?.recommendations ?? [];
+      const dashboardRes = await api.getDashboard({
+        farms_limit: 5,
+        courses_limit: 5,
+        alerts_limit: 3,
+      });
+
+      setUserData(dashboardRes?.user);
+      setFarms(dashboardRes?.farms ?? []);
+      setCourses(dashboardRes?.courses ?? []);  // Set the courses data
+      if (dashboardRes?.farms?.length) {
+        const allRecs = dashboardRes?.recommendations ?? [];
 
         const fetchedAlerts = allRecs.filter(
           (rec) =>
@@ -1,5 +1,5 @@
 // src/screens/App/DiseaseResultScreen.js
-import React, { useState, useEffect, useCallback } from 'react';
+import React, { useState, useEffect } from 'react';
 import {
     StyleSheet,
     View,
@@ -32,6 +32,9 @@ const formatFullDateTime = (isoString) => {
     } catch (e) { return 'Invalid Date'; }
 };
 
+// Seconds each long-poll request may wait server-side for the analysis to finish
+const LONG_POLL_SECONDS = 25;
+
 const DiseaseResultScreen = ({ navigation }) => {
     const route = useRoute();
     const logId = route.params?.logId ?? null;
@@ -39,67 +42,34 @@ const DiseaseResultScreen = ({ navigation }) => {
     const [logData, setLogData] = useState(null);
     const [isLoading, setIsLoading] = useState(true);
     const [error, setError] = useState(null);
-    const [pollIntervalId, setPollIntervalId] = useState(null);
-
-    const fetchData = useCallback(async () => {
+    // Long-poll for the result: each request returns as soon as the analysis finishes
+    // (or after the server's wait limit, in which case we simply ask again)
+    useEffect(() => {
         if (!logId) {
              setError("Diagnosis log ID not provided."); setIsLoading(false); return;
         }
-        // No need to set loading true on poll
-        // setIsLoading(true);
-        setError(null);
-
-        try {
-            const data = await api.getDiagnosisLog(logId);
-            setLogData(data);
-
-            // Stop polling if completed or failed
-            if (data.processing_status !== 'pending') {
-                 if(pollIntervalId) clearInterval(pollIntervalId);
-                 setPollIntervalId(null);
-                 setIsLoading(false); // Final state, stop loading indicator
-            } else {
-                 // Still pending, ensure loading indicator is shown
-                 setIsLoading(true);
+        let cancelled = false;
+
+        const waitForResult = async () => {
+            setError(null);
+            try {
+                let data = await api.getDiagnosisLog(logId);
+                while (!cancelled) {
+                    setLogData(data);
+                    if (data.processing_status !== 'pending') break;
+                    console.log("Waiting for diagnosis results...");
+                    data = await api.getDiagnosisLog(logId, LONG_POLL_SECONDS);
+                }
+            } catch (err) {
+                console.error("Failed to fetch diagnosis log:", err);
+                if (!cancelled) setError(err.message || "Failed to load diagnosis result.");
             }
+            if (!cancelled) setIsLoading(false); // Final state, stop loading indicator
+        };
 
-        } catch (err) {
-            console.error("Failed to fetch diagnosis log:", err);
-            setError(err.message || "Failed to load diagnosis result.");
-            setIsLoading(false); // Stop loading on error
-            if(pollIntervalId) clearInterval(pollIntervalId); // Stop polling on error
-            setPollIntervalId(null);
-        }
-    }, [logId, pollIntervalId]);
-
-    // Initial Fetch and Polling Logic
-    useEffect(() => {
-        if (logId) {
-            fetchData(); // Initial fetch
-
-            // Set up polling if status might be pending initially
-            const intervalId = setInterval(() => {
-                 setLogData(prevData => {
-                    // Only poll if the previous state was pending
-                    if (prevData?.processing_status === 'pending') {
-                        console.log("Polling for diagnosis results...");
-                        fetchData(); // Re-fetch data
-                    } else {
-                        // If status changed, clear interval from within
-                        clearInterval(intervalId);
-                        setPollIntervalId(null);
-                    }
-                    return prevData; // Return previous data while fetching
-                });
-            }, 5000); // Poll every 5 seconds
-
-            setPollIntervalId(intervalId); // Store interval ID
-
-            // Clear interval on component unmount
-            return () => {
-                if (intervalId) clearInterval(intervalId);
-            };
-        }
+        waitForResult();
+        // Stop waiting on unmount; an in-flight request just finishes unseen
+        return () => { cancelled = true; };
     }, [logId]); // Run only when logId changes
 
 
@@ -61,16 +61,12 @@ const LandDetailScreen = ({ navigation }) => {
       setError(null);
 
       try {
-        const [userRes, landRes, alertRes] = await Promise.all([
-          api.getCurrentUser(),
-          api.getLand(landId),
-          api.getRecommendations({ land_id: landId, limit: 3, type: "alert" }), // Fetch only alerts type for this section
-        ]);
+        // User, land and its alerts in one request
+        const overviewRes = await api.getLandOverview(landId, { alerts_limit: 3 });
 
-        setUserData(userRes);
-        setLandDetails(landRes);
-        setAlerts(alertRes?.recommendations ?? []);
-        console.log(alertRes);
+        setUserData(overviewRes?.user);
+        setLandDetails(overviewRes?.land);
+        setAlerts(overviewRes?.recommendations ?? []);
       } catch (err) {
         console.error("Failed to fetch land details:", err);
         setError(err.message || "Failed to load details. Please try again.");
@@ -120,9 +120,10 @@ const LinkDeviceScreen = ({ navigation }) => {
                 assigned_land_id: assignedLandId || null, // Send null if "None" selected
             };
             console.log("Registering device:", deviceData);
-            await api.registerHardwareDevice(deviceData);
+            const device = await api.registerHardwareDevice(deviceData);
 
-            Alert.alert("Success", "Device linked successfully!");
+            // The API key is only returned here; the device sends it as X-Device-Key
+            Alert.alert("Success", `Device linked successfully!\n\nDevice API key (shown only once, enter it on the device):\n${device.api_key}`);
             // Navigate back twice if coming from AddLand -> LinkDevice flow
             if (preSelectedLandId) {
                  // Find the FarmDetails route in the stack and go back there
@@ -68,6 +68,22 @@ const SoilMonitoringScreen = ({ navigation }) => {
     useEffect(() => { fetchData(true); }, [fetchData]); // Initial fetch
     useEffect(() => { if (isFocused) fetchData(false); }, [isFocused, fetchData]); // Refresh on focus
 
+    // Live readings while the screen is focused
+    useEffect(() => {
+        if (!isFocused || !landId) return undefined;
+        const unsubscribe = api.subscribeToSoilReadings(landId, {
+            onReading: (reading) => setLandDetails((prev) => {
+                if (!prev) return prev;
+                const current = prev.latest_soil_reading;
+                // Ignore readings older than the one already shown (e.g. replayed after a reconnect)
+                if (current && new Date(reading.timestamp) < new Date(current.timestamp)) return prev;
+                return { ...prev, latest_soil_reading: { ...current, ...reading } };
+            }),
+            onResync: () => fetchData(false),
+        });
+        return unsubscribe;
+    }, [isFocused, landId]); // eslint-disable-line react-hooks/exhaustive-deps
+
     const onRefresh = useCallback(() => { setRefreshing(true); }, []);
 
     // --- Action Handlers ---
@@ -20,61 +20,47 @@ import { useAuth } from '../../context/AuthContext';
 
 const LoginScreen = ({ navigation }) => {
     const [phoneNumber, setPhoneNumber] = useState('');
-    const [otp, setOtp] = useState('');
-    const [showOtpInput, setShowOtpInput] = useState(false);
+    const [password, setPassword] = useState('');
+    const [showPasswordInput, setShowPasswordInput] = useState(false);
     const [isLoading, setIsLoading] = useState(false);
     const [error, setError] = useState(null);
     const { login } = useAuth();
     // Optional: Store verification ID if needed by backend
     // const [verificationId, setVerificationId] = useState(null);
 
-    const otpInputRef = useRef(null); // To focus OTP input
+    const passwordInputRef = useRef(null); // To focus password input
 
     const handleGoToRegister = () => {
         navigation.navigate('Register');
     };
 
     const handleBackToPhoneInput = () => {
-        setShowOtpInput(false);
-        setOtp('');
+        setShowPasswordInput(false);
+        setPassword('');
         setError(null);
         // setVerificationId(null); // Reset if used
     };
 
-    const handleRequestOtp = async () => {
+    const handleContinue = () => {
         setError(null);
         if (!phoneNumber.trim() || !/^\+?[0-9\s-]{10,}$/.test(phoneNumber)) {
             setError('Please enter a valid phone number.');
             return;
         }
-        setIsLoading(true);
-        try {
-            console.log(`Requesting OTP for ${phoneNumber}`);
-            // const response = await api.requestOtp(phoneNumber);
-            // console.log('OTP Request response:', response); // Log backend response
-            // Assuming success if no error is thrown
-            // setVerificationId(response?.verificationId); // Store if backend sends it
-            setShowOtpInput(true);
-            // Optional: Focus OTP input after a short delay
-            setTimeout(() => otpInputRef.current?.focus(), 100);
-
-        } catch (err) {
-            console.error('OTP Request failed:', err);
-            setError(err.message || 'Failed to send OTP. Please try again.');
-        } finally {
-            setIsLoading(false);
-        }
+        setShowPasswordInput(true);
+        // Optional: Focus password input after a short delay
+        setTimeout(() => passwordInputRef.current?.focus(), 100);
     };
 
-    const handleVerifyOtp = async () => {
+    const handleLogin = async () => {
         setError(null);
-        if (!otp.trim() || otp.length < 4) { // Assuming OTP is at least 4 digits
-            setError('Please enter the received OTP code.');
+        if (!password) {
+            setError('Please enter your password.');
             return;
         }
         setIsLoading(true);
         try {
-            const response = await api.login({"email_or_phone":phoneNumber});
+            const response = await api.login({"email_or_phone":phoneNumber, "password":password});
             if (response && response.token) {
                 // ++ Use context login function ++
                 await login(response.token);
@@ -85,7 +71,7 @@ const LoginScreen = ({ navigation }) => {
                  setIsLoading(false); // Stop loading on error
             }
         } catch (err) {
-             // ... error handling ...
+             setError(err.status === 401 ? 'Incorrect phone number or password.' : (err.message || 'Login failed. Please try again.'));
              setIsLoading(false); // Stop loading on error
         }
     };
@@ -98,25 +84,25 @@ const LoginScreen = ({ navigation }) => {
                 keyboardVerticalOffset={Platform.OS === "ios" ? 0 : 20}
             >
                 <ScrollView contentContainerStyle={styles.scrollContent}>
-                    {/* Optional Back Button when showing OTP */}
-                    {showOtpInput && (
+                    {/* Back Button when showing the password step */}
+                    {showPasswordInput && (
                         <TouchableOpacity style={styles.backButton} onPress={handleBackToPhoneInput}>
                             <ArrowLeft size={24} color={COLORS.textDark} />
                         </TouchableOpacity>
                     )}
 
                     <Text style={styles.title}>
-                        {showOtpInput ? 'Enter OTP' : 'Welcome Back!'}
+                        {showPasswordInput ? 'Enter Password' : 'Welcome Back!'}
                     </Text>
                     <Text style={styles.subtitle}>
-                        {showOtpInput
-                            ? `We've sent an OTP to ${phoneNumber}. Please enter it below.`
+                        {showPasswordInput
+                            ? `Enter the password for ${phoneNumber}.`
                             : 'Login using your phone number to continue.'}
                     </Text>
 
                     <View style={styles.inputContainer}>
                         {/* Phone Number Input (Phase 1) */}
-                        {!showOtpInput && (
+                        {!showPasswordInput && (
                             <View style={styles.phoneInputWrapper}>
                                 <Phone size={20} color={COLORS.placeholder} style={styles.inputIcon} />
                                 <TextInput
@@ -132,18 +118,17 @@ const LoginScreen = ({ navigation }) => {
                             </View>
                         )}
 
-                        {/* OTP Input (Phase 2) */}
-                        {showOtpInput && (
+                        {/* Password Input (Phase 2) */}
+                        {showPasswordInput && (
                             <TextInput
-                                ref={otpInputRef}
+                                ref={passwordInputRef}
                                 style={styles.input}
-                                placeholder="Enter OTP"
+                                placeholder="Password"
                                 placeholderTextColor={COLORS.placeholder}
-                                value={otp}
-                                onChangeText={setOtp}
-                                keyboardType="number-pad"
-                                maxLength={6} // Assuming 6-digit OTP
-                                textContentType="oneTimeCode" // Helps with autofill OTP
+                                value={password}
+                                onChangeText={setPassword}
+                                secureTextEntry // Hides password input
+                                textContentType="password" // Helps with password managers
                             />
                         )}
                     </View>
@@ -151,30 +136,23 @@ const LoginScreen = ({ navigation }) => {
                     {/* Error Message Display */}
                     {error && <Text style={styles.errorText}>{error}</Text>}
 
-                    {/* Action Button (Send OTP / Verify OTP) */}
+                    {/* Action Button (Continue / Login) */}
                     <TouchableOpacity
                         style={[styles.button, isLoading && styles.buttonDisabled]}
-                        onPress={showOtpInput ? handleVerifyOtp : handleRequestOtp}
+                        onPress={showPasswordInput ? handleLogin : handleContinue}
                         disabled={isLoading}
                     >
                         {isLoading ? (
                             <ActivityIndicator size="small" color={COLORS.white} />
                         ) : (
                             <Text style={styles.buttonText}>
-                                {showOtpInput ? 'Verify OTP' : 'Send OTP'}
+                                {showPasswordInput ? 'Login' : 'Continue'}
                             </Text>
                         )}
                     </TouchableOpacity>
 
-                    {/* Optional: Resend OTP Link */}
-                    {showOtpInput && (
-                        <TouchableOpacity style={styles.resendContainer} onPress={handleRequestOtp} disabled={isLoading}>
-                             <Text style={styles.resendText}>Didn't receive code? Resend OTP</Text>
-                        </TouchableOpacity>
-                    )}
-
                      {/* Separator and Register Link */}
-                     {!showOtpInput && (
+                     {!showPasswordInput && (
                          <>
                             <Text style={styles.orText}>or</Text>
                             <View style={styles.registerContainer}>
@@ -254,7 +232,7 @@ const styles = StyleSheet.create({
         width: '100%',
     },
     phoneInput: {
-        // Specific styles if phone input needs different styling than OTP
+        // Specific styles if phone input needs different styling than the password input
         flex: 1, // Take remaining space in wrapper
         borderWidth: 0, // Remove border as it's on the wrapper
         paddingHorizontal: 0, // Remove padding as it's on the wrapper
@@ -310,14 +288,6 @@ const styles = StyleSheet.create({
         color: COLORS.primary,
         fontWeight: '600',
     },
-    resendContainer: {
-         marginTop: 20,
-         alignItems: 'center',
-     },
-     resendText: {
-         fontSize: 14,
-         color: COLORS.link,
-     },
 });
 
 export default LoginScreen;
\ No newline at end of file